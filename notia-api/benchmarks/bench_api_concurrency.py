@@ -0,0 +1,119 @@
+"""并发压测：/api/chat 生成期间 /api/tasks 的读取延迟
+
+用法（在 notia-api 目录下）：
+    python benchmarks/bench_api_concurrency.py --requests 200 --chat-seconds 3
+
+使用带人为延迟的模拟模型后端，在临时目录的数据库上运行，
+分别测量空闲时和聊天生成进行中时 /api/tasks 的延迟分布。
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "p50_ms": percentile(values, 50) * 1000,
+        "p99_ms": percentile(values, 99) * 1000,
+        "max_ms": max(values) * 1000,
+        "mean_ms": statistics.mean(values) * 1000,
+    }
+
+
+async def measure_tasks(client, count: int, concurrency: int) -> List[float]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.get("/api/tasks")
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one() for _ in range(count)))
+    return latencies
+
+
+async def run(args):
+    import httpx
+    import main
+
+    transport = httpx.ASGITransport(app=main.app)
+    # ASGITransport不触发lifespan，需要手动执行启动和关闭流程
+    async with main.lifespan(main.app), httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        # 等待后台模型加载完成，再预热数据库连接和模型
+        while True:
+            response = await client.get("/health/ready", params={"model": "true"})
+            if response.status_code == 200:
+                break
+            if response.json()["model"] == "failed":
+                raise RuntimeError("模型加载失败")
+            await asyncio.sleep(0.05)
+        await client.get("/api/tasks")
+        await client.post("/api/chat", json={"message": "warm up"})
+
+        idle = await measure_tasks(client, args.requests, args.concurrency)
+
+        chat = asyncio.create_task(client.post("/api/chat", json={"message": "benchmark"}, timeout=None))
+        await asyncio.sleep(0.05)
+        busy = await measure_tasks(client, args.requests, args.concurrency)
+        chat_still_running = not chat.done()
+        await chat
+
+    print(f"/api/tasks x{args.requests} (并发 {args.concurrency})")
+    for label, values in (("空闲", idle), ("生成中", busy)):
+        stats = summarize(values)
+        print(f"  {label:<6} p50={stats['p50_ms']:.2f}ms p99={stats['p99_ms']:.2f}ms "
+              f"max={stats['max_ms']:.2f}ms")
+    print(f"  测量结束时聊天仍在生成: {chat_still_running}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="每轮 /api/tasks 请求数")
+    parser.add_argument("--concurrency", type=int, default=20, help="并发请求数")
+    parser.add_argument("--chat-seconds", type=float, default=3.0, help="模拟一次生成耗时（秒）")
+    args = parser.parse_args()
+
+    # 数据库文件创建在临时目录中，需在导入应用模块之前设置，否则会使用当前目录下的notia.db
+    workdir = tempfile.mkdtemp(prefix="notia-bench-")
+    os.environ["NOTIA_DB_PATH"] = os.path.join(workdir, "notia.db")
+    os.environ["NOTIA_TENANT_DIR"] = os.path.join(workdir, "tenants")
+
+    from services.model_backends import StubBackend, register_backend
+    from services.model_service import MODEL_CONFIG
+
+    @register_backend
+    class SlowStubBackend(StubBackend):
+        """每次生成都阻塞指定时间的模拟后端"""
+        name = "slow_stub"
+
+        def generate_batch(self, prompts, max_new_tokens, json_schema=None):
+            time.sleep(args.chat_seconds)
+            return super().generate_batch(prompts, max_new_tokens, json_schema)
+
+    MODEL_CONFIG["backend"] = SlowStubBackend.name
+
+    try:
+        asyncio.run(run(args))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""数据库并发压测：邮件写入与API读取混合负载
+
+用法（在 notia-api 目录下）：
+    python benchmarks/bench_db_concurrency.py --writers 2 --readers 8 --seconds 10
+
+分别在两个临时数据库上运行同样的负载：
+    pooled  共享连接池 + WAL + 调优后的PRAGMA（当前实现）
+    legacy  每次查询新建sqlite3连接，默认回滚日志模式（改造前的行为）
+写线程模拟邮件入库，读线程模拟列表分页、统计和全文搜索请求。
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+READ_QUERIES = {
+    "list": (
+        "SELECT id, email_id, title, sender, received_time, category FROM emails "
+        "ORDER BY received_time DESC, id DESC LIMIT 50", ()
+    ),
+    "stats": ("SELECT scope, bucket, count FROM stats_counters WHERE scope IN ('emails', 'email_category')", ()),
+    "search": ("SELECT id, title FROM emails WHERE title LIKE ? ORDER BY received_time DESC LIMIT 20", ("%报告%",)),
+}
+
+INSERT_EMAIL = """
+INSERT INTO emails (email_id, title, sender, received_time, content, category, created_at)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def email_row(index: int) -> tuple:
+    now = datetime.now()
+    return (
+        f"bench-{index}-{random.getrandbits(32)}",
+        random.choice(["项目周报", "会议通知", "技术资讯", "季度报告"]) + f" #{index}",
+        f"sender{index % 50}@example.com",
+        (now - timedelta(minutes=index)).strftime('%Y-%m-%d %H:%M:%S.%f'),
+        "邮件正文 " * 100,
+        random.choice(["资讯类", "任务类"]),
+        now.strftime('%Y-%m-%d %H:%M:%S.%f'),
+    )
+
+
+def create_schema(db_path: str, pooled: bool):
+    from sqlalchemy import create_engine
+    from database.config import Base, get_engine
+    from database.fts import ensure_fts
+    from database.stats import ensure_stats
+    import database.models  # noqa: F401  注册ORM模型
+
+    engine = get_engine(db_path) if pooled else create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(bind=engine)
+    conn = engine.raw_connection()
+    try:
+        ensure_fts(conn)
+        ensure_stats(conn)
+    finally:
+        conn.close()
+    if not pooled:
+        engine.dispose()
+
+
+def make_db_utils(db_path: str, pooled: bool):
+    from database.db_utils import DatabaseUtils
+    from database.fts import register_functions
+
+    def connect():
+        conn = sqlite3.connect(db_path)
+        # 全文索引触发器需要的函数
+        register_functions(conn)
+        return conn
+
+    db_utils = DatabaseUtils(db_path)
+    if not pooled:
+        # 改造前：每次查询新建连接
+        db_utils.get_connection = connect
+    return db_utils
+
+
+def run_mode(name: str, pooled: bool, args) -> Dict[str, Dict[str, float]]:
+    workdir = tempfile.mkdtemp(prefix=f"notia-bench-{name}-")
+    db_path = os.path.join(workdir, "notia.db")
+    create_schema(db_path, pooled)
+    db_utils = make_db_utils(db_path, pooled)
+
+    for index in range(args.seed):
+        db_utils.execute_insert(INSERT_EMAIL, email_row(index))
+
+    latencies: Dict[str, List[float]] = {"write": [], **{key: [] for key in READ_QUERIES}}
+    errors: Dict[str, int] = {key: 0 for key in latencies}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.seconds
+    counter = iter(range(args.seed, 10 ** 9))
+
+    def record(kind: str, elapsed: float, failed: bool):
+        with lock:
+            if failed:
+                errors[kind] += 1
+            else:
+                latencies[kind].append(elapsed)
+
+    def writer():
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                db_utils.execute_insert(INSERT_EMAIL, email_row(next(counter)))
+                record("write", time.perf_counter() - start, False)
+            except sqlite3.OperationalError:
+                record("write", 0, True)
+
+    def reader():
+        while time.perf_counter() < deadline:
+            kind = random.choice(list(READ_QUERIES))
+            query, params = READ_QUERIES[kind]
+            start = time.perf_counter()
+            try:
+                db_utils.execute_query(query, params)
+                record(kind, time.perf_counter() - start, False)
+            except sqlite3.OperationalError:
+                record(kind, 0, True)
+
+    threads = [threading.Thread(target=writer) for _ in range(args.writers)]
+    threads += [threading.Thread(target=reader) for _ in range(args.readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    report = {}
+    for kind, values in latencies.items():
+        if not values:
+            continue
+        report[kind] = {
+            "ops_per_s": len(values) / args.seconds,
+            "p50_ms": percentile(values, 50) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+            "errors": errors[kind],
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="数据库读写混合并发压测")
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--seed", type=int, default=5000, help="预先写入的邮件数")
+    parser.add_argument("--mode", choices=["pooled", "legacy", "both"], default="both")
+    args = parser.parse_args()
+
+    modes = ["pooled", "legacy"] if args.mode == "both" else [args.mode]
+    for mode in modes:
+        report = run_mode(mode, mode == "pooled", args)
+        print(f"\n[{mode}] {args.writers} 写线程 / {args.readers} 读线程 / {args.seconds:.0f} 秒")
+        print(f"{'操作':<8}{'ops/s':>10}{'p50(ms)':>10}{'p99(ms)':>10}{'错误':>6}")
+        for kind, row in report.items():
+            print(f"{kind:<8}{row['ops_per_s']:>10.1f}{row['p50_ms']:>10.2f}{row['p99_ms']:>10.2f}{row['errors']:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+"""邮件入库压测
+
+用法（在 notia-api 目录下）：
+    python benchmarks/bench_ingestion.py --messages 500
+    python benchmarks/bench_ingestion.py --messages 500 --save-baseline
+
+启动本地IMAP服务器（benchmarks/fake_imap_server.py）并载入合成语料，
+使用stub模型后端排除推理耗时，依次测量：
+    process_new_emails  EmailService.process_new_emails 逐封处理
+    pipeline            EmailPipeline 流水线批量处理
+    api_sync            通过 /api/accounts 添加账户并等待调度器同步完成
+    api                 同步完成后各查询接口的延迟
+报告每秒处理的邮件数、p50/p99延迟和进程峰值内存，并与基线文件
+（默认 benchmarks/baseline.json）比较，任一指标退步超过 --tolerance
+（耗时类指标还需增加超过 --min-delta-ms）时以非零状态退出。基线与
+机器相关，更换机器后应重新生成。
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+from cryptography.fernet import Fernet
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from fake_imap_server import FakeIMAPServer
+from synthetic_corpus import generate_corpus
+
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+API_ENDPOINTS = {
+    "/api/emails": {"limit": 50},
+    "/api/emails?category": {"category": "任务类", "limit": 50},
+    "/api/tasks": {"limit": 50},
+    "/api/statistics": {},
+    # 两字词走二元组索引，三字以上走trigram索引
+    "/api/emails/search": {"q": "会议", "limit": 20},
+    "/api/emails/search?trigram": {"q": "会议室", "limit": 20},
+}
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def peak_rss_mb() -> Optional[float]:
+    """进程的峰值常驻内存（MB）"""
+    try:
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux单位为KB，macOS为字节
+        return peak / 1024 / (1024 if sys.platform == "darwin" else 1)
+    except ImportError:
+        pass
+    try:
+        import psutil
+
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / 1024 / 1024
+    except ImportError:
+        return None
+
+
+def latency_stats(samples: List[float]) -> Dict:
+    return {"p50_ms": percentile(samples, 50) * 1000, "p99_ms": percentile(samples, 99) * 1000}
+
+
+def median_result(rounds: List[Dict]) -> Dict:
+    """多轮结果逐项取中位数"""
+    return {key: statistics.median(result[key] for result in rounds) for key in rounds[0]}
+
+
+def start_server(corpus: List[bytes]) -> FakeIMAPServer:
+    server = FakeIMAPServer(corpus)
+    server.start()
+    return server
+
+
+def make_service(server: FakeIMAPServer, db_path: str, batch_size: int):
+    from database.config import get_engine
+    from database.models import create_tables
+    from services.email_service import EmailService
+    from services.imap_connection import IMAPConnectionManager
+
+    # 分类缓存等共享数据在主库中，邮件和任务写入租户库，两个库都要建表
+    create_tables()
+    create_tables(get_engine(db_path))
+    manager = IMAPConnectionManager(server.host, "bench@example.com", "bench", port=server.port, use_ssl=False)
+    return EmailService(server.host, "bench@example.com", "bench", batch_size=batch_size,
+                        connection_manager=manager, db_path=db_path)
+
+
+def bench_process_new_emails(corpus: List[bytes], db_path: str, batch_size: int) -> Dict:
+    server = start_server(corpus)
+    service = make_service(server, db_path, batch_size)
+    # 单封邮件从开始分类到保存完成的耗时；批量获取的耗时只体现在吞吐中
+    latencies = []
+    started = {}
+    classify, save = service.classify_email, service.save_email_to_db
+
+    def timed_classify(email_data):
+        started[email_data["email_id"]] = time.perf_counter()
+        return classify(email_data)
+
+    def timed_save(email_data):
+        save(email_data)
+        latencies.append(time.perf_counter() - started.pop(email_data["email_id"]))
+
+    service.classify_email = timed_classify
+    service.save_email_to_db = timed_save
+    try:
+        start = time.perf_counter()
+        processed = service.process_new_emails()
+        elapsed = time.perf_counter() - start
+    finally:
+        service.connection_manager.close()
+        server.stop()
+    result = {"messages": len(processed), "msgs_per_sec": len(processed) / elapsed}
+    if latencies:
+        result.update(latency_stats(latencies))
+    return result
+
+
+def bench_pipeline(corpus: List[bytes], db_path: str, batch_size: int) -> Dict:
+    from services.email_pipeline import EmailPipeline, PipelineJob
+
+    server = start_server(corpus)
+    service = make_service(server, db_path, batch_size)
+    # 每次批量写入的耗时
+    flushes = []
+    save_many = service.save_emails_to_db
+
+    def timed_save_many(emails):
+        start = time.perf_counter()
+        try:
+            return save_many(emails)
+        finally:
+            flushes.append(time.perf_counter() - start)
+
+    service.save_emails_to_db = timed_save_many
+    pipeline = EmailPipeline(service, parse_workers=2, model_concurrency=8)
+    job = PipelineJob()
+    try:
+        start = time.perf_counter()
+        pipeline.run(job)
+        elapsed = time.perf_counter() - start
+    finally:
+        service.connection_manager.close()
+        server.stop()
+    result = {"messages": job.saved, "msgs_per_sec": job.saved / elapsed}
+    if flushes:
+        result.update({f"flush_{key}": value for key, value in latency_stats(flushes).items()})
+    return result
+
+
+def bench_api(corpus: List[bytes], requests: int, timeout: float) -> Dict:
+    from fastapi.testclient import TestClient
+
+    import main
+
+    server = start_server(corpus)
+    results = {}
+    try:
+        with TestClient(main.app) as client:
+            start = time.perf_counter()
+            response = client.put("/api/accounts/bench", json={
+                "imap_server": server.host, "port": server.port, "use_ssl": False,
+                "email_addr": "bench@example.com", "password": "bench",
+                "rate_limit": 0, "max_per_sync": len(corpus), "poll_interval": 3600
+            })
+            response.raise_for_status()
+            # 添加账户后调度器立即开始同步
+            job = None
+            deadline = start + timeout
+            while time.perf_counter() < deadline:
+                accounts = client.get("/api/accounts").json()
+                sync = accounts[0].get("sync") if accounts else None
+                job = sync and sync.get("last_job")
+                if job and job["status"] in ("completed", "failed"):
+                    break
+                time.sleep(0.05)
+            elapsed = time.perf_counter() - start
+            if not job or job["status"] != "completed":
+                raise RuntimeError(f"账户同步未在{timeout}秒内完成: {job}")
+            results["api_sync"] = {"messages": job["saved"], "msgs_per_sec": job["saved"] / elapsed}
+
+            endpoints = {}
+            for name, params in API_ENDPOINTS.items():
+                path = name.split("?")[0]
+                samples = []
+                for _ in range(requests):
+                    begin = time.perf_counter()
+                    client.get(path, params=dict(params, account="bench")).raise_for_status()
+                    samples.append(time.perf_counter() - begin)
+                endpoints[name] = latency_stats(samples)
+            results["api"] = endpoints
+    finally:
+        server.stop()
+    return results
+
+
+def flatten(results: Dict, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        if key == "config":
+            continue
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not key == "messages":
+            flat[name] = float(value)
+    return flat
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float, min_delta_ms: float) -> List[str]:
+    """逐项与基线比较，返回退步的指标
+
+    几毫秒的接口延迟波动较大，耗时类指标的增量小于min_delta_ms时不算退步。
+    """
+    if baseline.get("config") != results.get("config"):
+        print("注意：基线的压测参数与本次不同，比较结果仅供参考")
+    current, previous = flatten(results), flatten(baseline)
+    regressions = []
+    print(f"\n{'指标':<40}{'基线':>12}{'本次':>12}{'变化':>10}")
+    for name, value in current.items():
+        if name not in previous or previous[name] == 0:
+            continue
+        before = previous[name]
+        change = (value - before) / before
+        # 吞吐越高越好，耗时和内存越低越好
+        worse = -change if name.endswith("msgs_per_sec") else change
+        flag = ""
+        if name.endswith("_ms") and value - before < min_delta_ms:
+            worse = 0.0
+        if worse > tolerance:
+            regressions.append(name)
+            flag = "  退步"
+        print(f"{name:<40}{before:>12.2f}{value:>12.2f}{change:>+10.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=500, help="语料中的邮件数")
+    parser.add_argument("--attachment-ratio", type=float, default=0.2, help="带附件邮件的比例")
+    parser.add_argument("--attachment-kb", type=int, default=200, help="附件的平均大小（KB）")
+    parser.add_argument("--chinese-ratio", type=float, default=0.7, help="中文邮件的比例")
+    parser.add_argument("--html-ratio", type=float, default=0.2, help="只有HTML正文的邮件比例")
+    parser.add_argument("--seed", type=int, default=42, help="语料随机种子")
+    parser.add_argument("--batch-size", type=int, default=100, help="每次FETCH的邮件数")
+    parser.add_argument("--repeat", type=int, default=3, help="入库阶段的重复轮数，结果取中位数")
+    parser.add_argument("--api-requests", type=int, default=100, help="每个查询接口的请求数")
+    parser.add_argument("--timeout", type=float, default=300, help="等待账户同步完成的最长时间（秒）")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="基线文件")
+    parser.add_argument("--save-baseline", action="store_true", help="把本次结果保存为基线")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的退步比例")
+    parser.add_argument("--min-delta-ms", type=float, default=10.0, help="耗时类指标低于该增量时不算退步")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="notia-bench-")
+    # 必须在导入应用模块之前设置：数据库放在临时目录，模型使用stub后端
+    os.environ["NOTIA_MODEL_BACKEND"] = "stub"
+    os.environ["NOTIA_DB_PATH"] = os.path.join(workdir, "notia.db")
+    os.environ["NOTIA_TENANT_DIR"] = os.path.join(workdir, "tenants")
+    os.environ.setdefault("NOTIA_SECRET_KEY", Fernet.generate_key().decode())
+
+    config = {key: getattr(args, key) for key in (
+        "messages", "attachment_ratio", "attachment_kb", "chinese_ratio", "html_ratio", "seed", "batch_size", "repeat"
+    )}
+    started = time.perf_counter()
+    corpus = generate_corpus(args.messages, args.attachment_ratio, args.chinese_ratio, args.html_ratio,
+                             attachment_kb=args.attachment_kb, seed=args.seed)
+    print(f"合成语料 {len(corpus)} 封，共 {sum(map(len, corpus)) / 1024 / 1024:.1f} MB，"
+          f"耗时 {time.perf_counter() - started:.1f}s，临时目录 {workdir}")
+
+    results = {"config": config}
+    # 每轮使用新的服务器和数据库，邮件都是未读的新邮件
+    results["process_new_emails"] = median_result([
+        bench_process_new_emails(corpus, os.path.join(workdir, f"process-{index}.db"), args.batch_size)
+        for index in range(args.repeat)
+    ])
+    results["pipeline"] = median_result([
+        bench_pipeline(corpus, os.path.join(workdir, f"pipeline-{index}.db"), args.batch_size)
+        for index in range(args.repeat)
+    ])
+    results.update(bench_api(corpus, args.api_requests, args.timeout))
+    results["peak_rss_mb"] = peak_rss_mb()
+
+    for stage in ("process_new_emails", "pipeline", "api_sync"):
+        stats = results[stage]
+        line = f"[{stage}] {stats['messages']:.0f} 封，{stats['msgs_per_sec']:.1f} 封/秒"
+        if "p50_ms" in stats:
+            line += f"  单封 p50={stats['p50_ms']:.2f}ms p99={stats['p99_ms']:.2f}ms"
+        if "flush_p50_ms" in stats:
+            line += f"  批量写入 p50={stats['flush_p50_ms']:.2f}ms p99={stats['flush_p99_ms']:.2f}ms"
+        print(line)
+    for name, stats in results["api"].items():
+        print(f"[api] {name:<24} p50={stats['p50_ms']:.2f}ms p99={stats['p99_ms']:.2f}ms")
+    if results["peak_rss_mb"] is not None:
+        print(f"峰值内存 {results['peak_rss_mb']:.1f} MB")
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance, args.min_delta_ms)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n基线已保存到 {args.baseline}")
+    if regressions:
+        print(f"\n{len(regressions)} 项指标退步超过 {args.tolerance:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""邮件分类的prefill与decode耗时压测
+
+用法（在 notia-api 目录下）：
+    python benchmarks/bench_prefill_decode.py --emails 50
+    python benchmarks/bench_prefill_decode.py --emails 50 --compare
+
+逐封对合成邮件执行与线上相同的分析推理（分析提示词、JSON Schema约束解码和
+同样的生成长度上限，不经过微批调度），按模型返回的性能指标
+把每封邮件的耗时拆成prefill（首token时间）和decode（其余token），
+并统计每秒处理的邮件数。--compare 时分别在关闭和开启前缀缓存的
+情况下各运行一次。模型路径、设备和后端沿用 MODEL_CONFIG，stub
+后端不提供分阶段耗时，只报告总耗时。
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.model_backends import create_backend
+from services.model_service import MODEL_CONFIG
+from services.prompts import ANALYSIS_PREFIX, ANALYSIS_SCHEMA, build_analysis_prompt
+
+SUBJECTS = ["项目周报", "会议通知", "技术资讯", "季度报告", "请确认报销单", "订阅推送", "系统维护公告"]
+SENTENCES = [
+    "请在本周五前提交相关材料。", "本期内容包括行业动态和产品更新。", "会议将在三楼会议室举行。",
+    "如有疑问请直接回复本邮件。", "附件为上季度的财务数据汇总。", "感谢您一直以来的支持。",
+]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def make_emails(count: int, seed: int = 7) -> List[Dict]:
+    rng = random.Random(seed)
+    return [{
+        "title": f"{rng.choice(SUBJECTS)} #{index}",
+        "sender": f"sender{index % 20}@example.com",
+        "content": "".join(rng.choice(SENTENCES) for _ in range(rng.randint(3, 20))),
+        "time": f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} {rng.randint(8, 19):02d}:00"
+    } for index in range(count)]
+
+
+def run(emails: List[Dict], prefix_caching: bool, max_new_tokens: int) -> Dict:
+    backend = create_backend(
+        MODEL_CONFIG["backend"], MODEL_CONFIG["model_path"], MODEL_CONFIG["device"],
+        prefix_caching=prefix_caching, cache_size=MODEL_CONFIG["kv_cache_size"]
+    )
+    backend.load()
+    backend.warm_up()
+
+    rows = []
+    start = time.perf_counter()
+    for email_data in emails:
+        prompt = build_analysis_prompt(
+            email_data["title"], email_data["content"], email_data["sender"], email_data["time"]
+        )
+        rows.append(backend.generate_with_metrics(prompt, max_new_tokens, ANALYSIS_SCHEMA))
+    elapsed = time.perf_counter() - start
+
+    totals = [row["total_ms"] for row in rows]
+    result = {
+        "emails_per_sec": len(rows) / elapsed,
+        "input_tokens": sum(row["input_tokens"] for row in rows) / len(rows),
+        "output_tokens": sum(row["output_tokens"] for row in rows) / len(rows),
+        "total_p50_ms": percentile(totals, 50),
+        "total_p99_ms": percentile(totals, 99),
+        "prefix_tokens": backend.count_tokens(ANALYSIS_PREFIX),
+    }
+    if all(row["ttft_ms"] is not None for row in rows):
+        prefill = [row["ttft_ms"] for row in rows]
+        decode = [max(0.0, row["total_ms"] - row["ttft_ms"]) for row in rows]
+        result.update({
+            "prefill_p50_ms": percentile(prefill, 50),
+            "prefill_p99_ms": percentile(prefill, 99),
+            "decode_p50_ms": percentile(decode, 50),
+            "decode_p99_ms": percentile(decode, 99),
+            "tpot_ms": sum(row["tpot_ms"] for row in rows) / len(rows),
+            "prefill_share": sum(prefill) / max(sum(totals), 1e-9),
+        })
+    return result
+
+
+def report(label: str, result: Dict):
+    print(f"[{label}] {result['emails_per_sec']:.2f} 封/秒  "
+          f"平均输入 {result['input_tokens']:.0f} tokens（公共前缀 {result['prefix_tokens']}）  "
+          f"平均输出 {result['output_tokens']:.1f} tokens")
+    print(f"  总耗时   p50={result['total_p50_ms']:.1f}ms p99={result['total_p99_ms']:.1f}ms")
+    if "prefill_p50_ms" not in result:
+        print("  当前后端不提供分阶段耗时")
+        return
+    print(f"  prefill  p50={result['prefill_p50_ms']:.1f}ms p99={result['prefill_p99_ms']:.1f}ms  "
+          f"占总耗时 {result['prefill_share']:.0%}")
+    print(f"  decode   p50={result['decode_p50_ms']:.1f}ms p99={result['decode_p99_ms']:.1f}ms  "
+          f"TPOT {result['tpot_ms']:.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--emails", type=int, default=50, help="分类的邮件数")
+    parser.add_argument("--max-new-tokens", type=int, default=MODEL_CONFIG["analysis_max_new_tokens"],
+                        help="每封邮件的生成长度上限")
+    parser.add_argument("--compare", action="store_true", help="对比关闭和开启前缀缓存")
+    args = parser.parse_args()
+
+    emails = make_emails(args.emails)
+    print(f"后端 {MODEL_CONFIG['backend']}，设备 {MODEL_CONFIG['device']}，{len(emails)} 封邮件")
+    modes = [False, True] if args.compare else [MODEL_CONFIG["prefix_caching"]]
+    results = {}
+    for prefix_caching in modes:
+        label = "前缀缓存开启" if prefix_caching else "前缀缓存关闭"
+        results[prefix_caching] = run(emails, prefix_caching, args.max_new_tokens)
+        report(label, results[prefix_caching])
+
+    if args.compare:
+        speedup = results[True]["emails_per_sec"] / max(results[False]["emails_per_sec"], 1e-9)
+        print(f"\n开启前缀缓存后吞吐为关闭时的 {speedup:.2f} 倍")
+
+
+if __name__ == "__main__":
+    main()
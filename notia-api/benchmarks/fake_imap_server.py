@@ -0,0 +1,329 @@
+"""压测用的本地IMAP服务器
+
+明文IMAP4rev1的最小实现，只支持邮件同步用到的命令：CAPABILITY、LOGIN、
+SELECT/EXAMINE、STATUS、UID SEARCH、UID FETCH（UID、FLAGS、RFC822.SIZE、
+BODYSTRUCTURE、BODY[HEADER]、BODY[TEXT]、BODY[n.m]及<start.len>部分获取）、
+UID STORE、NOOP、IDLE和LOGOUT。任意用户名和密码都能登录，所有连接共享
+同一个邮箱，邮件在启动前一次性解析好，服务器本身不会成为瓶颈。
+
+    server = FakeIMAPServer(generate_corpus(1000))
+    server.start()
+    ... IMAPConnectionManager("127.0.0.1", "u", "p", port=server.port, use_ssl=False)
+    server.stop()
+"""
+import email
+import re
+import socketserver
+import threading
+from typing import Dict, List, Optional, Set
+
+_FETCH_ITEM_RE = re.compile(
+    r'BODY(?:\.PEEK)?\[([^\]]*)\](?:<(\d+)\.(\d+)>)?|BODYSTRUCTURE|RFC822\.SIZE|FLAGS|UID', re.I
+)
+_SEARCH_UID_RE = re.compile(r'UID\s+(\S+)', re.I)
+
+
+def _quote(value: Optional[str]) -> bytes:
+    if value is None:
+        return b"NIL"
+    return b'"' + value.encode("utf-8").replace(b"\\", b"\\\\").replace(b'"', b'\\"') + b'"'
+
+
+def _payload_bytes(part) -> bytes:
+    payload = part._payload
+    if isinstance(payload, str):
+        # message_from_bytes以surrogateescape保留了原始字节
+        return payload.encode("ascii", "surrogateescape")
+    return b""
+
+
+def _bodystructure(part) -> bytes:
+    if part.is_multipart():
+        children = b"".join(_bodystructure(child) for child in part.get_payload())
+        return b"(" + children + b" " + _quote(part.get_content_subtype().upper()) + b")"
+
+    params = part.get_params() or []
+    params = [(key, value) for key, value in params[1:]]
+    param_list = b"(" + b" ".join(_quote(k) + b" " + _quote(v) for k, v in params) + b")" if params else b"NIL"
+    body = _payload_bytes(part)
+    fields = [
+        _quote(part.get_content_maintype().upper()), _quote(part.get_content_subtype().upper()), param_list,
+        _quote(part.get("Content-ID")), b"NIL",
+        _quote((part.get("Content-Transfer-Encoding") or "7BIT").upper()), str(len(body)).encode()
+    ]
+    if part.get_content_maintype() == "text":
+        fields.append(str(body.count(b"\n")).encode())
+    fields.append(b"NIL")
+    disposition = part.get_content_disposition()
+    if disposition:
+        filename = part.get_param("filename", header="Content-Disposition")
+        disposition_params = b"(" + _quote("filename") + b" " + _quote(filename) + b")" if filename else b"NIL"
+        fields.append(b"(" + _quote(disposition.upper()) + b" " + disposition_params + b")")
+    else:
+        fields.append(b"NIL")
+    return b"(" + b" ".join(fields) + b")"
+
+
+class FakeMessage:
+    """预先解析好的一封邮件"""
+
+    def __init__(self, uid: int, raw: bytes):
+        self.uid = uid
+        self.raw = raw
+        self.flags: Set[str] = set()
+        split = raw.find(b"\r\n\r\n")
+        self.header = raw[:split + 4] if split >= 0 else raw
+        self.text = raw[split + 4:] if split >= 0 else b""
+        msg = email.message_from_bytes(raw)
+        self.bodystructure = _bodystructure(msg)
+        self.sections: Dict[str, bytes] = {}
+        self._index_sections(msg, "")
+
+    def _index_sections(self, part, prefix: str):
+        if part.is_multipart():
+            for number, child in enumerate(part.get_payload(), 1):
+                self._index_sections(child, f"{prefix}.{number}" if prefix else str(number))
+        else:
+            # 非multipart邮件的正文是第1部分
+            self.sections[prefix or "1"] = _payload_bytes(part)
+
+    def section(self, name: str) -> bytes:
+        name = name.upper()
+        if name == "":
+            return self.raw
+        if name == "HEADER":
+            return self.header
+        if name == "TEXT":
+            return self.text
+        return self.sections.get(name, b"")
+
+
+class Mailbox:
+    """所有连接共享的邮箱"""
+
+    def __init__(self, messages: List[bytes], uidvalidity: int = 1):
+        self.uidvalidity = uidvalidity
+        self.messages: List[FakeMessage] = []
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        for raw in messages:
+            self.append(raw)
+
+    @property
+    def uidnext(self) -> int:
+        return self.messages[-1].uid + 1 if self.messages else 1
+
+    def append(self, raw: bytes) -> FakeMessage:
+        """投递一封新邮件，正在IDLE的连接会收到EXISTS通知"""
+        with self.lock:
+            message = FakeMessage(self.uidnext, raw)
+            self.messages.append(message)
+            self.changed.notify_all()
+            return message
+
+    def resolve(self, message_set: str) -> List[FakeMessage]:
+        """按UID集合（如 1:3,7,10:*）选出邮件"""
+        with self.lock:
+            messages = list(self.messages)
+        if not messages:
+            return []
+        max_uid = messages[-1].uid
+        wanted: Set[int] = set()
+        for item in message_set.split(","):
+            if ":" in item:
+                low, high = item.split(":", 1)
+                low = max_uid if low == "*" else int(low)
+                high = max_uid if high == "*" else int(high)
+                wanted.update(range(min(low, high), max(low, high) + 1))
+            else:
+                wanted.add(max_uid if item == "*" else int(item))
+        return [message for message in messages if message.uid in wanted]
+
+
+class IMAPHandler(socketserver.StreamRequestHandler):
+    """处理一条客户端连接"""
+
+    def send(self, data: bytes):
+        self.wfile.write(data)
+
+    def handle(self):
+        self.mailbox: Mailbox = self.server.mailbox
+        self.send(b"* OK [CAPABILITY IMAP4rev1 IDLE] fake IMAP server ready\r\n")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            parts = line.decode("utf-8", "replace").rstrip("\r\n").split(" ", 2)
+            if len(parts) < 2:
+                self.send(b"* BAD invalid command\r\n")
+                continue
+            tag, command = parts[0], parts[1].upper()
+            args = parts[2] if len(parts) > 2 else ""
+            if command == "UID":
+                sub = args.split(" ", 1)
+                command, args = "UID " + sub[0].upper(), sub[1] if len(sub) > 1 else ""
+            handler = getattr(self, "cmd_" + command.replace(" ", "_"), None)
+            if handler is None:
+                self.send(f"{tag} BAD unsupported command {command}\r\n".encode())
+                continue
+            try:
+                if handler(tag, args) is False:
+                    return
+            except (ValueError, IndexError) as e:
+                self.send(f"{tag} BAD {e}\r\n".encode())
+            self.wfile.flush()
+
+    def cmd_CAPABILITY(self, tag, args):
+        self.send(b"* CAPABILITY IMAP4rev1 IDLE\r\n" + f"{tag} OK CAPABILITY completed\r\n".encode())
+
+    def cmd_LOGIN(self, tag, args):
+        self.send(f"{tag} OK LOGIN completed\r\n".encode())
+
+    def cmd_NOOP(self, tag, args):
+        self.send(f"{tag} OK NOOP completed\r\n".encode())
+
+    def cmd_LOGOUT(self, tag, args):
+        self.send(b"* BYE logging out\r\n" + f"{tag} OK LOGOUT completed\r\n".encode())
+        return False
+
+    def cmd_CLOSE(self, tag, args):
+        self.send(f"{tag} OK CLOSE completed\r\n".encode())
+
+    def cmd_SELECT(self, tag, args):
+        mailbox = self.mailbox
+        self.send(
+            f"* {len(mailbox.messages)} EXISTS\r\n* 0 RECENT\r\n"
+            f"* FLAGS (\\Seen \\Flagged \\Deleted)\r\n"
+            f"* OK [UIDVALIDITY {mailbox.uidvalidity}] UIDs valid\r\n"
+            f"* OK [UIDNEXT {mailbox.uidnext}] predicted next UID\r\n"
+            f"{tag} OK [READ-WRITE] SELECT completed\r\n".encode()
+        )
+
+    cmd_EXAMINE = cmd_SELECT
+
+    def cmd_STATUS(self, tag, args):
+        name = args.split(" ", 1)[0]
+        mailbox = self.mailbox
+        unseen = sum(1 for message in mailbox.messages if "\\Seen" not in message.flags)
+        self.send(
+            f"* STATUS {name} (MESSAGES {len(mailbox.messages)} UIDVALIDITY {mailbox.uidvalidity} "
+            f"UIDNEXT {mailbox.uidnext} UNSEEN {unseen})\r\n{tag} OK STATUS completed\r\n".encode()
+        )
+
+    def cmd_UID_SEARCH(self, tag, args):
+        criteria = args.upper()
+        match = _SEARCH_UID_RE.search(args)
+        if match:
+            messages = self.mailbox.resolve(match.group(1))
+        else:
+            with self.mailbox.lock:
+                messages = list(self.mailbox.messages)
+        if "UNSEEN" in criteria:
+            messages = [message for message in messages if "\\Seen" not in message.flags]
+        uids = " ".join(str(message.uid) for message in messages)
+        self.send(f"* SEARCH {uids}\r\n{tag} OK SEARCH completed\r\n".encode())
+
+    def cmd_UID_FETCH(self, tag, args):
+        message_set, items = args.split(" ", 1)
+        requested = list(_FETCH_ITEM_RE.finditer(items))
+        for seq, message in self._numbered(self.mailbox.resolve(message_set)):
+            out = [f"* {seq} FETCH (UID {message.uid}".encode()]
+            for item in requested:
+                name = item.group(0).upper()
+                if name == "UID":
+                    continue
+                if name == "FLAGS":
+                    out.append(b" FLAGS (" + " ".join(sorted(message.flags)).encode() + b")")
+                elif name == "RFC822.SIZE":
+                    out.append(f" RFC822.SIZE {len(message.raw)}".encode())
+                elif name == "BODYSTRUCTURE":
+                    out.append(b" BODYSTRUCTURE " + message.bodystructure)
+                else:
+                    section = item.group(1)
+                    data = message.section(section)
+                    key = f"BODY[{section.upper()}]"
+                    if item.group(2) is not None:
+                        start, length = int(item.group(2)), int(item.group(3))
+                        data = data[start:start + length]
+                        key += f"<{start}>"
+                    out.append(f" {key} {{{len(data)}}}\r\n".encode() + data)
+                    if ".PEEK" not in name:
+                        message.flags.add("\\Seen")
+            out.append(b")\r\n")
+            self.send(b"".join(out))
+        self.send(f"{tag} OK FETCH completed\r\n".encode())
+
+    def cmd_UID_STORE(self, tag, args):
+        message_set, action, flags = args.split(" ", 2)
+        flags = set(flags.strip("()").split())
+        for seq, message in self._numbered(self.mailbox.resolve(message_set)):
+            if action.upper().startswith("+"):
+                message.flags |= flags
+            elif action.upper().startswith("-"):
+                message.flags -= flags
+            else:
+                message.flags = set(flags)
+            if ".SILENT" not in action.upper():
+                self.send(f"* {seq} FETCH (UID {message.uid} FLAGS ({' '.join(sorted(message.flags))}))\r\n".encode())
+        self.send(f"{tag} OK STORE completed\r\n".encode())
+
+    def cmd_IDLE(self, tag, args):
+        mailbox = self.mailbox
+        with mailbox.lock:
+            known = len(mailbox.messages)
+        self.send(b"+ idling\r\n")
+        self.wfile.flush()
+
+        done = threading.Event()
+
+        def wait_done():
+            self.rfile.readline()
+            done.set()
+            with mailbox.lock:
+                mailbox.changed.notify_all()
+
+        threading.Thread(target=wait_done, daemon=True).start()
+        while not done.is_set():
+            with mailbox.lock:
+                mailbox.changed.wait(1.0)
+                count = len(mailbox.messages)
+            if count != known:
+                known = count
+                self.send(f"* {count} EXISTS\r\n".encode())
+                self.wfile.flush()
+        self.send(f"{tag} OK IDLE terminated\r\n".encode())
+
+    def _numbered(self, messages: List[FakeMessage]):
+        with self.mailbox.lock:
+            positions = {message.uid: index + 1 for index, message in enumerate(self.mailbox.messages)}
+        return [(positions[message.uid], message) for message in messages]
+
+
+class FakeIMAPServer(socketserver.ThreadingTCPServer):
+    """在后台线程中运行的本地IMAP服务器，port为0时随机选择端口"""
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, messages: List[bytes], host: str = "127.0.0.1", port: int = 0, uidvalidity: int = 1):
+        self.mailbox = Mailbox(messages, uidvalidity)
+        super().__init__((host, port), IMAPHandler)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def host(self) -> str:
+        return self.server_address[0]
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-imap", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread:
+            self._thread.join(timeout=5)
@@ -0,0 +1,100 @@
+"""合成邮件语料
+
+按给定的数量、附件比例和中英文比例生成确定性的RFC 822邮件，用于压测。
+中文邮件随机使用utf-8或gbk编码，部分邮件只有HTML正文，部分资讯类邮件
+带List-Unsubscribe头，任务类邮件正文中包含截止日期。
+"""
+import random
+from datetime import datetime, timedelta, timezone
+from email.header import Header
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.utils import format_datetime
+from typing import List
+
+ZH_TASK_SUBJECTS = ["项目进度汇报", "请确认会议时间", "季度预算审批", "项目评审会议安排", "请确认合同条款"]
+ZH_NEWS_SUBJECTS = ["本周行业动态", "产品更新公告", "技术周刊第{n}期", "市场快讯", "系统维护通知"]
+EN_TASK_SUBJECTS = ["项目 status report needed", "Please confirm the 会议 agenda", "Review request: 项目 plan"]
+EN_NEWS_SUBJECTS = ["Weekly digest #{n}", "Product release notes", "Your subscription update", "Tech news roundup"]
+
+ZH_SENTENCES = [
+    "请在截止日期前完成相关工作并回复。", "本期内容涵盖行业动态和产品更新。", "会议将在三楼会议室举行，请准时参加。",
+    "附件为上季度的财务数据汇总，请查阅。", "如有疑问请直接回复本邮件。", "感谢您一直以来的支持与配合。",
+    "我们对系统进行了性能优化，响应速度明显提升。", "请各部门负责人确认本周的工作安排。",
+]
+EN_SENTENCES = [
+    "Please complete the review before the deadline.", "This issue covers industry news and product updates.",
+    "The meeting will be held in room A101.", "Attached is the summary of last quarter.",
+    "Reply to this email if you have any questions.", "Thank you for your continued support.",
+]
+
+
+def _body(rng: random.Random, chinese: bool, sentences: int) -> str:
+    pool = ZH_SENTENCES if chinese else EN_SENTENCES
+    return ("" if chinese else " ").join(rng.choice(pool) for _ in range(sentences))
+
+
+def _html(text: str) -> str:
+    paragraphs = "".join(f"<p>{line}</p>" for line in text.split("。") if line)
+    return (f"<html><head><style>p {{ margin: 0 }}</style></head><body>"
+            f"<div class=\"content\">{paragraphs}</div><script>track();</script></body></html>")
+
+
+def generate_message(index: int, rng: random.Random, attachment_ratio: float, chinese_ratio: float,
+                     html_ratio: float, task_ratio: float, attachment_kb: int, start: datetime) -> bytes:
+    """生成第index封邮件的原始字节"""
+    chinese = rng.random() < chinese_ratio
+    task = rng.random() < task_ratio
+    charset = rng.choice(["utf-8", "gbk"]) if chinese else "utf-8"
+    if chinese:
+        subject = rng.choice(ZH_TASK_SUBJECTS if task else ZH_NEWS_SUBJECTS)
+    else:
+        subject = rng.choice(EN_TASK_SUBJECTS if task else EN_NEWS_SUBJECTS)
+    subject = subject.format(n=index)
+    received = start + timedelta(minutes=index)
+
+    text = _body(rng, chinese, rng.randint(3, 30))
+    if task:
+        deadline = (received + timedelta(days=rng.randint(1, 7))).strftime('%Y-%m-%d')
+        text += f"\n截止时间：{deadline}" if chinese else f"\nDeadline: {deadline}"
+
+    if rng.random() < html_ratio:
+        body = MIMEText(_html(text), "html", charset)
+    else:
+        alternative = MIMEMultipart("alternative")
+        alternative.attach(MIMEText(text, "plain", charset))
+        alternative.attach(MIMEText(_html(text), "html", "utf-8"))
+        body = alternative
+
+    if rng.random() < attachment_ratio:
+        msg = MIMEMultipart("mixed")
+        msg.attach(body)
+        size = max(1, int(attachment_kb * 1024 * rng.uniform(0.5, 1.5)))
+        attachment = MIMEApplication(rng.randbytes(size), "pdf")
+        attachment.add_header("Content-Disposition", "attachment", filename=f"report-{index}.pdf")
+        msg.attach(attachment)
+    else:
+        msg = body
+
+    msg["Subject"] = subject if subject.isascii() else Header(subject, charset).encode()
+    sender = f"sender{rng.randint(1, 200)}@{'corp' if task else 'news'}{rng.randint(1, 20)}.example.com"
+    msg["From"] = sender
+    msg["To"] = "bench@example.com"
+    msg["Date"] = format_datetime(received.replace(tzinfo=timezone(timedelta(hours=8))))
+    msg["Message-ID"] = f"<bench-{index}@example.com>"
+    if not task and rng.random() < 0.5:
+        msg["List-Unsubscribe"] = f"<mailto:unsubscribe-{index}@example.com>"
+    return msg.as_bytes().replace(b"\r\n", b"\n").replace(b"\n", b"\r\n")
+
+
+def generate_corpus(count: int, attachment_ratio: float = 0.2, chinese_ratio: float = 0.7,
+                    html_ratio: float = 0.2, task_ratio: float = 0.4, attachment_kb: int = 200,
+                    seed: int = 42) -> List[bytes]:
+    """生成count封邮件，同样的参数总是得到同样的语料"""
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 1, 9, 0)
+    return [
+        generate_message(index, rng, attachment_ratio, chinese_ratio, html_ratio, task_ratio, attachment_kb, start)
+        for index in range(count)
+    ]
@@ -0,0 +1,224 @@
+"""热点查询的执行计划检查
+
+在临时数据库上按当前的表结构和迁移建库，写入有代表性的邮件和任务并
+ANALYZE，使查询规划器按接近真实的数据分布选择索引，然后实际执行各接口
+使用的查询，截获其SQL后逐条 EXPLAIN QUERY PLAN。有查询对原表做全表扫描
+（SCAN且未使用索引），或热点查询没有使用预期的索引、需要额外排序时，
+以非零状态退出。tests/test_query_plans.py 以同样的检查作为回归测试。
+
+用法（在 notia-api 目录下）：
+    python database/check_query_plans.py
+"""
+import os
+import random
+import re
+import sqlite3
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+
+from database.config import get_engine
+from database.db_utils import DatabaseUtils
+from database.fts import register_functions
+from database.models import Email, EmailCategory, Task, TaskStatus, create_tables
+from database.pagination import encode_cursor, keyset_page
+from services.classification_cache import ClassificationCache
+
+# 允许的SCAN：全文索引虚表和常量行
+_ALLOWED_SCAN_RE = re.compile(r'VIRTUAL TABLE|CONSTANT ROW|USING (COVERING )?INDEX|USING INTEGER PRIMARY KEY')
+_SCAN_RE = re.compile(r'\bSCAN\b')
+_TEMP_SORT_RE = re.compile(r'USE TEMP B-TREE FOR ORDER BY')
+
+# 热点查询预期使用的索引：每一步查找都要使用该索引，且直接按索引顺序输出（不额外排序）
+EXPECTED_INDEXES: Dict[str, str] = {
+    "邮件列表": "idx_emails_received_id",
+    "邮件列表翻页": "idx_emails_received_id",
+    "邮件列表无时间翻页": "idx_emails_received_id",
+    "邮件按分类翻页": "idx_emails_category_received",
+    "邮件按发件人翻页": "idx_emails_sender_received",
+    "任务列表翻页": "idx_tasks_received_id",
+    "任务按状态翻页": "idx_tasks_status_received",
+    "待处理任务": "idx_tasks_status_feedback",
+    "过期任务": "idx_tasks_status_feedback",
+}
+
+# 全文搜索预期使用的FTS表，退回LIKE时沿received_time索引扫描，不会被判为全表扫描，需单独检查
+EXPECTED_FTS_TABLES: Dict[str, str] = {
+    "全文搜索邮件": "emails_fts",
+    "两字词搜索邮件": "emails_bigram",
+    "全文搜索知识库": "knowledge_fts",
+    "两字词搜索知识库": "knowledge_bigram",
+}
+
+SEED_CONFIG = {
+    "emails": 5000,
+    "senders": 200,
+    "tasks": 3000,
+    # 大部分任务已完成，未完成的只占一小部分
+    "task_status_weights": {TaskStatus.COMPLETED: 85, TaskStatus.NOT_STARTED: 10, TaskStatus.IN_PROGRESS: 5},
+    "task_without_feedback_ratio": 0.3,
+}
+
+
+def hot_queries(db_utils: DatabaseUtils, Session) -> Dict[str, Callable]:
+    """各接口实际执行的查询路径"""
+    cursor = encode_cursor(datetime(2025, 1, 1), 100)
+    # 已翻到received_time为空的行
+    null_cursor = encode_cursor(None, 100)
+    email_columns = (Email.id, Email.title, Email.sender, Email.received_time, Email.category)
+    task_columns = (Task.id, Task.title, Task.received_time, Task.status)
+
+    def page(model, columns, *filters, cursor=None):
+        def run():
+            db = Session()
+            try:
+                keyset_page(db.query(*columns).filter(*filters), model, 50, cursor)
+            finally:
+                db.close()
+        return run
+
+    def sender_rule():
+        ClassificationCache(db_utils).sender_category("a@example.com")
+
+    return {
+        "邮件列表": page(Email, email_columns),
+        "邮件列表翻页": page(Email, email_columns, cursor=cursor),
+        "邮件列表无时间翻页": page(Email, email_columns, cursor=null_cursor),
+        "邮件按分类翻页": page(Email, email_columns, Email.category == EmailCategory.TASK, cursor=cursor),
+        "邮件按发件人翻页": page(Email, email_columns, Email.sender == "a@example.com", cursor=cursor),
+        "任务列表翻页": page(Task, task_columns, cursor=cursor),
+        "任务按状态翻页": page(Task, task_columns, Task.status == TaskStatus.NOT_STARTED, cursor=cursor),
+        "发件人分类规则": sender_rule,
+        "待处理任务": db_utils.get_pending_tasks,
+        "过期任务": db_utils.get_overdue_tasks,
+        "按分类取邮件": lambda: db_utils.get_emails_by_category(EmailCategory.TASK.value),
+        "统计信息": db_utils.get_email_statistics,
+        "全文搜索邮件": lambda: db_utils.search_emails("项目进度"),
+        "两字词搜索邮件": lambda: db_utils.search_emails("会议"),
+        "全文搜索知识库": lambda: db_utils.search_knowledge("FastAPI"),
+        "两字词搜索知识库": lambda: db_utils.search_knowledge("部署"),
+        "读取配置": lambda: db_utils.get_config("imap_sync:a@example.com:INBOX"),
+    }
+
+
+def seed(db_path: str, seed_value: int = 0):
+    """写入有代表性的邮件和任务后ANALYZE，空库上规划器没有统计信息，选出的索引不可信"""
+    rng = random.Random(seed_value)
+    now = datetime.now()
+    categories = [category.value for category in EmailCategory]
+    statuses = list(SEED_CONFIG["task_status_weights"])
+    weights = list(SEED_CONFIG["task_status_weights"].values())
+
+    def moment(days: int) -> str:
+        return (now - timedelta(days=rng.uniform(-days, days))).strftime('%Y-%m-%d %H:%M:%S.%f')
+
+    emails = [
+        (f"seed-{i}", f"邮件 {i}", f"user{rng.randrange(SEED_CONFIG['senders'])}@example.com",
+         moment(180), f"正文 {i}", rng.choice(categories), moment(180))
+        for i in range(SEED_CONFIG["emails"])
+    ]
+    tasks = []
+    for i in range(SEED_CONFIG["tasks"]):
+        feedback = None if rng.random() < SEED_CONFIG["task_without_feedback_ratio"] else moment(60)
+        status = rng.choices(statuses, weights)[0].value
+        tasks.append((f"seed-{i}", f"任务 {i}", "user@example.com", moment(180), feedback, f"正文 {i}",
+                      status, moment(180), moment(180)))
+
+    conn = sqlite3.connect(db_path)
+    register_functions(conn)
+    try:
+        conn.executemany(
+            """INSERT INTO emails (email_id, title, sender, received_time, content, category, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)""", emails
+        )
+        conn.executemany(
+            """INSERT INTO tasks (email_id, title, sender, received_time, feedback_time, content,
+                                  status, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""", tasks
+        )
+        conn.commit()
+        conn.execute("ANALYZE")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def evaluate(name: str, plan: List[str]) -> Optional[str]:
+    """检查执行计划，返回问题描述，没有问题时返回None"""
+    if any(_SCAN_RE.search(detail) and not _ALLOWED_SCAN_RE.search(detail) for detail in plan):
+        return "全表扫描"
+    index = EXPECTED_INDEXES.get(name)
+    if index:
+        lookups = [detail for detail in plan if _SCAN_RE.search(detail) or detail.startswith("SEARCH")]
+        if not lookups or not all(re.search(rf'USING (COVERING )?INDEX {index}\b', detail) for detail in lookups):
+            return f"未使用索引 {index}"
+        if any(_TEMP_SORT_RE.search(detail) for detail in plan):
+            return "需要额外排序"
+    fts_table = EXPECTED_FTS_TABLES.get(name)
+    if fts_table and not any(detail.startswith(f"SCAN {fts_table} VIRTUAL TABLE") for detail in plan):
+        return f"未使用全文索引 {fts_table}"
+    return None
+
+
+def check(db_path: str) -> List[Tuple[str, str, List[str], Optional[str]]]:
+    engine = get_engine(db_path)
+    captured: List[str] = []
+
+    @event.listens_for(engine, "connect")
+    def trace(dbapi_connection, connection_record):
+        # 截获绑定参数展开后的SQL
+        dbapi_connection.set_trace_callback(captured.append)
+
+    create_tables(engine)
+    seed(db_path)
+    db_utils = DatabaseUtils(db_path)
+    Session = sessionmaker(bind=engine)
+
+    explain = sqlite3.connect(db_path)
+    results = []
+    try:
+        for name, run in hot_queries(db_utils, Session).items():
+            captured.clear()
+            run()
+            statements = [sql for sql in captured if sql.lstrip().upper().startswith("SELECT")]
+            for sql in statements:
+                plan = [row[3] for row in explain.execute(f"EXPLAIN QUERY PLAN {sql}")]
+                results.append((name, sql, plan, evaluate(name, plan)))
+    finally:
+        explain.close()
+        engine.dispose()
+    return results
+
+
+def missing_queries(results: List[Tuple[str, str, List[str], Optional[str]]]) -> List[str]:
+    """预期索引的查询中没有执行到的，避免查询改名后检查悄悄失效"""
+    checked = {name for name, _, _, _ in results}
+    return [name for name in list(EXPECTED_INDEXES) + list(EXPECTED_FTS_TABLES) if name not in checked]
+
+
+def main():
+    db_path = os.path.join(tempfile.mkdtemp(prefix="notia-plans-"), "notia.db")
+    results = check(db_path)
+    failures = 0
+    for name, sql, plan, problem in results:
+        print(f"[{problem or 'OK'}] {name}")
+        for detail in plan:
+            print(f"    {detail}")
+        if problem:
+            failures += 1
+            print("    " + " ".join(sql.split()))
+    for name in missing_queries(results):
+        failures += 1
+        print(f"[未执行] {name}")
+    print(f"\n共检查 {len(results)} 条查询，{failures} 条不符合预期")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
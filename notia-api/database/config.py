@@ -1,20 +1,127 @@
 import os
-from sqlalchemy import create_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import declarative_base, sessionmaker
+
+from database.fts import register_functions
+
+# 数据库配置，可通过环境变量覆盖
+DATABASE_CONFIG = {
+    "path": os.environ.get("NOTIA_DB_PATH", "notia.db"),
+    "pool_size": int(os.environ.get("NOTIA_DB_POOL_SIZE", "8")),  # 与db线程池大小一致
+    "max_overflow": 4,
+    "pool_timeout": 30,
+    "cached_statements": 256,  # 每个连接缓存的预编译语句数
+}
+
+# 每个连接建立时设置的PRAGMA
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",        # 读写互不阻塞
+    "synchronous": "NORMAL",      # WAL模式下安全且省去每次提交的fsync
+    "busy_timeout": 5000,         # 写锁冲突时等待而不是立即报错（毫秒）
+    "cache_size": -65536,         # 页缓存64MB（负数表示KB）
+    "mmap_size": 268435456,       # 256MB内存映射读取
+    "temp_store": "MEMORY",
+}
+
+# 每次提交后以提交耗时（秒）调用，用于统计提交延迟
+_commit_listeners: List[Callable[[float], None]] = []
+
+_engines: Dict[str, Engine] = {}
+_session_factories: Dict[str, sessionmaker] = {}
+_engines_lock = threading.RLock()
+
+
+def add_commit_listener(listener: Callable[[float], None]):
+    """登记提交耗时的监听函数"""
+    _commit_listeners.append(listener)
+
+
+class _TimedConnection(sqlite3.Connection):
+    """记录提交耗时的sqlite3连接，ORM会话和原始连接的提交都经过这里"""
+
+    def commit(self):
+        start = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            elapsed = time.perf_counter() - start
+            for listener in _commit_listeners:
+                listener(elapsed)
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+def _register_sqlite_functions(dbapi_connection, connection_record):
+    # 全文索引触发器中调用的函数，每个连接都要注册
+    register_functions(dbapi_connection)
+
+
+def get_engine(db_path: Optional[str] = None) -> Engine:
+    """获取数据库文件对应的共享引擎，同一文件只创建一个连接池"""
+    db_path = os.path.abspath(db_path or DATABASE_CONFIG["path"])
+    engine = _engines.get(db_path)
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get(db_path)
+            if engine is None:
+                engine = create_engine(
+                    f"sqlite:///{db_path}",
+                    connect_args={
+                        "check_same_thread": False,
+                        "factory": _TimedConnection,
+                        "cached_statements": DATABASE_CONFIG["cached_statements"],
+                    },
+                    pool_size=DATABASE_CONFIG["pool_size"],
+                    max_overflow=DATABASE_CONFIG["max_overflow"],
+                    pool_timeout=DATABASE_CONFIG["pool_timeout"],
+                    pool_pre_ping=False,
+                    echo=False  # 设置为True可以看到SQL语句
+                )
+                event.listen(engine, "connect", _set_sqlite_pragmas)
+                event.listen(engine, "connect", _register_sqlite_functions)
+                _engines[db_path] = engine
+    return engine
+
+
+def get_sessionmaker(db_path: Optional[str] = None) -> sessionmaker:
+    """获取数据库文件对应的会话工厂"""
+    key = os.path.abspath(db_path or DATABASE_CONFIG["path"])
+    factory = _session_factories.get(key)
+    if factory is None:
+        with _engines_lock:
+            factory = _session_factories.get(key)
+            if factory is None:
+                factory = sessionmaker(autocommit=False, autoflush=False, bind=get_engine(key))
+                _session_factories[key] = factory
+    return factory
+
+
+def dispose_engines():
+    """关闭所有连接池"""
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+        _session_factories.clear()
 
-# 数据库配置
-DATABASE_URL = "sqlite:///./notia.db"
 
 # 创建数据库引擎
-engine = create_engine(
-    DATABASE_URL, 
-    connect_args={"check_same_thread": False},
-    echo=False  # 设置为True可以看到SQL语句
-)
+engine = get_engine()
 
 # 创建会话工厂
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = get_sessionmaker()
 
 # 创建基类
 Base = declarative_base()
@@ -30,4 +137,4 @@ def get_db():
 # 数据库初始化函数
 def init_database():
     """初始化数据库表"""
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    Base.metadata.create_all(bind=engine)
@@ -1,26 +1,34 @@
+import logging
 import sqlite3
 from typing import List, Dict, Optional
-from datetime import datetime
+from datetime import datetime, timedelta
+from database.config import DATABASE_CONFIG, get_engine
+from database.fts import build_bigram_query, build_match_query
+
+logger = logging.getLogger(__name__)
 
 class DatabaseUtils:
-    def __init__(self, db_path: str = "notia.db"):
-        self.db_path = db_path
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or DATABASE_CONFIG["path"]
+        # 同一数据库文件的所有实例共用一个连接池
+        self.engine = get_engine(self.db_path)
     
     def get_connection(self):
-        """获取数据库连接"""
-        return sqlite3.connect(self.db_path)
+        """从连接池获取连接，close()时归还"""
+        return self.engine.raw_connection()
     
     def execute_query(self, query: str, params: tuple = ()) -> List[Dict]:
         """执行查询并返回结果"""
         conn = self.get_connection()
-        conn.row_factory = sqlite3.Row  # 使结果可以通过列名访问
         cursor = conn.cursor()
+        cursor.row_factory = sqlite3.Row  # 使结果可以通过列名访问，不影响连接上的其他使用者
         
         try:
             cursor.execute(query, params)
             results = [dict(row) for row in cursor.fetchall()]
             return results
         finally:
+            cursor.close()
             conn.close()
     
     def execute_update(self, query: str, params: tuple = ()) -> int:
@@ -33,6 +41,20 @@ class DatabaseUtils:
             conn.commit()
             return cursor.rowcount
         finally:
+            cursor.close()
+            conn.close()
+    
+    def execute_insert(self, query: str, params: tuple = ()) -> int:
+        """执行插入操作并返回新行的ID"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute(query, params)
+            conn.commit()
+            return cursor.lastrowid
+        finally:
+            cursor.close()
             conn.close()
     
     def get_emails_by_category(self, category: str) -> List[Dict]:
@@ -46,35 +68,160 @@ class DatabaseUtils:
     
     def get_pending_tasks(self) -> List[Dict]:
         """获取待处理任务"""
+        # 每个状态单独按 idx_tasks_status_feedback 顺序读取后归并，不需要额外排序；
+        # 写成 status IN (...) 时两个状态前缀的索引代价相同，规划器可能选中不带feedback_time的那个
         query = """
-        SELECT * FROM tasks 
-        WHERE status IN ('未开始', '进行中')
+        SELECT * FROM tasks WHERE status = '未开始'
+        UNION ALL
+        SELECT * FROM tasks WHERE status = '进行中'
         ORDER BY feedback_time ASC
         """
         return self.execute_query(query)
     
     def get_overdue_tasks(self) -> List[Dict]:
         """获取过期任务"""
-        current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')
         query = """
-        SELECT * FROM tasks 
-        WHERE feedback_time < ? AND status != '已完成'
+        SELECT * FROM tasks WHERE status = '未开始' AND feedback_time < ?
+        UNION ALL
+        SELECT * FROM tasks WHERE status = '进行中' AND feedback_time < ?
         ORDER BY feedback_time ASC
         """
-        return self.execute_query(query, (current_time,))
+        return self.execute_query(query, (current_time, current_time))
     
-    def search_knowledge(self, keyword: str) -> List[Dict]:
-        """搜索知识库"""
+    def search_knowledge(self, keyword: str, limit: int = 20) -> List[Dict]:
+        """搜索知识库，按BM25相关度排序"""
+        match = build_match_query(keyword)
+        if match:
+            query = """
+            SELECT k.id, k.title, k.content, k.source, k.created_at,
+                   snippet(knowledge_fts, 1, '<b>', '</b>', '…', 16) AS snippet,
+                   bm25(knowledge_fts, 5.0, 1.0) AS rank
+            FROM knowledge_fts JOIN knowledge_base k ON k.id = knowledge_fts.rowid
+            WHERE knowledge_fts MATCH ?
+            ORDER BY rank
+            LIMIT ?
+            """
+            try:
+                return self.execute_query(query, (match, limit))
+            except sqlite3.OperationalError as e:
+                logger.warning("全文索引不可用，改用LIKE搜索: %s", e)
+        
+        bigram_match = None if match else build_bigram_query(keyword)
+        if bigram_match:
+            # 两字中文词走二元组索引，该索引不存内容，无法生成摘要片段
+            query = """
+            SELECT k.id, k.title, k.content, k.source, k.created_at,
+                   bm25(knowledge_bigram, 5.0, 1.0) AS rank
+            FROM knowledge_bigram JOIN knowledge_base k ON k.id = knowledge_bigram.rowid
+            WHERE knowledge_bigram MATCH ?
+            ORDER BY rank
+            LIMIT ?
+            """
+            try:
+                return self.execute_query(query, (bigram_match, limit))
+            except sqlite3.OperationalError as e:
+                logger.warning("二元组索引不可用，改用LIKE搜索: %s", e)
+        
         query = """
-        SELECT * FROM knowledge_base 
+        SELECT id, title, content, source, created_at FROM knowledge_base 
         WHERE title LIKE ? OR content LIKE ?
         ORDER BY created_at DESC
+        LIMIT ?
+        """
+        search_term = f"%{keyword}%"
+        return self.execute_query(query, (search_term, search_term, limit))
+    
+    def search_emails(self, keyword: str, limit: int = 20) -> List[Dict]:
+        """全文搜索邮件，按BM25相关度排序并返回摘要片段"""
+        match = build_match_query(keyword)
+        if match:
+            query = """
+            SELECT e.id, e.email_id, e.title, e.sender, e.received_time, e.category,
+                   snippet(emails_fts, 2, '<b>', '</b>', '…', 16) AS snippet,
+                   bm25(emails_fts, 10.0, 2.0, 1.0) AS rank
+            FROM emails_fts JOIN emails e ON e.id = emails_fts.rowid
+            WHERE emails_fts MATCH ?
+            ORDER BY rank
+            LIMIT ?
+            """
+            try:
+                return self.execute_query(query, (match, limit))
+            except sqlite3.OperationalError as e:
+                logger.warning("全文索引不可用，改用LIKE搜索: %s", e)
+        
+        bigram_match = None if match else build_bigram_query(keyword)
+        if bigram_match:
+            # 两字中文词走二元组索引，该索引不存内容，摘要取正文开头
+            query = """
+            SELECT e.id, e.email_id, e.title, e.sender, e.received_time, e.category,
+                   substr(e.content, 1, 100) AS snippet,
+                   bm25(emails_bigram, 10.0, 2.0, 1.0) AS rank
+            FROM emails_bigram JOIN emails e ON e.id = emails_bigram.rowid
+            WHERE emails_bigram MATCH ?
+            ORDER BY rank
+            LIMIT ?
+            """
+            try:
+                return self.execute_query(query, (bigram_match, limit))
+            except sqlite3.OperationalError as e:
+                logger.warning("二元组索引不可用，改用LIKE搜索: %s", e)
+        
+        query = """
+        SELECT id, email_id, title, sender, received_time, category,
+               substr(content, 1, 100) AS snippet
+        FROM emails
+        WHERE title LIKE ? OR sender LIKE ? OR content LIKE ?
+        ORDER BY received_time DESC
+        LIMIT ?
         """
         search_term = f"%{keyword}%"
-        return self.execute_query(query, (search_term, search_term))
+        return self.execute_query(query, (search_term, search_term, search_term, limit))
+    
+    def get_knowledge_by_ids(self, ids: List[int]) -> List[Dict]:
+        """按ID批量获取知识条目，不含向量列"""
+        if not ids:
+            return []
+        placeholders = ','.join('?' * len(ids))
+        query = f"""
+        SELECT id, title, content, source, created_at FROM knowledge_base
+        WHERE id IN ({placeholders})
+        """
+        return self.execute_query(query, tuple(ids))
     
-    def get_email_statistics(self) -> Dict:
-        """获取邮件统计信息"""
+    def get_email_statistics(self, days: int = 30, top_senders: int = 10) -> Dict:
+        """获取邮件统计信息，直接读取stats_counters中增量维护的计数"""
+        since = (datetime.now() - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+        query = """
+        SELECT scope, bucket, count FROM stats_counters
+        WHERE scope IN ('emails', 'email_category', 'task_status')
+           OR (scope = 'email_day' AND bucket >= ?)
+        """
+        try:
+            rows = self.execute_query(query, (since,))
+            senders = self.execute_query("""
+            SELECT bucket AS sender, count FROM stats_counters
+            WHERE scope = 'email_sender'
+            ORDER BY count DESC
+            LIMIT ?
+            """, (top_senders,))
+        except sqlite3.OperationalError as e:
+            logger.warning("统计计数表不可用，改为扫描原表: %s", e)
+            return self.scan_email_statistics()
+
+        counters: Dict[str, Dict] = {'emails': {}, 'email_category': {}, 'email_day': {}, 'task_status': {}}
+        for row in rows:
+            counters[row['scope']][row['bucket']] = row['count']
+        return {
+            'total_emails': counters['emails'].get('', 0),
+            'by_category': counters['email_category'],
+            'task_status': counters['task_status'],
+            'by_day': dict(sorted(counters['email_day'].items())),
+            'top_senders': {row['sender']: row['count'] for row in senders}
+        }
+
+    def scan_email_statistics(self) -> Dict:
+        """扫描原表计算统计信息，用于统计计数表不存在时"""
         stats = {}
         
         # 总邮件数
@@ -99,6 +246,39 @@ class DatabaseUtils:
         
         return stats
 
+    def get_config(self, config_key: str, default: Optional[str] = None) -> Optional[str]:
+        """读取用户配置"""
+        result = self.execute_query(
+            "SELECT config_value FROM user_config WHERE config_key = ?", (config_key,)
+        )
+        if not result:
+            return default
+        return result[0]['config_value']
+    
+    def set_config(self, config_key: str, config_value: str) -> int:
+        """写入用户配置，已存在时覆盖"""
+        query = """
+        INSERT INTO user_config (config_key, config_value, created_at, updated_at)
+        VALUES (?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+        ON CONFLICT(config_key) DO UPDATE SET
+            config_value = excluded.config_value,
+            updated_at = CURRENT_TIMESTAMP
+        """
+        return self.execute_update(query, (config_key, config_value))
+
+    def get_configs_by_prefix(self, prefix: str) -> Dict[str, str]:
+        """读取键以prefix开头的全部配置"""
+        escaped = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        result = self.execute_query(
+            "SELECT config_key, config_value FROM user_config WHERE config_key LIKE ? ESCAPE '\\'",
+            (escaped + '%',)
+        )
+        return {row['config_key']: row['config_value'] for row in result}
+    
+    def delete_config(self, config_key: str) -> int:
+        """删除用户配置"""
+        return self.execute_update("DELETE FROM user_config WHERE config_key = ?", (config_key,))
+
 # 使用示例
 if __name__ == "__main__":
     db_utils = DatabaseUtils()
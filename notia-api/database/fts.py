@@ -0,0 +1,236 @@
+"""SQLite FTS5全文索引
+
+emails 和 knowledge_base 各有一张外部内容（external content）FTS5表，
+由触发器与原表保持同步。使用trigram分词器，中文无需额外分词即可
+做子串匹配。
+
+trigram无法匹配少于3个字符的词，而“会议”“项目”这类两字中文词是
+最常见的搜索。为此每张表另有一张不存内容（contentless）的二元组索引，
+触发器通过cjk_bigrams函数把中日韩文字切成相邻两字的词元后写入，
+两字及以上的中文词可在其中按短语匹配。cjk_bigrams由register_functions
+注册到每个连接上，直接用sqlite3写这两张原表的脚本也需先调用它。
+
+回填已有数据（在 notia-api 目录下）：
+    python -m database.fts [数据库路径]
+"""
+import logging
+import re
+import sqlite3
+import sys
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# trigram分词器需要SQLite 3.34及以上，否则退回unicode61
+FTS_TOKENIZERS = ("trigram", "unicode61")
+
+FTS_TABLES = {
+    "emails_fts": {
+        "source": "emails",
+        "columns": ("title", "sender", "content"),
+    },
+    "knowledge_fts": {
+        "source": "knowledge_base",
+        "columns": ("title", "content"),
+    },
+}
+
+# 二元组索引表，与FTS_TABLES一一对应
+BIGRAM_TABLES = {
+    "emails_bigram": FTS_TABLES["emails_fts"],
+    "knowledge_bigram": FTS_TABLES["knowledge_fts"],
+}
+
+# 中日韩文字：假名、CJK统一汉字（含扩展A）、兼容汉字和韩文音节
+_CJK_RUN_RE = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+')
+
+
+def cjk_bigrams(text: Optional[str]) -> Optional[str]:
+    """把文本中连续的中日韩文字切成相邻两字的词元，以空格分隔，其余文字原样保留"""
+    if not text:
+        return text
+
+    def split(match) -> str:
+        run = match.group(0)
+        if len(run) == 1:
+            return f" {run} "
+        return " " + " ".join(run[i:i + 2] for i in range(len(run) - 1)) + " "
+
+    return _CJK_RUN_RE.sub(split, text)
+
+
+def register_functions(conn):
+    """在连接上注册二元组索引触发器使用的函数"""
+    conn.create_function("cjk_bigrams", 1, cjk_bigrams, deterministic=True)
+
+
+def _fts_statements(fts_table: str, source: str, columns: Tuple[str, ...], tokenizer: str) -> List[str]:
+    column_list = ", ".join(columns)
+    new_values = ", ".join(f"new.{c}" for c in columns)
+    old_values = ", ".join(f"old.{c}" for c in columns)
+    return [
+        f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5(
+            {column_list}, content='{source}', content_rowid='id', tokenize='{tokenizer}'
+        )
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {fts_table}_ai AFTER INSERT ON {source} BEGIN
+            INSERT INTO {fts_table}(rowid, {column_list}) VALUES (new.id, {new_values});
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {fts_table}_ad AFTER DELETE ON {source} BEGIN
+            INSERT INTO {fts_table}({fts_table}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {fts_table}_au AFTER UPDATE OF {column_list} ON {source} BEGIN
+            INSERT INTO {fts_table}({fts_table}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+            INSERT INTO {fts_table}(rowid, {column_list}) VALUES (new.id, {new_values});
+        END
+        """,
+    ]
+
+
+def _bigram_statements(bigram_table: str, source: str, columns: Tuple[str, ...]) -> List[str]:
+    column_list = ", ".join(columns)
+    new_values = ", ".join(f"cjk_bigrams(new.{c})" for c in columns)
+    old_values = ", ".join(f"cjk_bigrams(old.{c})" for c in columns)
+    return [
+        # 词元已由cjk_bigrams切好，unicode61只按空白和标点切分；不存内容，删除时需提供原词元
+        f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {bigram_table} USING fts5(
+            {column_list}, content='', tokenize='unicode61'
+        )
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {bigram_table}_ai AFTER INSERT ON {source} BEGIN
+            INSERT INTO {bigram_table}(rowid, {column_list}) VALUES (new.id, {new_values});
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {bigram_table}_ad AFTER DELETE ON {source} BEGIN
+            INSERT INTO {bigram_table}({bigram_table}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {bigram_table}_au AFTER UPDATE OF {column_list} ON {source} BEGIN
+            INSERT INTO {bigram_table}({bigram_table}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+            INSERT INTO {bigram_table}(rowid, {column_list}) VALUES (new.id, {new_values});
+        END
+        """,
+    ]
+
+
+def _fill_bigram(cursor, bigram_table: str, source: str, columns: Tuple[str, ...]):
+    """不存内容的表不支持rebuild，清空后按原表内容重新写入"""
+    column_list = ", ".join(columns)
+    values = ", ".join(f"cjk_bigrams({c})" for c in columns)
+    cursor.execute(f"INSERT INTO {bigram_table}({bigram_table}) VALUES ('delete-all')")
+    cursor.execute(f"INSERT INTO {bigram_table}(rowid, {column_list}) SELECT id, {values} FROM {source}")
+
+
+def _table_exists(cursor, name: str) -> bool:
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,))
+    return cursor.fetchone() is not None
+
+
+def ensure_fts(conn) -> bool:
+    """创建全文索引表和同步触发器，返回是否新建了索引表"""
+    register_functions(conn)
+    cursor = conn.cursor()
+    created = False
+    try:
+        for fts_table, spec in FTS_TABLES.items():
+            if not _table_exists(cursor, spec["source"]):
+                continue
+            is_new = not _table_exists(cursor, fts_table)
+            for tokenizer in FTS_TOKENIZERS:
+                try:
+                    for statement in _fts_statements(fts_table, spec["source"], spec["columns"], tokenizer):
+                        cursor.execute(statement)
+                    break
+                except sqlite3.OperationalError as e:
+                    if tokenizer == FTS_TOKENIZERS[-1]:
+                        raise
+                    logger.warning("分词器 %s 不可用，尝试下一个: %s", tokenizer, e)
+            if is_new:
+                # 新建索引时把原表已有数据一并写入
+                cursor.execute(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')")
+                created = True
+        for bigram_table, spec in BIGRAM_TABLES.items():
+            if not _table_exists(cursor, spec["source"]):
+                continue
+            is_new = not _table_exists(cursor, bigram_table)
+            for statement in _bigram_statements(bigram_table, spec["source"], spec["columns"]):
+                cursor.execute(statement)
+            if is_new:
+                _fill_bigram(cursor, bigram_table, spec["source"], spec["columns"])
+                created = True
+        conn.commit()
+    finally:
+        cursor.close()
+    return created
+
+
+def rebuild_fts(conn):
+    """按原表内容重建全部全文索引"""
+    register_functions(conn)
+    cursor = conn.cursor()
+    try:
+        for fts_table in FTS_TABLES:
+            if _table_exists(cursor, fts_table):
+                cursor.execute(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')")
+                cursor.execute(f"INSERT INTO {fts_table}({fts_table}) VALUES ('optimize')")
+        for bigram_table, spec in BIGRAM_TABLES.items():
+            if _table_exists(cursor, bigram_table):
+                _fill_bigram(cursor, bigram_table, spec["source"], spec["columns"])
+                cursor.execute(f"INSERT INTO {bigram_table}({bigram_table}) VALUES ('optimize')")
+        conn.commit()
+    finally:
+        cursor.close()
+
+
+def build_match_query(query: str) -> Optional[str]:
+    """把用户输入转换为FTS5 MATCH表达式
+
+    每个词作为短语并以AND连接；trigram分词器无法匹配少于3个字符的
+    词，此时返回None，由调用方改用build_bigram_query。
+    """
+    terms = query.split()
+    if not terms or any(len(term) < 3 for term in terms):
+        return None
+    return " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def build_bigram_query(query: str) -> Optional[str]:
+    """把含短词的用户输入转换为二元组索引的MATCH表达式
+
+    每个词都是两个字以上的中日韩文字时，切成二元组后作为短语并以AND连接；
+    单字和较短的非中文词无法在二元组索引中做子串匹配，返回None，由调用方改用LIKE。
+    """
+    terms = query.split()
+    if not terms or any(len(term) < 2 or not _CJK_RUN_RE.fullmatch(term) for term in terms):
+        return None
+    return " ".join('"' + cjk_bigrams(term).strip() + '"' for term in terms)
+
+
+def main():
+    db_path = sys.argv[1] if len(sys.argv) > 1 else "notia.db"
+    conn = sqlite3.connect(db_path)
+    try:
+        if not ensure_fts(conn):
+            rebuild_fts(conn)
+        cursor = conn.cursor()
+        for fts_table in FTS_TABLES:
+            if _table_exists(cursor, fts_table):
+                cursor.execute(f"SELECT COUNT(*) FROM {fts_table}")
+                print(f"{fts_table}: {cursor.fetchone()[0]} 条")
+    finally:
+        conn.close()
+    print("全文索引回填完成！")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,95 +1,40 @@
 import sqlite3
 from datetime import datetime, timedelta
 import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database.fts import register_functions
+from database.models import create_tables
+
+# 与ORM DateTime列的存储格式一致
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
 
 def create_database():
-    """创建数据库和表"""
-    db_path = "notia.db"
-    
-    # 如果数据库文件已存在，删除它以重新创建
-    if os.path.exists(db_path):
-        os.remove(db_path)
-    
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    
-    # 创建邮件表
-    cursor.execute('''
-    CREATE TABLE emails (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        email_id VARCHAR(255) UNIQUE NOT NULL,
-        title VARCHAR(500) NOT NULL,
-        sender VARCHAR(255) NOT NULL,
-        received_time DATETIME NOT NULL,
-        content TEXT,
-        category VARCHAR(50) NOT NULL,
-        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-    )
-    ''')
-    
-    # 创建任务表
-    cursor.execute('''
-    CREATE TABLE tasks (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        email_id VARCHAR(255) NOT NULL,
-        title VARCHAR(500) NOT NULL,
-        sender VARCHAR(255) NOT NULL,
-        received_time DATETIME NOT NULL,
-        feedback_time DATETIME,
-        content TEXT,
-        feedback_content TEXT,
-        status VARCHAR(50) DEFAULT '未开始',
-        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
-    )
-    ''')
-    
-    # 创建知识库表
-    cursor.execute('''
-    CREATE TABLE knowledge_base (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        title VARCHAR(500) NOT NULL,
-        content TEXT NOT NULL,
-        source VARCHAR(255),
-        embedding BLOB,
-        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-    )
-    ''')
-    
-    # 创建用户配置表
-    cursor.execute('''
-    CREATE TABLE user_config (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        config_key VARCHAR(100) UNIQUE NOT NULL,
-        config_value TEXT,
-        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
-    )
-    ''')
-    
-    # 创建索引
-    cursor.execute('CREATE INDEX idx_emails_category ON emails(category)')
-    cursor.execute('CREATE INDEX idx_emails_sender ON emails(sender)')
-    cursor.execute('CREATE INDEX idx_emails_received_time ON emails(received_time)')
-    cursor.execute('CREATE INDEX idx_tasks_status ON tasks(status)')
-    cursor.execute('CREATE INDEX idx_tasks_feedback_time ON tasks(feedback_time)')
-    
-    conn.commit()
-    conn.close()
+    """创建数据库和表，已有数据库只执行未完成的迁移，不会删除数据"""
+    create_tables()
     print("数据库创建成功！")
 
 def insert_test_data():
     """插入测试数据"""
     conn = sqlite3.connect("notia.db")
+    # 写入邮件和知识库时触发器需要全文索引函数
+    register_functions(conn)
     cursor = conn.cursor()
     
+    cursor.execute("SELECT COUNT(*) FROM emails")
+    if cursor.fetchone()[0]:
+        conn.close()
+        print("数据库中已有邮件，跳过测试数据")
+        return
+    
     # 插入测试邮件数据
     test_emails = [
         {
             'email_id': 'email_001',
             'title': '【重要】项目进度汇报 - 需要本周五前反馈',
             'sender': 'manager@company.com',
-            'received_time': (datetime.now() - timedelta(days=2)).strftime('%Y-%m-%d %H:%M:%S'),
+            'received_time': (datetime.now() - timedelta(days=2)).strftime(TIME_FORMAT),
             'content': '请各位项目成员在本周五下午5点前提交项目进度汇报，包括已完成工作、遇到的问题和下周计划。',
             'category': '任务类'
         },
@@ -97,7 +42,7 @@ def insert_test_data():
             'email_id': 'email_002',
             'title': '技术分享会邀请 - AI在企业中的应用',
             'sender': 'hr@company.com',
-            'received_time': (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S'),
+            'received_time': (datetime.now() - timedelta(days=1)).strftime(TIME_FORMAT),
             'content': '我们将在下周三举办技术分享会，主题是"AI在企业中的应用"，欢迎大家参加。',
             'category': '资讯类'
         },
@@ -105,7 +50,7 @@ def insert_test_data():
             'email_id': 'email_003',
             'title': '客户需求确认 - 紧急',
             'sender': 'client@customer.com',
-            'received_time': (datetime.now() - timedelta(hours=6)).strftime('%Y-%m-%d %H:%M:%S'),
+            'received_time': (datetime.now() - timedelta(hours=6)).strftime(TIME_FORMAT),
             'content': '关于我们讨论的新功能需求，请在明天上午10点前确认技术方案的可行性。',
             'category': '任务类'
         },
@@ -113,7 +58,7 @@ def insert_test_data():
             'email_id': 'email_004',
             'title': '每周技术资讯 - 第45期',
             'sender': 'newsletter@techblog.com',
-            'received_time': (datetime.now() - timedelta(hours=12)).strftime('%Y-%m-%d %H:%M:%S'),
+            'received_time': (datetime.now() - timedelta(hours=12)).strftime(TIME_FORMAT),
             'content': '本期内容包括：最新的AI模型发布、云计算趋势分析、开源项目推荐等。',
             'category': '资讯类'
         },
@@ -121,7 +66,7 @@ def insert_test_data():
             'email_id': 'email_005',
             'title': '会议室预订确认',
             'sender': 'admin@company.com',
-            'received_time': (datetime.now() - timedelta(hours=3)).strftime('%Y-%m-%d %H:%M:%S'),
+            'received_time': (datetime.now() - timedelta(hours=3)).strftime(TIME_FORMAT),
             'content': '您预订的会议室A101已确认，时间：明天下午2-4点，请准时参加。',
             'category': '任务类'
         }
@@ -129,8 +74,8 @@ def insert_test_data():
     
     for email in test_emails:
         cursor.execute('''
-        INSERT INTO emails (email_id, title, sender, received_time, content, category)
-        VALUES (?, ?, ?, ?, ?, ?)
+        INSERT INTO emails (email_id, title, sender, received_time, content, category, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
         ''', (email['email_id'], email['title'], email['sender'], 
               email['received_time'], email['content'], email['category']))
     
@@ -140,8 +85,8 @@ def insert_test_data():
             'email_id': 'email_001',
             'title': '项目进度汇报',
             'sender': 'manager@company.com',
-            'received_time': (datetime.now() - timedelta(days=2)).strftime('%Y-%m-%d %H:%M:%S'),
-            'feedback_time': (datetime.now() + timedelta(days=3)).strftime('%Y-%m-%d 17:00:00'),
+            'received_time': (datetime.now() - timedelta(days=2)).strftime(TIME_FORMAT),
+            'feedback_time': (datetime.now() + timedelta(days=3)).strftime('%Y-%m-%d 17:00:00.000000'),
             'content': '请各位项目成员在本周五下午5点前提交项目进度汇报，包括已完成工作、遇到的问题和下周计划。',
             'feedback_content': '需要提交：1. 已完成工作清单 2. 遇到的问题和解决方案 3. 下周工作计划',
             'status': '进行中'
@@ -150,8 +95,8 @@ def insert_test_data():
             'email_id': 'email_003',
             'title': '客户需求确认',
             'sender': 'client@customer.com',
-            'received_time': (datetime.now() - timedelta(hours=6)).strftime('%Y-%m-%d %H:%M:%S'),
-            'feedback_time': (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d 10:00:00'),
+            'received_time': (datetime.now() - timedelta(hours=6)).strftime(TIME_FORMAT),
+            'feedback_time': (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d 10:00:00.000000'),
             'content': '关于我们讨论的新功能需求，请在明天上午10点前确认技术方案的可行性。',
             'feedback_content': '需要确认技术方案的可行性，包括技术难度、开发周期和资源需求',
             'status': '未开始'
@@ -160,8 +105,8 @@ def insert_test_data():
             'email_id': 'email_005',
             'title': '会议室预订确认',
             'sender': 'admin@company.com',
-            'received_time': (datetime.now() - timedelta(hours=3)).strftime('%Y-%m-%d %H:%M:%S'),
-            'feedback_time': (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d 14:00:00'),
+            'received_time': (datetime.now() - timedelta(hours=3)).strftime(TIME_FORMAT),
+            'feedback_time': (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d 14:00:00.000000'),
             'content': '您预订的会议室A101已确认，时间：明天下午2-4点，请准时参加。',
             'feedback_content': '参加会议室A101的会议',
             'status': '未开始'
@@ -171,8 +116,8 @@ def insert_test_data():
     for task in test_tasks:
         cursor.execute('''
         INSERT INTO tasks (email_id, title, sender, received_time, feedback_time, 
-                          content, feedback_content, status)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                          content, feedback_content, status, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
         ''', (task['email_id'], task['title'], task['sender'], task['received_time'],
               task['feedback_time'], task['content'], task['feedback_content'], task['status']))
     
@@ -197,8 +142,8 @@ def insert_test_data():
     
     for knowledge in test_knowledge:
         cursor.execute('''
-        INSERT INTO knowledge_base (title, content, source)
-        VALUES (?, ?, ?)
+        INSERT INTO knowledge_base (title, content, source, created_at)
+        VALUES (?, ?, ?, CURRENT_TIMESTAMP)
         ''', (knowledge['title'], knowledge['content'], knowledge['source']))
     
     # 插入用户配置数据
@@ -212,8 +157,8 @@ def insert_test_data():
     
     for config_key, config_value in test_configs:
         cursor.execute('''
-        INSERT INTO user_config (config_key, config_value)
-        VALUES (?, ?)
+        INSERT INTO user_config (config_key, config_value, created_at, updated_at)
+        VALUES (?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
         ''', (config_key, config_value))
     
     conn.commit()
@@ -0,0 +1,118 @@
+"""数据库结构迁移
+
+当前版本号记录在 PRAGMA user_version 中，启动时按顺序执行尚未执行的
+迁移，每个迁移在独立事务中完成并推进版本号。迁移只允许增量修改
+（补列、补索引、转换数据），不得删除表或数据。
+
+新增迁移：在 MIGRATIONS 末尾追加 (版本号, 说明, 函数)，版本号递增。
+
+手动执行（在 notia-api 目录下）：
+    python -m database.migrations [数据库路径]
+"""
+import logging
+import sqlite3
+import sys
+from typing import Callable, List, Tuple
+
+from database.models import EmailCategory, TaskStatus
+
+logger = logging.getLogger(__name__)
+
+
+def _table_exists(cursor, name: str) -> bool:
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,))
+    return cursor.fetchone() is not None
+
+
+def _enum_names_to_values(cursor):
+    """早期ORM按枚举名（TASK等）存储，统一改为中文取值"""
+    for table, column, enum_cls in (("emails", "category", EmailCategory),
+                                    ("tasks", "status", TaskStatus)):
+        if not _table_exists(cursor, table):
+            continue
+        for member in enum_cls:
+            cursor.execute(f"UPDATE {table} SET {column} = ? WHERE {column} = ?", (member.value, member.name))
+
+
+def _normalize_timestamps(cursor):
+    """init_db写入的时间不带微秒，统一为ORM的存储格式，保证按字符串比较和排序正确"""
+    for table, columns in (("emails", ("received_time", "created_at")),
+                           ("tasks", ("received_time", "feedback_time", "created_at", "updated_at"))):
+        if not _table_exists(cursor, table):
+            continue
+        for column in columns:
+            cursor.execute(f"UPDATE {table} SET {column} = {column} || '.000000' WHERE length({column}) = 19")
+
+
+def _composite_indexes(cursor):
+    """按实际查询形态建立复合索引，并删除被其覆盖的单列索引"""
+    if _table_exists(cursor, "emails"):
+        for name in ("idx_emails_category", "idx_emails_received_time", "idx_emails_sender", "ix_emails_sender"):
+            cursor.execute(f"DROP INDEX IF EXISTS {name}")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_emails_received_id ON emails(received_time DESC, id DESC)")
+        cursor.execute("""CREATE INDEX IF NOT EXISTS idx_emails_category_received
+                          ON emails(category, received_time DESC, id DESC)""")
+        cursor.execute("""CREATE INDEX IF NOT EXISTS idx_emails_sender_received
+                          ON emails(sender, received_time DESC, id DESC)""")
+    if _table_exists(cursor, "tasks"):
+        for name in ("idx_tasks_status", "idx_tasks_feedback_time"):
+            cursor.execute(f"DROP INDEX IF EXISTS {name}")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_received_id ON tasks(received_time DESC, id DESC)")
+        cursor.execute("""CREATE INDEX IF NOT EXISTS idx_tasks_status_received
+                          ON tasks(status, received_time DESC, id DESC)""")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status_feedback ON tasks(status, feedback_time)")
+    cursor.execute("ANALYZE")
+
+
+MIGRATIONS: List[Tuple[int, str, Callable]] = [
+    (1, "枚举列统一存储中文取值", _enum_names_to_values),
+    (2, "时间列统一存储格式", _normalize_timestamps),
+    (3, "列表分页和任务查询的复合索引", _composite_indexes),
+]
+
+
+def get_version(conn) -> int:
+    cursor = conn.cursor()
+    try:
+        cursor.execute("PRAGMA user_version")
+        return cursor.fetchone()[0]
+    finally:
+        cursor.close()
+
+
+def migrate(conn) -> int:
+    """执行所有未执行的迁移，返回迁移后的版本号"""
+    version = get_version(conn)
+    conn.commit()
+    for target, description, apply in MIGRATIONS:
+        if target <= version:
+            continue
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN")
+            apply(cursor)
+            cursor.execute(f"PRAGMA user_version = {target}")
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.error("数据库迁移 %s（%s）失败: %s", target, description, e)
+            raise
+        finally:
+            cursor.close()
+        logger.info("数据库已迁移到版本 %s: %s", target, description)
+        version = target
+    return version
+
+
+def main():
+    db_path = sys.argv[1] if len(sys.argv) > 1 else "notia.db"
+    conn = sqlite3.connect(db_path)
+    try:
+        print(f"当前版本: {get_version(conn)}")
+        print(f"迁移后版本: {migrate(conn)}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
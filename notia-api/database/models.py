@@ -1,11 +1,7 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, Enum
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine
+from sqlalchemy import Column, Integer, String, DateTime, Text, Enum, Float, LargeBinary, Index
 import enum
 from datetime import datetime
-
-Base = declarative_base()
+from database.config import Base, engine, SessionLocal, get_db
 
 class EmailCategory(enum.Enum):
     NEWS = "资讯类"
@@ -17,16 +13,20 @@ class TaskStatus(enum.Enum):
     IN_PROGRESS = "进行中"
     COMPLETED = "已完成"
 
+def _enum_values(enum_cls):
+    """枚举列存储中文取值，与init_db和原生SQL查询保持一致"""
+    return [member.value for member in enum_cls]
+
 class Email(Base):
     __tablename__ = "emails"
     
     id = Column(Integer, primary_key=True, index=True)
     email_id = Column(String, unique=True, index=True)
     title = Column(String, index=True)
-    sender = Column(String, index=True)
+    sender = Column(String)
     received_time = Column(DateTime, default=datetime.utcnow)
     content = Column(Text)
-    category = Column(Enum(EmailCategory))
+    category = Column(Enum(EmailCategory, values_callable=_enum_values, native_enum=False, length=50))
     created_at = Column(DateTime, default=datetime.utcnow)
 
 class Task(Base):
@@ -40,21 +40,61 @@ class Task(Base):
     feedback_time = Column(DateTime, nullable=True)
     content = Column(Text)
     feedback_content = Column(Text, nullable=True)
-    status = Column(Enum(TaskStatus), default=TaskStatus.NOT_STARTED)
+    status = Column(Enum(TaskStatus, values_callable=_enum_values, native_enum=False, length=50),
+                    default=TaskStatus.NOT_STARTED)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class KnowledgeBase(Base):
+    __tablename__ = "knowledge_base"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    title = Column(String(500), nullable=False)
+    content = Column(Text, nullable=False)
+    source = Column(String(255))
+    embedding = Column(LargeBinary)  # float32向量
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class UserConfig(Base):
+    __tablename__ = "user_config"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    config_key = Column(String(100), unique=True, nullable=False)
+    config_value = Column(Text)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
-# 数据库连接
-DATABASE_URL = "sqlite:///./notia.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+class ClassificationCacheEntry(Base):
+    __tablename__ = "classification_cache"
+    
+    cache_key = Column(String(40), primary_key=True)
+    category = Column(String, nullable=False)
+    hit_count = Column(Integer, default=0)
+    created_at = Column(Float, nullable=False)
+    last_used_at = Column(Float, nullable=False, index=True)
 
-def create_tables():
-    Base.metadata.create_all(bind=engine)
+# 与查询形态对应的复合索引，已有数据库由 database/migrations.py 补建
+# 列表分页：ORDER BY received_time DESC, id DESC，可带分类/发件人/状态过滤
+Index("idx_emails_received_id", Email.received_time.desc(), Email.id.desc())
+Index("idx_emails_category_received", Email.category, Email.received_time.desc(), Email.id.desc())
+Index("idx_emails_sender_received", Email.sender, Email.received_time.desc(), Email.id.desc())
+Index("idx_tasks_received_id", Task.received_time.desc(), Task.id.desc())
+Index("idx_tasks_status_received", Task.status, Task.received_time.desc(), Task.id.desc())
+# 待处理和过期任务：status IN (...) [AND feedback_time < ?] ORDER BY feedback_time
+Index("idx_tasks_status_feedback", Task.status, Task.feedback_time)
 
-def get_db():
-    db = SessionLocal()
+def create_tables(bind=None):
+    bind = bind or engine
+    Base.metadata.create_all(bind=bind)
+    
+    # 结构迁移、全文索引、统计计数表及其触发器不在ORM中定义，单独执行
+    from database.fts import ensure_fts
+    from database.migrations import migrate
+    from database.stats import ensure_stats
+    conn = bind.raw_connection()
     try:
-        yield db
+        migrate(conn)
+        ensure_fts(conn)
+        ensure_stats(conn)
     finally:
-        db.close()
\ No newline at end of file
+        conn.close()
@@ -0,0 +1,75 @@
+import base64
+import json
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Query
+
+# 单页最多返回的条数
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(received_time: Optional[datetime], row_id: int) -> str:
+    """把排序键编码为不透明的游标字符串"""
+    raw = json.dumps([received_time.isoformat() if received_time else None, row_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], int]:
+    """解析游标，received_time为空的行对应的游标时间为None，格式错误时抛出ValueError"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        received_time, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return (datetime.fromisoformat(received_time) if received_time is not None else None), int(row_id)
+    except Exception as e:
+        raise ValueError(f"无效的游标: {cursor}") from e
+
+
+def parse_fields(model, fields: Optional[str], default_fields: Sequence[str]) -> List[str]:
+    """解析fields参数，未指定时使用列表视图的默认字段"""
+    if not fields:
+        selected = list(default_fields)
+    else:
+        selected = [f.strip() for f in fields.split(",") if f.strip()]
+    columns = model.__table__.columns.keys()
+    unknown = [f for f in selected if f not in columns]
+    if unknown:
+        raise ValueError(f"未知字段: {', '.join(unknown)}")
+    # 游标需要排序键
+    for key in ("id", "received_time"):
+        if key not in selected:
+            selected.append(key)
+    return selected
+
+
+def keyset_page(query: Query, model, limit: int, cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+    """按(received_time, id)倒序做键集分页
+
+    与OFFSET分页不同，翻到后面的页也只需沿索引定位，不会扫描前面
+    已经返回过的行。received_time为空的行在倒序中排在最后，按id继续分页。
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    def page(*filters, size: int):
+        return query.filter(*filters).order_by(model.received_time.desc(), model.id.desc()).limit(size).all()
+
+    if not cursor:
+        rows = page(size=limit + 1)
+    else:
+        received_time, row_id = decode_cursor(cursor)
+        if received_time is None:
+            rows = page(model.received_time.is_(None), model.id < row_id, size=limit + 1)
+        else:
+            # 行值比较可直接沿(received_time, id)复合索引定位，但不匹配received_time为空的行；
+            # 这些行排在最后，本页不满时单独按索引补上，不用OR以免规划器放弃索引顺序
+            rows = page(tuple_(model.received_time, model.id) < (received_time, row_id), size=limit + 1)
+            if len(rows) <= limit:
+                rows += page(model.received_time.is_(None), size=limit + 1 - len(rows))
+    items = [dict(row._mapping) for row in rows[:limit]]
+
+    next_cursor = None
+    if len(rows) > limit:
+        last = items[-1]
+        next_cursor = encode_cursor(last["received_time"], last["id"])
+    return items, next_cursor
@@ -0,0 +1,140 @@
+"""增量维护的统计计数
+
+stats_counters 表按 (scope, bucket) 保存计数，由 emails 和 tasks 上的
+触发器在写入时同步加减，统计接口直接读取计数而不必扫描原表。
+
+    scope           bucket
+    emails          ''（邮件总数）
+    email_category  分类
+    email_day       接收日期 YYYY-MM-DD
+    email_sender    发件人
+    task_status     任务状态
+
+重建计数（在 notia-api 目录下）：
+    python -m database.stats [数据库路径]
+"""
+import sqlite3
+import sys
+from typing import List, Tuple
+
+# 每个统计维度：(scope, 来源表, 分桶表达式，其中的{row}替换为new或old)
+STATS_DIMENSIONS: List[Tuple[str, str, str]] = [
+    ("emails", "emails", "''"),
+    ("email_category", "emails", "COALESCE({row}.category, '')"),
+    ("email_day", "emails", "COALESCE(date({row}.received_time), '')"),
+    ("email_sender", "emails", "COALESCE({row}.sender, '')"),
+    ("task_status", "tasks", "COALESCE({row}.status, '')"),
+]
+
+# 触发更新计数的列
+STATS_UPDATE_COLUMNS = {
+    "emails": ("category", "received_time", "sender"),
+    "tasks": ("status",),
+}
+
+CREATE_STATS_TABLE = """
+CREATE TABLE IF NOT EXISTS stats_counters (
+    scope TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (scope, bucket)
+) WITHOUT ROWID
+"""
+
+CREATE_STATS_INDEX = "CREATE INDEX IF NOT EXISTS idx_stats_counters_scope_count ON stats_counters(scope, count)"
+
+
+def _increment(scope: str, bucket: str) -> str:
+    return f"""
+            INSERT INTO stats_counters(scope, bucket, count) VALUES ('{scope}', {bucket}, 1)
+            ON CONFLICT(scope, bucket) DO UPDATE SET count = count + 1;"""
+
+
+def _decrement(scope: str, bucket: str) -> str:
+    return f"""
+            UPDATE stats_counters SET count = count - 1 WHERE scope = '{scope}' AND bucket = {bucket};
+            DELETE FROM stats_counters WHERE scope = '{scope}' AND bucket = {bucket} AND count <= 0;"""
+
+
+def _trigger_statements(source: str) -> List[str]:
+    dimensions = [(scope, expr) for scope, table, expr in STATS_DIMENSIONS if table == source]
+    inserts = "".join(_increment(scope, expr.format(row="new")) for scope, expr in dimensions)
+    deletes = "".join(_decrement(scope, expr.format(row="old")) for scope, expr in dimensions)
+    # 更新时只调整分桶会变化的维度，总数不变
+    changing = [(scope, expr) for scope, expr in dimensions if "{row}" in expr]
+    updates = "".join(
+        _decrement(scope, expr.format(row="old")) + _increment(scope, expr.format(row="new"))
+        for scope, expr in changing
+    )
+    columns = ", ".join(STATS_UPDATE_COLUMNS[source])
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {source}_stats_ai AFTER INSERT ON {source} BEGIN{inserts}\n        END",
+        f"CREATE TRIGGER IF NOT EXISTS {source}_stats_ad AFTER DELETE ON {source} BEGIN{deletes}\n        END",
+        f"CREATE TRIGGER IF NOT EXISTS {source}_stats_au AFTER UPDATE OF {columns} ON {source} BEGIN{updates}\n        END",
+    ]
+
+
+def _table_exists(cursor, name: str) -> bool:
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,))
+    return cursor.fetchone() is not None
+
+
+def _backfill(cursor):
+    cursor.execute("DELETE FROM stats_counters")
+    for scope, source, expr in STATS_DIMENSIONS:
+        if not _table_exists(cursor, source):
+            continue
+        bucket = expr.format(row=source)
+        cursor.execute(f"""
+        INSERT INTO stats_counters(scope, bucket, count)
+        SELECT '{scope}', {bucket}, COUNT(*) FROM {source} GROUP BY 2 HAVING COUNT(*) > 0
+        """)
+
+
+def ensure_stats(conn) -> bool:
+    """创建统计表和维护触发器，返回是否新建了统计表"""
+    cursor = conn.cursor()
+    try:
+        is_new = not _table_exists(cursor, "stats_counters")
+        cursor.execute(CREATE_STATS_TABLE)
+        cursor.execute(CREATE_STATS_INDEX)
+        for source in STATS_UPDATE_COLUMNS:
+            if _table_exists(cursor, source):
+                for statement in _trigger_statements(source):
+                    cursor.execute(statement)
+        if is_new:
+            # 新建统计表时按原表已有数据计算初始值
+            _backfill(cursor)
+        conn.commit()
+    finally:
+        cursor.close()
+    return is_new
+
+
+def rebuild_stats(conn):
+    """按原表内容重新计算全部计数"""
+    cursor = conn.cursor()
+    try:
+        _backfill(cursor)
+        conn.commit()
+    finally:
+        cursor.close()
+
+
+def main():
+    db_path = sys.argv[1] if len(sys.argv) > 1 else "notia.db"
+    conn = sqlite3.connect(db_path)
+    try:
+        if not ensure_stats(conn):
+            rebuild_stats(conn)
+        cursor = conn.cursor()
+        cursor.execute("SELECT scope, COUNT(*), SUM(count) FROM stats_counters GROUP BY scope")
+        for scope, buckets, total in cursor.fetchall():
+            print(f"{scope}: {buckets} 个分桶，共 {total} 条")
+    finally:
+        conn.close()
+    print("统计计数重建完成！")
+
+
+if __name__ == "__main__":
+    main()
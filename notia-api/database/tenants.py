@@ -0,0 +1,56 @@
+"""按租户（邮箱账户）分库
+
+每个账户的邮件、任务和同步状态写入独立的SQLite文件，一个大邮箱的
+写入不会占用其他账户的写锁，单个库的体积也随账户数线性拆分。
+主库 notia.db 只保存账户配置、知识库等全局数据。
+"""
+import os
+import re
+import threading
+from typing import Set
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+
+from database.config import get_engine, get_sessionmaker
+
+# 租户数据库所在目录，可通过环境变量覆盖
+TENANT_CONFIG = {
+    "dir": os.environ.get("NOTIA_TENANT_DIR", "tenants"),
+}
+
+_TENANT_NAME_RE = re.compile(r'^[A-Za-z0-9_-][A-Za-z0-9_.-]{0,63}$')
+
+_initialized: Set[str] = set()
+_init_lock = threading.Lock()
+
+
+def validate_tenant_name(name: str) -> str:
+    """租户名直接用作文件名，只允许字母、数字和 _ . -"""
+    if not name or not _TENANT_NAME_RE.match(name):
+        raise ValueError(f"无效的账户名: {name}")
+    return name
+
+
+def tenant_db_path(name: str) -> str:
+    return os.path.abspath(os.path.join(TENANT_CONFIG["dir"], f"{validate_tenant_name(name)}.db"))
+
+
+def get_tenant_engine(name: str) -> Engine:
+    """获取租户数据库的引擎，首次使用时建表并执行迁移"""
+    db_path = tenant_db_path(name)
+    engine = get_engine(db_path)
+    if db_path not in _initialized:
+        with _init_lock:
+            if db_path not in _initialized:
+                from database.models import create_tables
+
+                os.makedirs(os.path.dirname(db_path), exist_ok=True)
+                create_tables(engine)
+                _initialized.add(db_path)
+    return engine
+
+
+def get_tenant_sessionmaker(name: str) -> sessionmaker:
+    get_tenant_engine(name)
+    return get_sessionmaker(tenant_db_path(name))
@@ -1,16 +1,66 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from sqlalchemy.orm import Session
-from database.models import create_tables, get_db, Email, Task, TaskStatus
+from database.models import create_tables, get_db, Email, Task, TaskStatus, EmailCategory
+from database.pagination import keyset_page, parse_fields
+from database.tenants import get_tenant_sessionmaker
 from services.email_service import EmailService
-from services.model_service import ModelService
+from services.imap_connection import IMAPConnectionManager, IMAPIdleWatcher
+from services.email_pipeline import EmailPipeline, PipelineJobManager
+from services.account_service import AccountStore, EmailAccount
+from services.account_scheduler import AccountScheduler
+from services.model_service import get_model_service
 from services.knowledge_service import KnowledgeService
-from typing import List, Dict
-import os
+from services.retrieval_service import RetrievalService
+from services.classification_cache import get_classification_cache
+from services.email_classifier import get_email_classifier
+from services.executors import get_executor, run_in_executor, shutdown_executors
+from services.logging_config import setup_logging
+from services.metrics import CONTENT_TYPE, render_metrics
+from services.tracing import TraceMiddleware
+from database.db_utils import DatabaseUtils
+from typing import List, Dict, Optional
+from contextlib import asynccontextmanager
+import json
+import threading
+import time
 from datetime import datetime
 
+setup_logging()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：初始化数据库，在后台加载模型，启动和关闭后台邮件监听及多账户同步
+
+    模型加载可能需要数十秒，不等待其完成，非模型接口在数据库初始化后即可使用，
+    模型相关接口在模型就绪前返回503。
+    """
+    await run_in_executor("db", create_tables)
+    app.state.database_ready = True
+    model_service.start_loading()
+
+    watcher = None
+    if is_email_configured() and EMAIL_CONFIG["idle"]:
+        pipeline = get_email_pipeline()
+        watcher = IMAPIdleWatcher(
+            pipeline.email_service.connection_manager,
+            lambda: pipeline_jobs.run(pipeline),
+            poll_interval=EMAIL_CONFIG["poll_interval"]
+        )
+        watcher.start()
+    # 启动时为每个账户建库和迁移，停止时等待调度线程退出，都不在事件循环中执行
+    await run_in_executor("db", account_scheduler.start)
+    yield
+    await run_in_executor("db", account_scheduler.stop)
+    if watcher:
+        watcher.stop()
+    if imap_manager:
+        imap_manager.close()
+    shutdown_executors(wait=False)
+
 # 创建FastAPI应用
-app = FastAPI(title="Notia智能邮件助手", version="1.0.0")
+app = FastAPI(title="Notia智能邮件助手", version="1.0.0", lifespan=lifespan)
 
 # 添加CORS中间件
 app.add_middleware(
@@ -21,88 +71,364 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 初始化数据库
-create_tables()
+# 请求级追踪和耗时指标，放在最外层以计入其他中间件的耗时
+app.add_middleware(TraceMiddleware)
 
-# 初始化服务
-model_service = ModelService()
+# 初始化服务，数据库表和模型在lifespan中初始化
+db_utils = DatabaseUtils()
+model_service = get_model_service()
 knowledge_service = KnowledgeService()
+retrieval_service = RetrievalService(knowledge_service, model_service)
+
+# 列表接口未指定fields时返回的字段，不含正文等大字段
+EMAIL_LIST_FIELDS = ("id", "email_id", "title", "sender", "received_time", "category")
+TASK_LIST_FIELDS = ("id", "email_id", "title", "sender", "received_time", "feedback_time", "status")
 
 # 邮件服务配置（需要用户配置）
 EMAIL_CONFIG = {
     "imap_server": "imap.yeah.net",  # 示例配置
     "email_addr": "",  # 需要用户配置
-    "password": ""     # 需要用户配置
+    "password": "",    # 需要用户配置
+    "batch_size": 100, # 每次批量获取的邮件数量
+    "idle": True,      # 是否通过IMAP IDLE实时接收新邮件
+    "poll_interval": 300, # 服务器不支持IDLE时的轮询间隔（秒）
+    "parse_workers": 2,   # 邮件解析线程数
+    "model_concurrency": 8,  # 同时进行分类推理的最大数量，与模型批大小一致时批处理效果最好
+    "max_concurrent_accounts": 4  # 多账户时同时同步的账户数
 }
 
+# 流式聊天配置
+STREAM_CONFIG = {
+    "disconnect_check_seconds": 1.0,  # 等待新文本超过该秒数时检查客户端是否已断开
+}
+
+# 多账户：账户配置保存在user_config表中，每个账户的邮件写入各自的数据库
+account_store = AccountStore(db_utils)
+
+# 应用级共享的IMAP连接和邮件服务，避免每次请求重新登录
+imap_manager: Optional[IMAPConnectionManager] = None
+email_service: Optional[EmailService] = None
+email_pipeline: Optional[EmailPipeline] = None
+pipeline_jobs = PipelineJobManager(executor=get_executor("imap"))
+account_scheduler = AccountScheduler(
+    account_store, pipeline_jobs,
+    max_concurrent=EMAIL_CONFIG["max_concurrent_accounts"],
+    pipeline_options={
+        "parse_workers": EMAIL_CONFIG["parse_workers"],
+        "model_concurrency": EMAIL_CONFIG["model_concurrency"]
+    }
+)
+
+def is_email_configured() -> bool:
+    return bool(EMAIL_CONFIG["email_addr"] and EMAIL_CONFIG["password"])
+
+def get_email_service() -> EmailService:
+    """获取共享的邮件服务"""
+    global imap_manager, email_service
+    if email_service is None:
+        imap_manager = IMAPConnectionManager(
+            EMAIL_CONFIG["imap_server"],
+            EMAIL_CONFIG["email_addr"],
+            EMAIL_CONFIG["password"]
+        )
+        email_service = EmailService(
+            EMAIL_CONFIG["imap_server"],
+            EMAIL_CONFIG["email_addr"],
+            EMAIL_CONFIG["password"],
+            batch_size=EMAIL_CONFIG["batch_size"],
+            connection_manager=imap_manager
+        )
+    return email_service
+
+def get_account_db_utils(account: Optional[str] = None) -> DatabaseUtils:
+    """按account参数选择数据库，未指定时使用主库"""
+    if not account:
+        return db_utils
+    return DatabaseUtils(get_account(account).db_path)
+
+def get_account(name: str) -> EmailAccount:
+    try:
+        account = account_store.get(name)
+    except ValueError:
+        account = None
+    if account is None:
+        raise HTTPException(status_code=404, detail="账户不存在")
+    return account
+
+def get_account_db(account: Optional[str] = None):
+    """数据库会话依赖，带account参数时使用该账户的数据库"""
+    if not account:
+        yield from get_db()
+        return
+    db = get_tenant_sessionmaker(get_account(account).name)()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def get_email_pipeline() -> EmailPipeline:
+    """获取共享的邮件处理流水线"""
+    global email_pipeline
+    if email_pipeline is None:
+        email_pipeline = EmailPipeline(
+            get_email_service(),
+            parse_workers=EMAIL_CONFIG["parse_workers"],
+            model_concurrency=EMAIL_CONFIG["model_concurrency"]
+        )
+    return email_pipeline
+
+def require_model():
+    """模型相关接口的依赖，模型未就绪时返回503"""
+    if model_service.status == "failed":
+        raise HTTPException(status_code=503, detail=f"模型加载失败: {model_service.load_error}")
+    if not model_service.is_ready:
+        raise HTTPException(status_code=503, detail="模型正在加载，请稍后重试", headers={"Retry-After": "5"})
+
 @app.get("/")
 async def root():
     return {"message": "Notia智能邮件助手API"}
 
+@app.get("/health/live")
+async def health_live():
+    """存活检查，进程能处理请求即为存活"""
+    return {"status": "ok"}
+
+@app.get("/health/ready")
+async def health_ready(model: bool = False):
+    """就绪检查，数据库初始化完成即可提供非模型接口；model=true时还要求模型已加载"""
+    database_ready = getattr(app.state, "database_ready", False)
+    ready = database_ready and (model_service.is_ready or not model)
+    body = {
+        "status": "ready" if ready else "not_ready",
+        "database": database_ready,
+        "model": model_service.status
+    }
+    return JSONResponse(body, status_code=200 if ready else 503)
+
+def list_page(db: Session, model, default_fields, fields: Optional[str], filters: List,
+              limit: int, cursor: Optional[str]) -> Dict:
+    """按字段投影和过滤条件查询一页记录"""
+    try:
+        selected = parse_fields(model, fields, default_fields)
+        query = db.query(*[getattr(model, name) for name in selected]).filter(*filters)
+        items, next_cursor = keyset_page(query, model, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"items": items, "next_cursor": next_cursor}
+
+def parse_enum(enum_cls, value: str):
+    """把接口传入的中文取值转换为枚举"""
+    try:
+        return enum_cls(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"无效的取值: {value}")
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus格式的运行指标"""
+    return Response(render_metrics(), media_type=CONTENT_TYPE)
+
 @app.get("/api/emails")
-async def get_emails(db: Session = Depends(get_db)):
-    """获取邮件列表"""
-    emails = db.query(Email).order_by(Email.received_time.desc()).limit(50).all()
-    return emails
+async def get_emails(category: Optional[str] = None, sender: Optional[str] = None,
+                     since: Optional[datetime] = None, until: Optional[datetime] = None,
+                     fields: Optional[str] = None, limit: int = 50, cursor: Optional[str] = None,
+                     db: Session = Depends(get_account_db)):
+    """分页获取邮件列表，默认不返回正文"""
+    filters = []
+    if category:
+        filters.append(Email.category == parse_enum(EmailCategory, category))
+    if sender:
+        filters.append(Email.sender == sender)
+    if since:
+        filters.append(Email.received_time >= since)
+    if until:
+        filters.append(Email.received_time < until)
+    return await run_in_executor("db", list_page, db, Email, EMAIL_LIST_FIELDS, fields, filters, limit, cursor)
+
+@app.get("/api/emails/search")
+async def search_emails(q: str, limit: int = 20, account: Optional[str] = None):
+    """全文搜索邮件"""
+    account_db = await run_in_executor("db", get_account_db_utils, account)
+    results = await run_in_executor("db", account_db.search_emails, q, min(limit, 100))
+    return {"results": results}
 
 @app.get("/api/tasks")
-async def get_tasks(db: Session = Depends(get_db)):
-    """获取任务列表"""
-    tasks = db.query(Task).order_by(Task.received_time.desc()).all()
-    return tasks
+async def get_tasks(status: Optional[str] = None, sender: Optional[str] = None,
+                    since: Optional[datetime] = None, until: Optional[datetime] = None,
+                    fields: Optional[str] = None, limit: int = 50, cursor: Optional[str] = None,
+                    db: Session = Depends(get_account_db)):
+    """分页获取任务列表，默认不返回正文和反馈内容"""
+    filters = []
+    if status:
+        filters.append(Task.status == parse_enum(TaskStatus, status))
+    if sender:
+        filters.append(Task.sender == sender)
+    if since:
+        filters.append(Task.received_time >= since)
+    if until:
+        filters.append(Task.received_time < until)
+    return await run_in_executor("db", list_page, db, Task, TASK_LIST_FIELDS, fields, filters, limit, cursor)
 
 @app.put("/api/tasks/{task_id}")
-async def update_task(task_id: int, status: str, db: Session = Depends(get_db)):
+async def update_task(task_id: int, status: str, db: Session = Depends(get_account_db)):
     """更新任务状态"""
-    task = db.query(Task).filter(Task.id == task_id).first()
-    if not task:
-        raise HTTPException(status_code=404, detail="任务不存在")
-    
-    task.status = TaskStatus(status)
-    task.updated_at = datetime.utcnow()
-    db.commit()
+    def update():
+        task = db.query(Task).filter(Task.id == task_id).first()
+        if not task:
+            raise HTTPException(status_code=404, detail="任务不存在")
+        
+        task.status = TaskStatus(status)
+        task.updated_at = datetime.utcnow()
+        db.commit()
     
+    await run_in_executor("db", update)
     return {"message": "任务状态更新成功"}
 
-@app.post("/api/chat")
+@app.post("/api/chat", dependencies=[Depends(require_model)])
 async def chat(message: dict):
-    """聊天接口"""
+    """聊天接口，先检索知识库再生成回答"""
+    user_message = message.get("message", "")
+    
+    start = time.perf_counter()
+    retrieval = await run_in_executor("db", retrieval_service.retrieve, user_message)
+    prompt = retrieval_service.build_prompt(user_message, retrieval)
+    retrieved = time.perf_counter()
+    
+    # 使用模型生成响应，推理在模型线程池中执行
+    response = await run_in_executor("model", model_service.generate_response, prompt)
+    generated = time.perf_counter()
+    
+    return {
+        "response": response,
+        "sources": retrieval["sources"],
+        "timings": {
+            "retrieval_ms": round((retrieved - start) * 1000, 2),
+            "generation_ms": round((generated - retrieved) * 1000, 2),
+            "context_tokens": retrieval["context_tokens"],
+            "retrieval_cached": retrieval["cached"]
+        }
+    }
+
+@app.post("/api/chat/stream", dependencies=[Depends(require_model)])
+async def chat_stream(message: dict, request: Request):
+    """流式聊天接口，以Server-Sent Events逐段返回生成内容"""
     user_message = message.get("message", "")
     
-    # 使用模型生成响应
-    response = model_service.generate_response(user_message)
+    async def event_stream():
+        start = time.perf_counter()
+        retrieval = await run_in_executor("db", retrieval_service.retrieve, user_message)
+        prompt = retrieval_service.build_prompt(user_message, retrieval)
+        retrieved = time.perf_counter()
+        yield f"event: sources\ndata: {json.dumps(retrieval['sources'], ensure_ascii=False)}\n\n"
+        
+        stop_event = threading.Event()
+        # 推理在model线程池中执行，等待文本时不占用线程；长时间没有新文本时也检查客户端是否断开
+        tokens = model_service.stream_response(
+            prompt, stop_event=stop_event, idle_timeout=STREAM_CONFIG["disconnect_check_seconds"]
+        )
+        first_token = None
+        try:
+            async for token in tokens:
+                if await request.is_disconnected():
+                    break
+                if token is None:
+                    continue
+                if first_token is None:
+                    first_token = time.perf_counter()
+                yield f"data: {json.dumps({'token': token}, ensure_ascii=False)}\n\n"
+            
+            finished = time.perf_counter()
+            timings = {
+                "retrieval_ms": round((retrieved - start) * 1000, 2),
+                "first_token_ms": round(((first_token or finished) - retrieved) * 1000, 2),
+                "generation_ms": round((finished - retrieved) * 1000, 2),
+                "context_tokens": retrieval["context_tokens"]
+            }
+            yield f"event: done\ndata: {json.dumps(timings)}\n\n"
+        finally:
+            # 客户端断开或请求被取消时停止生成
+            stop_event.set()
+            await tokens.aclose()
     
-    return {"response": response}
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @app.get("/api/search")
 async def search_knowledge(query: str):
     """知识库搜索"""
-    results = knowledge_service.search(query)
+    results = await run_in_executor("db", knowledge_service.search, query)
     return {"results": results}
 
 @app.post("/api/process-emails")
 async def process_emails():
-    """手动处理邮件"""
-    if not EMAIL_CONFIG["email_addr"] or not EMAIL_CONFIG["password"]:
+    """手动处理邮件，立即返回任务ID"""
+    if not is_email_configured():
         raise HTTPException(status_code=400, detail="邮件配置未完成")
     
-    email_service = EmailService(
-        EMAIL_CONFIG["imap_server"],
-        EMAIL_CONFIG["email_addr"],
-        EMAIL_CONFIG["password"]
-    )
-    
-    processed_emails = email_service.process_new_emails()
-    return {"processed_count": len(processed_emails), "emails": processed_emails}
+    job = pipeline_jobs.submit(get_email_pipeline())
+    return {"job_id": job.job_id, "status": job.status}
+
+@app.get("/api/process-emails/{job_id}")
+async def get_process_job(job_id: str):
+    """查询邮件处理任务进度"""
+    job = pipeline_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job.to_dict()
 
 @app.get("/api/statistics")
-async def get_statistics():
+async def get_statistics(account: Optional[str] = None):
     """获取统计信息"""
-    from database.db_utils import DatabaseUtils
-    db_utils = DatabaseUtils()
-    stats = db_utils.get_email_statistics()
+    account_db = await run_in_executor("db", get_account_db_utils, account)
+    stats = await run_in_executor("db", account_db.get_email_statistics)
+    stats['classification_cache'] = get_classification_cache().stats()
+    stats['classifier'] = get_email_classifier().stats()
     return stats
 
+@app.get("/api/accounts")
+async def list_accounts():
+    """获取邮箱账户及其同步状态"""
+    accounts = await run_in_executor("db", account_store.list_accounts)
+    status = {item["name"]: item for item in account_scheduler.status()}
+    return [dict(account.to_dict(), sync=status.get(account.name)) for account in accounts]
+
+@app.put("/api/accounts/{name}")
+async def save_account(name: str, account_data: dict):
+    """新增或修改邮箱账户，密码留空或传******时保留原密码；返回内容不含密码"""
+    def save():
+        existing = account_store.get(name)
+        if existing and account_data.get("password") in (None, "", "******"):
+            account_data["password"] = existing.password
+        account = EmailAccount.from_dict(name, account_data)
+        account_store.save(account)
+        return account
+
+    try:
+        account = await run_in_executor("db", save)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    await run_in_executor("db", account_scheduler.reload)
+    return account.to_dict()
+
+@app.delete("/api/accounts/{name}")
+async def delete_account(name: str):
+    """删除邮箱账户，已同步的邮件数据保留"""
+    if not await run_in_executor("db", account_store.delete, name):
+        raise HTTPException(status_code=404, detail="账户不存在")
+    await run_in_executor("db", account_scheduler.reload)
+    return {"message": "账户已删除"}
+
+@app.post("/api/accounts/{name}/sync")
+async def sync_account(name: str):
+    """立即同步指定账户，立即返回任务ID"""
+    job = account_scheduler.sync_now(name)
+    if job is None:
+        raise HTTPException(status_code=409, detail="账户不存在、未启用或正在同步")
+    return {"job_id": job.job_id, "status": job.status}
+
 @app.post("/api/knowledge")
 async def add_knowledge(knowledge_data: dict):
     """添加知识"""
@@ -110,7 +436,7 @@ async def add_knowledge(knowledge_data: dict):
     content = knowledge_data.get("content", "")
     source = knowledge_data.get("source", "用户添加")
     
-    success = knowledge_service.add_knowledge(title, content, source)
+    success = await run_in_executor("db", knowledge_service.add_knowledge, title, content, source)
     if success:
         return {"message": "知识添加成功"}
     else:
@@ -119,7 +445,7 @@ async def add_knowledge(knowledge_data: dict):
 @app.get("/api/knowledge")
 async def get_knowledge():
     """获取知识库"""
-    knowledge_list = knowledge_service.get_all_knowledge()
+    knowledge_list = await run_in_executor("db", knowledge_service.get_all_knowledge)
     return knowledge_list
 
 if __name__ == "__main__":
@@ -1,15 +1,5 @@
-import openvino_genai as ov_genai
 import sys
 
-model_dir = r'C:\Users\zangq\Repo\model\OpenVINO\Qwen3-1.7B-int4-ov'
-print(f"Loading model from {model_dir}\n")
-
-
-pipe = ov_genai.LLMPipeline(str(model_dir), 'CPU')
-
-generation_config = ov_genai.GenerationConfig()
-generation_config.max_new_tokens = 32768
-
 
 def streamer(subword):
     print(subword, end="", flush=True)
@@ -19,8 +9,24 @@ def streamer(subword):
     return False
 
 
-input_prompt = '''
+def main():
+    # 只在直接运行时加载模型，被导入时不产生任何开销
+    import openvino_genai as ov_genai
+
+    model_dir = sys.argv[1] if len(sys.argv) > 1 else r'C:\Users\zangq\Repo\model\OpenVINO\Qwen3-1.7B-int4-ov'
+    print(f"Loading model from {model_dir}\n")
+
+    pipe = ov_genai.LLMPipeline(str(model_dir), 'CPU')
+
+    generation_config = ov_genai.GenerationConfig()
+    generation_config.max_new_tokens = 32768
+
+    input_prompt = '''
 你好
 '''
-print(f"Input text: {input_prompt}")
-result = pipe.generate(input_prompt, generation_config, streamer)
\ No newline at end of file
+    print(f"Input text: {input_prompt}")
+    pipe.generate(input_prompt, generation_config, streamer)
+
+
+if __name__ == "__main__":
+    main()
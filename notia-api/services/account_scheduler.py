@@ -0,0 +1,265 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from database.tenants import get_tenant_engine
+
+from .account_service import AccountStore, EmailAccount
+from .email_pipeline import EmailPipeline, PipelineJob, PipelineJobManager
+from .email_service import EmailService
+from .imap_connection import IMAPConnectionManager, IMAPIdleWatcher
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """令牌桶限速，rate为每秒补充的令牌数"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def available(self) -> int:
+        with self._lock:
+            self._refill()
+            return int(self._tokens)
+
+    def consume(self, amount: int):
+        with self._lock:
+            self._refill()
+            self._tokens -= amount
+
+    def wait_time(self, amount: int = 1) -> float:
+        """攒够amount个令牌还需等待的秒数"""
+        with self._lock:
+            self._refill()
+            if self._tokens >= amount or self.rate <= 0:
+                return 0.0
+            return (amount - self._tokens) / self.rate
+
+
+class AccountWorker:
+    """一个账户的连接、邮件服务、流水线和调度状态"""
+
+    def __init__(self, account: EmailAccount, pipeline_options: Dict):
+        self.account = account
+        # 首次使用时创建该账户的数据库
+        get_tenant_engine(account.name)
+        self.connection_manager = IMAPConnectionManager(
+            account.imap_server, account.email_addr, account.password,
+            mailbox=account.mailbox, port=account.port, use_ssl=account.use_ssl
+        )
+        self.service = EmailService(
+            account.imap_server, account.email_addr, account.password,
+            batch_size=account.batch_size,
+            connection_manager=self.connection_manager,
+            db_path=account.db_path
+        )
+        self.pipeline = EmailPipeline(self.service, **pipeline_options)
+        # rate_limit不大于0时不限速
+        self.bucket = TokenBucket(account.rate_limit / 60.0, account.rate_limit) if account.rate_limit > 0 else None
+        self.next_run = 0.0
+        self.running = False
+        self.last_job: Optional[PipelineJob] = None
+        self.watcher: Optional[IMAPIdleWatcher] = None
+
+    def budget(self) -> int:
+        """本次同步最多可处理的邮件数"""
+        if self.bucket is None:
+            return self.account.max_per_sync
+        return max(1, min(self.account.max_per_sync, self.bucket.available()))
+
+    def wait_time(self, amount: int = 1) -> float:
+        return self.bucket.wait_time(amount) if self.bucket else 0.0
+
+    def consume(self, amount: int):
+        if self.bucket:
+            self.bucket.consume(amount)
+
+    def status(self) -> Dict:
+        return {
+            "name": self.account.name,
+            "running": self.running,
+            "next_run_in": max(0.0, round(self.next_run - time.monotonic(), 1)) if not self.running else 0.0,
+            "tokens": self.bucket.available() if self.bucket else None,
+            "last_job": self.last_job.to_dict() if self.last_job else None
+        }
+
+    def close(self):
+        if self.watcher:
+            self.watcher.stop()
+        self.connection_manager.close()
+
+
+class AccountScheduler:
+    """并发同步多个邮箱账户
+
+    每个账户同一时间只有一个同步在运行，单次同步最多处理
+    max_per_sync封并受每分钟rate_limit的令牌桶限制，超出部分留到
+    下一轮，因此大邮箱的积压不会长期占满同步线程而饿死其他账户。
+    每个账户的邮件写入各自的数据库文件。
+    """
+
+    def __init__(self, store: AccountStore, job_manager: PipelineJobManager,
+                 max_concurrent: int = 4, tick_interval: float = 1.0,
+                 pipeline_options: Optional[Dict] = None):
+        self.store = store
+        self.job_manager = job_manager
+        self.max_concurrent = max_concurrent
+        self.tick_interval = tick_interval
+        self.pipeline_options = pipeline_options or {}
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="account-sync")
+        self._workers: Dict[str, AccountWorker] = {}
+        self._lock = threading.Lock()
+        # 串行执行reload，不与调度和状态查询共用self._lock
+        self._reload_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._reload_pending = False
+
+    def reload(self):
+        """按数据库中的账户配置增删或重建工作单元
+
+        新建工作单元时会创建租户数据库并执行建表和迁移，这一步在锁外进行，
+        只在替换工作单元时持有锁，避免阻塞调度和状态查询。
+        """
+        with self._reload_lock:
+            accounts = {account.name: account for account in self.store.list_accounts() if account.enabled}
+            stale = []
+            with self._lock:
+                self._reload_pending = False
+                for name, worker in list(self._workers.items()):
+                    account = accounts.get(name)
+                    if account is None or account.to_dict(True) != worker.account.to_dict(True):
+                        if worker.running:
+                            # 正在同步的账户等本轮结束后再重建
+                            self._reload_pending = True
+                            continue
+                        stale.append(self._workers.pop(name))
+                missing = [account for name, account in accounts.items() if name not in self._workers]
+
+            created = []
+            for account in missing:
+                try:
+                    created.append(AccountWorker(account, self.pipeline_options))
+                except Exception as e:
+                    logger.exception("初始化账户 %s 失败: %s", account.name, e, extra={"account": account.name})
+
+            with self._lock:
+                for worker in created:
+                    self._workers[worker.account.name] = worker
+                    if worker.account.idle and self._thread is not None:
+                        self._start_watcher(worker)
+        for worker in stale:
+            worker.close()
+        self._wakeup.set()
+
+    def _start_watcher(self, worker: AccountWorker):
+        worker.watcher = IMAPIdleWatcher(
+            worker.connection_manager,
+            lambda name=worker.account.name: self.trigger(name),
+            poll_interval=worker.account.poll_interval
+        )
+        worker.watcher.start()
+
+    def trigger(self, name: str):
+        """让账户尽快同步（仍受限速约束）"""
+        with self._lock:
+            worker = self._workers.get(name)
+            if worker:
+                worker.next_run = 0.0
+        self._wakeup.set()
+
+    def sync_now(self, name: str) -> Optional[PipelineJob]:
+        """立即提交一次同步，账户正在同步时返回None"""
+        with self._lock:
+            worker = self._workers.get(name)
+            if worker is None or worker.running:
+                return None
+            return self._submit(worker)
+
+    def _submit(self, worker: AccountWorker) -> PipelineJob:
+        """提交一次同步，调用方需持有self._lock"""
+        limit = worker.budget()
+        job = self.job_manager.create(worker.account.name)
+        worker.running = True
+        worker.last_job = job
+        self.executor.submit(self._run, worker, job, limit)
+        return job
+
+    def _run(self, worker: AccountWorker, job: PipelineJob, limit: int):
+        try:
+            worker.pipeline.run(job, True, limit)
+        except Exception as e:
+            logger.exception("账户 %s 同步失败: %s", worker.account.name, e,
+                             extra={"account": worker.account.name, "job_id": job.job_id})
+        finally:
+            worker.consume(job.fetched)
+            with self._lock:
+                worker.running = False
+                if job.status == "completed" and job.pending:
+                    # 还有积压，攒够一批令牌后开始下一轮，避免每轮只处理一两封
+                    batch = min(job.pending, max(1, worker.account.max_per_sync // 5))
+                    worker.next_run = time.monotonic() + worker.wait_time(batch)
+                else:
+                    worker.next_run = time.monotonic() + worker.account.poll_interval
+            self._wakeup.set()
+
+    def _dispatch(self):
+        if self._reload_pending:
+            self.reload()
+        now = time.monotonic()
+        with self._lock:
+            for worker in self._workers.values():
+                if worker.running or worker.next_run > now:
+                    continue
+                wait = worker.wait_time()
+                if wait > 0:
+                    worker.next_run = now + wait
+                    continue
+                self._submit(worker)
+
+    def _loop(self):
+        while not self._stop_event.is_set():
+            try:
+                self._dispatch()
+            except Exception as e:
+                logger.exception("账户调度失败: %s", e)
+            self._wakeup.wait(self.tick_interval)
+            self._wakeup.clear()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._loop, name="account-scheduler", daemon=True)
+        self._thread.start()
+        self.reload()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.executor.shutdown(wait=False)
+        with self._lock:
+            workers = list(self._workers.values())
+            self._workers.clear()
+        for worker in workers:
+            worker.close()
+
+    def status(self) -> List[Dict]:
+        with self._lock:
+            return [worker.status() for worker in self._workers.values()]
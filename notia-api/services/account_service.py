@@ -0,0 +1,149 @@
+import json
+import logging
+import os
+from typing import Dict, List, Optional
+
+from cryptography.fernet import Fernet, InvalidToken
+
+from database.db_utils import DatabaseUtils
+from database.tenants import tenant_db_path, validate_tenant_name
+
+logger = logging.getLogger(__name__)
+
+# 账户配置在user_config表中的键前缀，完整键为 account:{账户名}
+ACCOUNT_KEY_PREFIX = "account:"
+
+# 邮箱密码以Fernet加密后保存，密钥只从环境变量读取，生成方法：
+#   python -c "from cryptography.fernet import Fernet; print(Fernet.generate_key().decode())"
+SECRET_CONFIG = {
+    "secret_key": os.environ.get("NOTIA_SECRET_KEY", ""),
+}
+
+
+def _get_cipher() -> Fernet:
+    key = SECRET_CONFIG["secret_key"]
+    if not key:
+        raise ValueError("未配置NOTIA_SECRET_KEY，无法加解密邮箱密码")
+    try:
+        return Fernet(key)
+    except (TypeError, ValueError):
+        raise ValueError("NOTIA_SECRET_KEY不是有效的Fernet密钥")
+
+
+def encrypt_password(password: str) -> str:
+    return _get_cipher().encrypt(password.encode("utf-8")).decode("ascii")
+
+
+def decrypt_password(token: str) -> str:
+    try:
+        return _get_cipher().decrypt(token.encode("ascii")).decode("utf-8")
+    except InvalidToken:
+        raise ValueError("邮箱密码解密失败，NOTIA_SECRET_KEY与加密时不一致")
+
+
+class EmailAccount:
+    """一个需要同步的邮箱账户"""
+
+    # 可配置字段及默认值
+    FIELDS = {
+        "imap_server": "",
+        "email_addr": "",
+        "password": "",
+        "mailbox": "INBOX",
+        "port": 993,
+        "use_ssl": True,
+        "batch_size": 100,
+        "idle": False,              # 是否通过IMAP IDLE实时接收新邮件
+        "poll_interval": 300,       # 轮询间隔（秒）
+        "rate_limit": 600,          # 每分钟最多处理的邮件数
+        "max_per_sync": 500,        # 单次同步最多处理的邮件数，其余留到下一轮
+        "enabled": True,
+    }
+    REQUIRED = ("imap_server", "email_addr", "password")
+
+    def __init__(self, name: str, **config):
+        self.name = validate_tenant_name(name)
+        for field, default in self.FIELDS.items():
+            setattr(self, field, config.get(field, default))
+
+    @classmethod
+    def from_dict(cls, name: str, data: Dict) -> "EmailAccount":
+        """从接口或数据库中的配置创建账户，缺少必填字段时抛出ValueError"""
+        missing = [field for field in cls.REQUIRED if not data.get(field)]
+        if missing:
+            raise ValueError(f"账户配置缺少字段: {', '.join(missing)}")
+        config = {}
+        for field, default in cls.FIELDS.items():
+            if field not in data:
+                continue
+            value = data[field]
+            try:
+                if isinstance(default, bool):
+                    value = value if isinstance(value, bool) else str(value).lower() in ("1", "true", "yes")
+                elif isinstance(default, int):
+                    value = int(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"账户配置字段 {field} 的取值无效: {value}")
+            config[field] = value
+        return cls(name, **config)
+
+    @property
+    def db_path(self) -> str:
+        """该账户的邮件数据库"""
+        return tenant_db_path(self.name)
+
+    def to_dict(self, include_password: bool = False) -> Dict:
+        """默认不含密码，只用password_set表示是否已设置，用于接口返回"""
+        data = {"name": self.name}
+        data.update({field: getattr(self, field) for field in self.FIELDS})
+        if not include_password:
+            del data["password"]
+            data["password_set"] = bool(self.password)
+        return data
+
+
+class AccountStore:
+    """读写保存在user_config表中的账户配置，密码加密保存在password_encrypted字段"""
+
+    def __init__(self, db_utils: Optional[DatabaseUtils] = None):
+        self.db_utils = db_utils or DatabaseUtils()
+
+    def list_accounts(self) -> List[EmailAccount]:
+        accounts = []
+        for key, value in sorted(self.db_utils.get_configs_by_prefix(ACCOUNT_KEY_PREFIX).items()):
+            try:
+                accounts.append(self._load(key[len(ACCOUNT_KEY_PREFIX):], value))
+            except ValueError as e:
+                logger.warning("账户配置 %s 无效，已跳过: %s", key, e)
+        return accounts
+
+    def get(self, name: str) -> Optional[EmailAccount]:
+        value = self.db_utils.get_config(ACCOUNT_KEY_PREFIX + name)
+        if not value:
+            return None
+        return self._load(name, value)
+
+    def _load(self, name: str, value: str) -> EmailAccount:
+        data = json.loads(value)
+        encrypted = data.pop("password_encrypted", None)
+        if encrypted:
+            data["password"] = decrypt_password(encrypted)
+        account = EmailAccount.from_dict(name, data)
+        if not encrypted:
+            # 旧版本明文保存的密码，读取时改为加密保存
+            try:
+                self.save(account)
+                logger.info("账户 %s 的密码已改为加密保存", name)
+            except ValueError as e:
+                logger.warning("账户 %s 的密码仍为明文保存: %s", name, e)
+        return account
+
+    def save(self, account: EmailAccount):
+        data = account.to_dict(include_password=True)
+        del data["name"]
+        data["password_encrypted"] = encrypt_password(data.pop("password"))
+        self.db_utils.set_config(ACCOUNT_KEY_PREFIX + account.name, json.dumps(data, ensure_ascii=False))
+
+    def delete(self, name: str) -> bool:
+        """删除账户配置，账户的邮件数据库保留"""
+        return self.db_utils.delete_config(ACCOUNT_KEY_PREFIX + name) > 0
@@ -0,0 +1,196 @@
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from email.utils import parseaddr
+from typing import Dict, Optional, Tuple
+
+from database.db_utils import DatabaseUtils
+from database.models import EmailCategory
+
+from .metrics import CACHE_LOOKUPS
+
+_URL_RE = re.compile(r'https?://\S+')
+_DIGITS_RE = re.compile(r'\d+')
+_SPACE_RE = re.compile(r'\s+')
+
+
+def _normalize_text(text: str) -> str:
+    """归一化文本：去掉链接，数字替换为#，合并空白"""
+    text = _URL_RE.sub('', text or '').lower()
+    text = _DIGITS_RE.sub('#', text)
+    return _SPACE_RE.sub(' ', text).strip()
+
+
+class ClassificationCache:
+    """邮件分类结果缓存
+
+    以发件人地址、标题模板和正文开头的归一化哈希为键，内存LRU
+    在前，SQLite持久化在后，条目超过TTL后失效。
+    """
+
+    def __init__(self, db_utils: Optional[DatabaseUtils] = None,
+                 max_entries: int = 50000, memory_entries: int = 4096,
+                 ttl_seconds: float = 30 * 24 * 3600, body_prefix_chars: int = 200,
+                 sender_min_history: int = 5, sender_rule_ttl: float = 3600):
+        self.db_utils = db_utils or DatabaseUtils()
+        # SQLite中保留的最大条目数
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.ttl_seconds = ttl_seconds
+        self.body_prefix_chars = body_prefix_chars
+        # 发件人至少有这么多封历史邮件且分类完全一致时，直接沿用该分类
+        self.sender_min_history = sender_min_history
+        self.sender_rule_ttl = sender_rule_ttl
+
+        self.hits = 0
+        self.misses = 0
+        self.sender_rule_hits = 0
+        self._writes = 0
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._sender_rules: Dict[Tuple[str, str], Tuple[Optional[str], float]] = {}
+        self._lock = threading.Lock()
+
+    def make_key(self, email_data: Dict) -> str:
+        """计算邮件的缓存键"""
+        sender = parseaddr(email_data.get('sender', ''))[1].lower()
+        subject = _normalize_text(email_data.get('title', ''))
+        body = _normalize_text(email_data.get('content', ''))[:self.body_prefix_chars]
+        raw = '\x1f'.join([sender, subject, body])
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """查询缓存的分类，未命中返回None"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and entry[1] > now:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                CACHE_LOOKUPS.inc(cache="classification", result="hit")
+                return entry[0]
+
+        rows = self.db_utils.execute_query(
+            "SELECT category, created_at FROM classification_cache WHERE cache_key = ?", (key,)
+        )
+        if rows and rows[0]['created_at'] + self.ttl_seconds > now:
+            category = rows[0]['category']
+            self.db_utils.execute_update(
+                "UPDATE classification_cache SET hit_count = hit_count + 1, last_used_at = ? WHERE cache_key = ?",
+                (now, key)
+            )
+            with self._lock:
+                self._remember(key, category, rows[0]['created_at'] + self.ttl_seconds)
+                self.hits += 1
+            CACHE_LOOKUPS.inc(cache="classification", result="hit")
+            return category
+
+        with self._lock:
+            self.misses += 1
+        CACHE_LOOKUPS.inc(cache="classification", result="miss")
+        return None
+
+    def put(self, key: str, category: str):
+        """写入分类结果"""
+        now = time.time()
+        self.db_utils.execute_update(
+            """
+            INSERT INTO classification_cache (cache_key, category, hit_count, created_at, last_used_at)
+            VALUES (?, ?, 0, ?, ?)
+            ON CONFLICT(cache_key) DO UPDATE SET
+                category = excluded.category,
+                created_at = excluded.created_at,
+                last_used_at = excluded.last_used_at
+            """,
+            (key, category, now, now)
+        )
+        with self._lock:
+            self._remember(key, category, now + self.ttl_seconds)
+            self._writes += 1
+            should_evict = self._writes % 1000 == 0
+        if should_evict:
+            self.evict()
+
+    def _remember(self, key: str, category: str, expires_at: float):
+        self._memory[key] = (category, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def evict(self) -> int:
+        """删除过期条目，并按最近使用时间淘汰超出上限的条目"""
+        removed = self.db_utils.execute_update(
+            "DELETE FROM classification_cache WHERE created_at < ?",
+            (time.time() - self.ttl_seconds,)
+        )
+        removed += self.db_utils.execute_update(
+            """
+            DELETE FROM classification_cache WHERE cache_key IN (
+                SELECT cache_key FROM classification_cache
+                ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+            )
+            """,
+            (self.max_entries,)
+        )
+        return removed
+
+    def sender_category(self, sender: str, db_utils: Optional[DatabaseUtils] = None) -> Optional[str]:
+        """发件人历史邮件分类完全一致时返回该分类
+
+        db_utils指定查询历史邮件的数据库，多账户时每个账户的邮件在各自
+        的库中；未指定时使用缓存自身的数据库。
+        """
+        db_utils = db_utils or self.db_utils
+        rule_key = (db_utils.db_path, sender)
+        now = time.time()
+        with self._lock:
+            rule = self._sender_rules.get(rule_key)
+        if rule and rule[1] > now:
+            category = rule[0]
+        else:
+            rows = db_utils.execute_query(
+                "SELECT category, COUNT(*) AS count FROM emails WHERE sender = ? GROUP BY category",
+                (sender,)
+            )
+
+            category = None
+            if len(rows) == 1:
+                row_category, count = rows[0]['category'], rows[0]['count']
+                if row_category and row_category != EmailCategory.UNCLASSIFIED.value \
+                        and count >= self.sender_min_history:
+                    category = row_category
+            # 未形成规则的发件人历史还在增长，只短暂缓存
+            ttl = self.sender_rule_ttl if category else min(self.sender_rule_ttl, 300)
+            with self._lock:
+                self._sender_rules[rule_key] = (category, now + ttl)
+
+        if category:
+            with self._lock:
+                self.sender_rule_hits += 1
+        return category
+
+    def stats(self) -> Dict:
+        """缓存命中统计"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "sender_rule_hits": self.sender_rule_hits,
+                "memory_entries": len(self._memory)
+            }
+
+
+_shared_cache: Optional[ClassificationCache] = None
+_shared_lock = threading.Lock()
+
+def get_classification_cache() -> ClassificationCache:
+    """获取进程内共享的分类缓存"""
+    global _shared_cache
+    if _shared_cache is None:
+        with _shared_lock:
+            if _shared_cache is None:
+                _shared_cache = ClassificationCache()
+    return _shared_cache
@@ -0,0 +1,301 @@
+import logging
+import re
+import threading
+import time
+import zlib
+from email.utils import parseaddr
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from database.db_utils import DatabaseUtils
+from database.models import EmailCategory
+
+from .classification_cache import ClassificationCache, get_classification_cache
+from .metrics import CLASSIFIER_DECISIONS
+
+logger = logging.getLogger(__name__)
+
+# 分类时需要的邮件头，解析邮件时一并保留
+CLASSIFIER_HEADERS = ("List-Unsubscribe", "List-Id", "Precedence", "Auto-Submitted")
+
+# 典型的群发或系统通知发件人
+_BULK_SENDER_RE = re.compile(r'^(no-?reply|do-?not-?reply|newsletters?|notifications?|news|marketing|mailer-daemon)\b')
+_LATIN_WORD_RE = re.compile(r'[a-z0-9]+')
+_CJK_RE = re.compile(r'[一-鿿]+')
+
+# 参与训练和预测的两个类别，无法分类的邮件交给模型
+_LABELS = (EmailCategory.NEWS.value, EmailCategory.TASK.value)
+
+
+class HeaderRules:
+    """基于邮件头和发件人的确定性规则"""
+
+    def __init__(self, cache: ClassificationCache):
+        self.cache = cache
+
+    def classify(self, email_data: Dict, db_utils: DatabaseUtils) -> Optional[Tuple[str, float, str]]:
+        """返回(分类, 置信度, 命中的规则)，没有规则命中时返回None"""
+        headers = {key.lower(): str(value).strip().lower()
+                   for key, value in (email_data.get("headers") or {}).items() if value}
+        if "list-unsubscribe" in headers or "list-id" in headers:
+            return EmailCategory.NEWS.value, 0.95, "邮件列表"
+        if headers.get("precedence") in ("bulk", "list", "junk"):
+            return EmailCategory.NEWS.value, 0.95, f"Precedence: {headers['precedence']}"
+        if headers.get("auto-submitted", "no") != "no":
+            return EmailCategory.NEWS.value, 0.9, "自动发送"
+
+        category = self.cache.sender_category(email_data.get("sender", ""), db_utils)
+        if category:
+            return category, 0.9, "发件人规则"
+        address = parseaddr(email_data.get("sender", ""))[1].lower()
+        if _BULK_SENDER_RE.match(address):
+            return EmailCategory.NEWS.value, 0.85, "群发地址"
+        return None
+
+
+class NgramClassifier:
+    """哈希n-gram特征的逻辑回归
+
+    使用数据库中已分类的邮件训练，预测邮件为任务类的概率。特征为
+    标题和正文开头的中文单字、相邻二字、英文单词，以及发件人域名，
+    哈希到2**dim_bits维。只用numpy实现，训练几千封邮件在一秒以内。
+    """
+
+    def __init__(self, dim_bits: int = 18, max_samples: int = 5000, min_samples: int = 40,
+                 epochs: int = 60, learning_rate: float = 0.5, l2: float = 1e-4,
+                 content_chars: int = 500):
+        self.dim = 1 << dim_bits
+        self.max_samples = max_samples
+        # 每个类别至少需要的样本数，不足时不启用
+        self.min_samples = min_samples
+        self.epochs = epochs
+        self.learning_rate = learning_rate
+        self.l2 = l2
+        self.content_chars = content_chars
+        self.weights: Optional[np.ndarray] = None
+        self.bias = 0.0
+        self.samples = 0
+        self.trained_at = 0.0
+
+    def _features(self, email_data: Dict) -> List[str]:
+        features = []
+        fields = (("t", email_data.get("title") or ""),
+                  ("c", (email_data.get("content") or "")[:self.content_chars]))
+        for prefix, text in fields:
+            text = text.lower()
+            features.extend(f"{prefix}:{word}" for word in _LATIN_WORD_RE.findall(text))
+            for run in _CJK_RE.findall(text):
+                features.extend(f"{prefix}:{char}" for char in run)
+                features.extend(f"{prefix}:{run[i:i + 2]}" for i in range(len(run) - 1))
+        address = parseaddr(email_data.get("sender", ""))[1].lower()
+        if "@" in address:
+            features.append(f"d:{address.rsplit('@', 1)[1]}")
+        return features
+
+    def _vectorize(self, emails: List[Dict]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """稀疏表示：返回(行号, 列号, 取值)，每行做L2归一化"""
+        rows, cols = [], []
+        for row, email_data in enumerate(emails):
+            for feature in self._features(email_data):
+                rows.append(row)
+                cols.append(zlib.crc32(feature.encode("utf-8")) & (self.dim - 1))
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        counts = np.bincount(rows, minlength=len(emails)).astype(np.float32)
+        counts[counts == 0] = 1.0
+        values = (1.0 / np.sqrt(counts))[rows] if len(rows) else np.zeros(0, dtype=np.float32)
+        return rows, cols, values
+
+    @staticmethod
+    def _scores(rows, cols, values, count: int, weights: np.ndarray, bias: float) -> np.ndarray:
+        logits = np.bincount(rows, weights=weights[cols] * values, minlength=count) + bias
+        return 1.0 / (1.0 + np.exp(-np.clip(logits, -30, 30)))
+
+    def train(self, db_utils: DatabaseUtils) -> bool:
+        """用最近已分类的邮件训练，样本不足时返回False"""
+        rows = db_utils.execute_query(
+            "SELECT title, sender, content, category FROM emails "
+            "WHERE category IN (?, ?) ORDER BY id DESC LIMIT ?",
+            _LABELS + (self.max_samples,)
+        )
+        labels = np.array([row["category"] == EmailCategory.TASK.value for row in rows], dtype=np.float64)
+        positives = int(labels.sum())
+        if min(positives, len(labels) - positives) < self.min_samples:
+            self.weights = None
+            return False
+
+        count = len(rows)
+        x_rows, x_cols, x_values = self._vectorize(rows)
+        weights = np.zeros(self.dim, dtype=np.float64)
+        bias = 0.0
+        grad_sq = np.full(self.dim, 1e-8)
+        bias_sq = 1e-8
+        # 全量AdaGrad，稀疏特征的学习率按各自的梯度累计自适应
+        for _ in range(self.epochs):
+            errors = self._scores(x_rows, x_cols, x_values, count, weights, bias) - labels
+            gradient = np.bincount(x_cols, weights=errors[x_rows] * x_values, minlength=self.dim) / count
+            gradient += self.l2 * weights
+            grad_sq += gradient ** 2
+            weights -= self.learning_rate * gradient / np.sqrt(grad_sq)
+            bias_gradient = float(errors.mean())
+            bias_sq += bias_gradient ** 2
+            bias -= self.learning_rate * bias_gradient / np.sqrt(bias_sq)
+
+        self.weights = weights
+        self.bias = bias
+        self.samples = count
+        self.trained_at = time.time()
+        return True
+
+    def predict(self, email_data: Dict) -> Optional[Tuple[str, float]]:
+        """返回(分类, 置信度)，模型未训练时返回None"""
+        if self.weights is None:
+            return None
+        rows, cols, values = self._vectorize([email_data])
+        probability = float(self._scores(rows, cols, values, 1, self.weights, self.bias)[0])
+        if probability >= 0.5:
+            return EmailCategory.TASK.value, probability
+        return EmailCategory.NEWS.value, 1.0 - probability
+
+
+class EmailClassifier:
+    """由低成本到高成本逐级尝试的邮件分类
+
+    依次为：分类缓存、邮件头和发件人规则、n-gram逻辑回归、大模型。
+    前一级没有结论或置信度低于min_confidence时才进入下一级，各级的
+    命中次数和平均置信度可通过stats()查看。
+    """
+
+    TIERS = ("cache", "rules", "ngram", "llm")
+
+    def __init__(self, cache: Optional[ClassificationCache] = None, min_confidence: float = 0.9,
+                 retrain_interval: float = 3600, **ngram_options):
+        self.cache = cache or get_classification_cache()
+        self.rules = HeaderRules(self.cache)
+        self.min_confidence = min_confidence
+        self.retrain_interval = retrain_interval
+        self.ngram_options = ngram_options
+        # 每个数据库（账户）各自训练一个模型
+        self._models: Dict[str, NgramClassifier] = {}
+        self._train_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._total = 0
+        self._stats = {tier: {"hits": 0, "confidence": 0.0} for tier in self.TIERS}
+
+    def _record(self, tier: str, confidence: float):
+        with self._lock:
+            self._total += 1
+            self._stats[tier]["hits"] += 1
+            self._stats[tier]["confidence"] += confidence
+        CLASSIFIER_DECISIONS.inc(tier=tier)
+
+    def ngram_model(self, db_utils: DatabaseUtils) -> NgramClassifier:
+        """获取数据库对应的n-gram模型，超过retrain_interval后重新训练"""
+        with self._lock:
+            model = self._models.get(db_utils.db_path)
+            train_lock = self._train_locks.setdefault(db_utils.db_path, threading.Lock())
+        if model is not None and time.time() - model.trained_at < self.retrain_interval:
+            return model
+        # 同一时间只有一个线程训练，其他线程继续使用旧模型
+        if not train_lock.acquire(blocking=model is None):
+            return model
+        try:
+            with self._lock:
+                current = self._models.get(db_utils.db_path)
+            if current is not None and current is not model:
+                return current
+            model = NgramClassifier(**self.ngram_options)
+            try:
+                model.train(db_utils)
+            except Exception as e:
+                logger.exception("训练分类模型失败: %s", e, extra={"db_path": db_utils.db_path})
+            # 样本不足时也记下训练时间，避免每封邮件都重新查询
+            model.trained_at = time.time()
+            with self._lock:
+                self._models[db_utils.db_path] = model
+            return model
+        finally:
+            train_lock.release()
+
+    def classify(self, email_data: Dict, db_utils: DatabaseUtils,
+                 llm: Callable[[Dict], Dict]) -> Dict:
+        """对邮件分类，返回category、confidence、tier和classification_detail"""
+        cache_key = None
+        try:
+            cache_key = self.cache.make_key(email_data)
+            category = self.cache.get(cache_key)
+            if category:
+                self._record("cache", 1.0)
+                return {"category": category, "confidence": 1.0, "tier": "cache",
+                        "classification_detail": "缓存命中"}
+        except Exception as e:
+            logger.warning("查询分类缓存失败: %s", e)
+
+        rule = None
+        try:
+            rule = self.rules.classify(email_data, db_utils)
+        except Exception as e:
+            logger.warning("匹配分类规则失败: %s", e)
+        if rule and rule[1] >= self.min_confidence:
+            self._record("rules", rule[1])
+            return {"category": rule[0], "confidence": rule[1], "tier": "rules",
+                    "classification_detail": rule[2]}
+
+        prediction = None
+        try:
+            prediction = self.ngram_model(db_utils).predict(email_data)
+        except Exception as e:
+            logger.warning("分类模型预测失败: %s", e)
+        if prediction and prediction[1] >= self.min_confidence:
+            self._record("ngram", prediction[1])
+            return {"category": prediction[0], "confidence": prediction[1], "tier": "ngram",
+                    "classification_detail": f"n-gram模型 p={prediction[1]:.2f}"}
+
+        result = llm(email_data)
+        if result["category"] == EmailCategory.UNCLASSIFIED.value:
+            # 模型无法判断时采用置信度较低的规则或n-gram结果
+            for fallback, tier in ((rule, "rules"), (prediction, "ngram")):
+                if fallback:
+                    self._record(tier, fallback[1])
+                    return dict(result, category=fallback[0], confidence=fallback[1], tier=tier)
+            self._record("llm", 0.0)
+            return dict(result, confidence=0.0, tier="llm")
+
+        # 模型输出不带概率，解析出明确类别时记为1.0
+        self._record("llm", 1.0)
+        if cache_key:
+            try:
+                self.cache.put(cache_key, result["category"])
+            except Exception as e:
+                logger.warning("写入分类缓存失败: %s", e)
+        return dict(result, confidence=1.0, tier="llm")
+
+    def stats(self) -> Dict:
+        """各级的命中次数、命中率和平均置信度"""
+        with self._lock:
+            tiers = {}
+            for tier, stat in self._stats.items():
+                hits = stat["hits"]
+                tiers[tier] = {
+                    "hits": hits,
+                    "hit_rate": hits / self._total if self._total else 0.0,
+                    "avg_confidence": stat["confidence"] / hits if hits else 0.0
+                }
+            models = {path: {"samples": model.samples, "active": model.weights is not None}
+                      for path, model in self._models.items()}
+            return {"total": self._total, "min_confidence": self.min_confidence,
+                    "tiers": tiers, "ngram_models": models}
+
+
+_shared_classifier: Optional[EmailClassifier] = None
+_shared_lock = threading.Lock()
+
+def get_email_classifier() -> EmailClassifier:
+    """获取进程内共享的邮件分类器"""
+    global _shared_classifier
+    if _shared_classifier is None:
+        with _shared_lock:
+            if _shared_classifier is None:
+                _shared_classifier = EmailClassifier()
+    return _shared_classifier
@@ -0,0 +1,314 @@
+import logging
+import queue
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Executor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from .email_service import EmailService
+from .metrics import QUEUE_DEPTH
+
+logger = logging.getLogger(__name__)
+
+# 阶段之间传递的结束标记
+_STOP = object()
+
+# 正在运行的任务中各阶段的输入队列，多个账户同时同步时队列深度指标取总和
+_STAGE_QUEUES: Dict[str, "weakref.WeakSet"] = {
+    stage: weakref.WeakSet() for stage in ("parse", "model", "writer")
+}
+for _stage, _queues in _STAGE_QUEUES.items():
+    QUEUE_DEPTH.set_function(lambda queues=_queues: sum(q.qsize() for q in list(queues)),
+                             queue=f"pipeline_{_stage}")
+
+
+class PipelineJob:
+    """一次邮件处理任务的进度"""
+
+    def __init__(self, account: Optional[str] = None):
+        self.job_id = uuid.uuid4().hex
+        self.account = account
+        self.status = "pending"
+        self.total = 0
+        self.fetched = 0
+        self.parsed = 0
+        self.classified = 0
+        self.saved = 0
+        self.failed = 0
+        # 受limit限制留到下次同步的邮件数
+        self.pending = 0
+        self.error: Optional[str] = None
+        self.created_at = datetime.utcnow()
+        self.finished_at: Optional[datetime] = None
+        self._lock = threading.Lock()
+
+    def increment(self, field: str, amount: int = 1):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + amount)
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return {
+                "job_id": self.job_id,
+                "account": self.account,
+                "status": self.status,
+                "total": self.total,
+                "fetched": self.fetched,
+                "parsed": self.parsed,
+                "classified": self.classified,
+                "saved": self.saved,
+                "failed": self.failed,
+                "pending": self.pending,
+                "error": self.error,
+                "created_at": self.created_at.isoformat(),
+                "finished_at": self.finished_at.isoformat() if self.finished_at else None
+            }
+
+
+class EmailPipeline:
+    """分阶段的邮件处理流水线
+
+    IMAP读取 -> 解析 -> 模型分类 -> 写库，各阶段由有界队列连接，
+    下游处理不过来时上游会阻塞，从而形成背压。
+    """
+
+    def __init__(self, email_service: EmailService, parse_workers: int = 2,
+                 model_concurrency: int = 2, queue_size: int = 64,
+                 write_batch_size: int = 200, write_interval: float = 0.2):
+        self.email_service = email_service
+        self.parse_workers = parse_workers
+        # 同时进行模型推理的最大数量
+        self.model_concurrency = model_concurrency
+        self.queue_size = queue_size
+        # 写库阶段攒够该数量或等待超过write_interval秒后提交一次事务
+        self.write_batch_size = write_batch_size
+        self.write_interval = write_interval
+        # 同一流水线的任务串行执行，高水位在任务结束时才推进，重叠执行会重复处理同一批邮件
+        self.current_job: Optional[PipelineJob] = None
+        self._run_lock = threading.Lock()
+        self._state_lock = threading.Lock()
+
+    def claim(self, job: PipelineJob) -> PipelineJob:
+        """登记待执行的任务；已有未结束的任务时不登记，返回该任务"""
+        with self._state_lock:
+            if self.current_job is None:
+                self.current_job = job
+            return self.current_job
+
+    def _start_stage(self, name: str, handler: Callable, in_queue: queue.Queue,
+                     out_queue: Optional[queue.Queue], workers: int,
+                     downstream_workers: int, job: PipelineJob) -> List[threading.Thread]:
+        """启动一个阶段的工作线程，全部结束后向下游发送结束标记"""
+        remaining = [workers]
+        lock = threading.Lock()
+
+        def worker():
+            while True:
+                item = in_queue.get()
+                if item is _STOP:
+                    break
+                try:
+                    result = handler(item)
+                except Exception as e:
+                    logger.exception("邮件处理阶段[%s]失败: %s", name, e,
+                                     extra={"job_id": job.job_id, "account": job.account})
+                    job.increment("failed")
+                    continue
+                if out_queue is not None:
+                    out_queue.put(result)
+
+            with lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last and out_queue is not None:
+                for _ in range(downstream_workers):
+                    out_queue.put(_STOP)
+
+        threads = [
+            threading.Thread(target=worker, name=f"pipeline-{name}-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def _start_writer(self, handler: Callable, in_queue: queue.Queue, job: PipelineJob) -> List[threading.Thread]:
+        """启动写库线程，把上游结果攒成批次后一次写入"""
+
+        def flush(batch: List):
+            try:
+                handler(batch)
+            except Exception as e:
+                logger.exception("邮件处理阶段[writer]失败: %s", e,
+                                 extra={"job_id": job.job_id, "account": job.account, "batch_size": len(batch)})
+                job.increment("failed", len(batch))
+
+        def worker():
+            batch = []
+            deadline = None
+            while True:
+                try:
+                    if batch:
+                        item = in_queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                    else:
+                        item = in_queue.get()
+                except queue.Empty:
+                    flush(batch)
+                    batch = []
+                    continue
+                if item is _STOP:
+                    break
+                if not batch:
+                    deadline = time.monotonic() + self.write_interval
+                batch.append(item)
+                if len(batch) >= self.write_batch_size:
+                    flush(batch)
+                    batch = []
+            if batch:
+                flush(batch)
+
+        thread = threading.Thread(target=worker, name="pipeline-writer-0", daemon=True)
+        thread.start()
+        return [thread]
+
+    def run(self, job: PipelineJob, incremental: bool = True, limit: Optional[int] = None):
+        """执行一次完整的邮件处理，limit限制本次最多处理的邮件数
+
+        已有任务在执行时等待其结束后再执行，此时高水位已经推进，不会重复处理。
+        """
+        with self._run_lock:
+            with self._state_lock:
+                self.current_job = job
+            try:
+                self._run(job, incremental, limit)
+            finally:
+                with self._state_lock:
+                    if self.current_job is job:
+                        self.current_job = None
+
+    def _run(self, job: PipelineJob, incremental: bool, limit: Optional[int]):
+        service = self.email_service
+        raw_queue = queue.Queue(self.queue_size)
+        parsed_queue = queue.Queue(self.queue_size)
+        classified_queue = queue.Queue(self.queue_size)
+        _STAGE_QUEUES["parse"].add(raw_queue)
+        _STAGE_QUEUES["model"].add(parsed_queue)
+        _STAGE_QUEUES["writer"].add(classified_queue)
+        saved_uids = set()
+        plan = None
+
+        def parse(fetched: Dict) -> Dict:
+            email_content = service.parse_fetched_email(fetched, plan["uidvalidity"])
+            job.increment("parsed")
+            return email_content
+
+        def classify(email_content: Dict) -> Dict:
+            classification = service.classify_email(email_content)
+            job.increment("classified")
+            return {"uid": email_content["uid"],
+                    "result": service.build_result(email_content, classification)}
+
+        def save(items: List[Dict]):
+            service.save_emails_to_db([item["result"] for item in items])
+            saved_uids.update(item["uid"] for item in items)
+            job.increment("saved", len(items))
+
+        job.status = "running"
+        threads = []
+        try:
+            with service.connection_manager.connection() as mail:
+                service.mail = mail
+                plan = service.plan_sync(incremental, limit)
+                job.total = len(plan["uids"])
+                job.pending = plan["remaining"]
+
+                threads += self._start_stage("parse", parse, raw_queue, parsed_queue,
+                                             self.parse_workers, self.model_concurrency, job)
+                threads += self._start_stage("model", classify, parsed_queue, classified_queue,
+                                             self.model_concurrency, 1, job)
+                threads += self._start_writer(save, classified_queue, job)
+
+                # IMAP读取阶段在当前线程执行，队列满时在此阻塞
+                try:
+                    for batch in service.fetch_email_batches(plan["uids"]):
+                        for fetched in batch:
+                            raw_queue.put(fetched)
+                            job.increment("fetched")
+                finally:
+                    for _ in range(self.parse_workers):
+                        raw_queue.put(_STOP)
+        except Exception as e:
+            logger.exception("邮件处理任务失败: %s", e, extra={"job_id": job.job_id, "account": job.account})
+            job.error = str(e)
+            job.status = "failed"
+
+        # 读取阶段结束时已发出结束标记，等待下游阶段处理完队列中的邮件
+        for thread in threads:
+            thread.join()
+
+        if job.status != "failed":
+            # 只把高水位推进到连续处理成功的最大UID，失败的邮件下次重新获取
+            last_uid = None
+            for uid in plan["uids"]:
+                if uid not in saved_uids:
+                    break
+                last_uid = uid
+            try:
+                service.finish_sync(plan, last_uid)
+                job.status = "completed"
+            except Exception as e:
+                logger.exception("保存同步状态失败: %s", e, extra={"job_id": job.job_id, "account": job.account})
+                job.error = str(e)
+                job.status = "failed"
+        job.finished_at = datetime.utcnow()
+
+
+class PipelineJobManager:
+    """在后台线程中运行流水线任务并保存其进度"""
+
+    def __init__(self, max_jobs: int = 100, executor: Optional[Executor] = None):
+        self.max_jobs = max_jobs
+        # 未指定线程池时每个任务使用独立线程
+        self.executor = executor
+        self._jobs: "OrderedDict[str, PipelineJob]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, account: Optional[str] = None) -> PipelineJob:
+        """登记一个新任务，超出上限时丢弃最早的任务记录"""
+        return self._register(PipelineJob(account))
+
+    def _register(self, job: PipelineJob) -> PipelineJob:
+        with self._lock:
+            self._jobs[job.job_id] = job
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+        return job
+
+    def run(self, pipeline: EmailPipeline, incremental: bool = True) -> PipelineJob:
+        """在当前线程中执行任务"""
+        job = self.create()
+        pipeline.run(job, incremental)
+        return job
+
+    def submit(self, pipeline: EmailPipeline, incremental: bool = True) -> PipelineJob:
+        """提交任务，立即返回；该流水线已有未结束的任务时直接返回该任务"""
+        job = PipelineJob()
+        claimed = pipeline.claim(job)
+        if claimed is not job:
+            return claimed
+        self._register(job)
+        if self.executor is not None:
+            self.executor.submit(pipeline.run, job, incremental)
+        else:
+            thread = threading.Thread(target=pipeline.run, args=(job, incremental),
+                                      name=f"pipeline-job-{job.job_id[:8]}", daemon=True)
+            thread.start()
+        return job
+
+    def get(self, job_id: str) -> Optional[PipelineJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
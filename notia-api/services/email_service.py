@@ -1,43 +1,89 @@
 import imaplib
 import email
-from email.header import decode_header
+import logging
+import re
 import json
-from datetime import datetime
-from typing import List, Dict, Optional
-from .model_service import ModelService
-from database.models import Email, EmailCategory, get_db
-from sqlalchemy.orm import Session
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import List, Dict, Optional, Iterator
+from .model_service import get_model_service
+from .imap_connection import IMAPConnectionManager
+from .classification_cache import get_classification_cache
+from .email_classifier import CLASSIFIER_HEADERS, get_email_classifier
+from .imap_parser import parse_fetch_response, select_text_part
+from .metrics import EMAIL_PARSE_SECONDS, IMAP_FETCH_SECONDS
+from .mime_utils import decode_bytes, decode_header_value, decode_part, html_to_text
+from .prompts import ANALYSIS_SCHEMA, build_analysis_prompt, parse_analysis
+from database.config import get_sessionmaker
+from database.models import Email, EmailCategory, Task, TaskStatus
+from database.db_utils import DatabaseUtils
+from sqlalchemy import insert, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+logger = logging.getLogger(__name__)
+
+_STATUS_ITEM_RE = re.compile(rb'(UIDVALIDITY|UIDNEXT) (\d+)')
+
+
+def parse_received_time(date_str: Optional[str]) -> datetime:
+    """解析Date头为UTC时间，无法解析时使用当前时间"""
+    if date_str:
+        try:
+            received = parsedate_to_datetime(date_str)
+            if received.tzinfo is not None:
+                received = received.astimezone(timezone.utc).replace(tzinfo=None)
+            return received
+        except (TypeError, ValueError):
+            pass
+    return datetime.utcnow()
+
+
+def _compress_message_set(numbers: List[int]) -> str:
+    """将邮件编号压缩为IMAP消息集合，如 [1, 2, 3, 7] -> '1:3,7'"""
+    ranges = []
+    numbers = sorted(numbers)
+    start = prev = numbers[0]
+    for n in numbers[1:]:
+        if n == prev + 1:
+            prev = n
+            continue
+        ranges.append(f"{start}:{prev}" if start != prev else str(start))
+        start = prev = n
+    ranges.append(f"{start}:{prev}" if start != prev else str(start))
+    return ','.join(ranges)
+
 
 class EmailService:
-    def __init__(self, imap_server: str, email_addr: str, password: str):
+    def __init__(self, imap_server: str, email_addr: str, password: str,
+                 batch_size: int = 100, max_body_bytes: int = 16384,
+                 max_content_chars: int = 8000,
+                 connection_manager: Optional[IMAPConnectionManager] = None,
+                 db_path: Optional[str] = None):
         self.imap_server = imap_server
         self.email_addr = email_addr
         self.password = password
-        self.model_service = ModelService()
-        
-    def connect(self):
-        """连接到IMAP服务器"""
-        try:
-            self.mail = imaplib.IMAP4_SSL(self.imap_server)
-            self.mail.login(self.email_addr, self.password)
-            self.mail.select('inbox')
-            return True
-        except Exception as e:
-            print(f"邮件连接失败: {e}")
-            return False
+        # 每次FETCH请求的邮件数量
+        self.batch_size = batch_size
+        # 每封邮件最多下载的正文字节数（编码后）
+        self.max_body_bytes = max_body_bytes
+        # 解码后保存的正文最大字符数
+        self.max_content_chars = max_content_chars
+        # 未传入时使用独立的连接管理器，应用内应共享同一个实例
+        self.connection_manager = connection_manager or IMAPConnectionManager(
+            imap_server, email_addr, password
+        )
+        self.mailbox = self.connection_manager.mailbox
+        # 进程内共享同一个模型，避免每个邮件服务各自加载
+        self.model_service = get_model_service()
+        self.classification_cache = get_classification_cache()
+        self.classifier = get_email_classifier()
+        # 邮件、任务和同步状态写入的数据库，多账户时每个账户一个文件
+        self.db_utils = DatabaseUtils(db_path)
+        self.session_factory = get_sessionmaker(db_path)
     
     def decode_mime_words(self, s):
         """解码邮件头部信息"""
-        decoded_fragments = decode_header(s)
-        fragments = []
-        for fragment, encoding in decoded_fragments:
-            if isinstance(fragment, bytes):
-                if encoding:
-                    fragment = fragment.decode(encoding)
-                else:
-                    fragment = fragment.decode('utf-8', errors='ignore')
-            fragments.append(fragment)
-        return ''.join(fragments)
+        return decode_header_value(s)
     
     def extract_email_content(self, msg) -> Dict:
         """提取邮件内容"""
@@ -46,131 +92,348 @@ class EmailService:
         sender = self.decode_mime_words(msg.get('From', ''))
         date_str = msg.get('Date', '')
         
-        # 解析邮件正文
+        # 解析邮件正文，优先纯文本，没有时使用HTML，跳过附件
         content = ""
-        if msg.is_multipart():
-            for part in msg.walk():
-                if part.get_content_type() == "text/plain":
-                    payload = part.get_payload(decode=True)
-                    if payload:
-                        content = payload.decode('utf-8', errors='ignore')
-                        break
-        else:
-            payload = msg.get_payload(decode=True)
-            if payload:
-                content = payload.decode('utf-8', errors='ignore')
+        html = None
+        for part in msg.walk():
+            if part.is_multipart() or part.get_content_disposition() == 'attachment':
+                continue
+            content_type = part.get_content_type()
+            if content_type not in ("text/plain", "text/html"):
+                continue
+            payload = part.get_payload(decode=True)
+            if not payload:
+                continue
+            # 按邮件声明的字符集解码
+            text = decode_bytes(payload, part.get_content_charset())
+            if content_type == "text/plain":
+                content = text
+                break
+            if html is None:
+                html = text
+        if not content and html:
+            content = html_to_text(html)
         
         return {
             "title": subject,
             "sender": sender,
             "time": date_str,
-            "content": content
+            "content": content[:self.max_content_chars],
+            "headers": self.extract_classifier_headers(msg)
         }
+
+    def extract_classifier_headers(self, msg) -> Dict[str, str]:
+        """保留分类规则使用的邮件头"""
+        return {name: self.decode_mime_words(msg[name]) for name in CLASSIFIER_HEADERS if msg[name] is not None}
     
     def classify_email(self, email_data: Dict) -> Dict:
-        """使用模型对邮件进行分类"""
-        prompt = f"""
-        请对以下邮件进行分类，分类结果只能是：资讯类、任务类、无法分类
-
-        邮件标题：{email_data['title']}
-        发件人：{email_data['sender']}
-        邮件内容：{email_data['content'][:500]}...
+        """对邮件进行分类，依次尝试缓存、邮件头规则和n-gram模型，置信度不足时调用大模型
 
-        请直接返回分类结果：
+        任务类邮件的结果中还包含deadline和action。由前几级判定为任务类的
+        邮件仍需调用一次模型提取这两项，调用模型分类的邮件不会重复调用。
         """
+        result = self.classifier.classify(email_data, self.db_utils, self.classify_email_with_model)
+        if result["category"] == EmailCategory.TASK.value and "deadline" not in result:
+            analysis = self.classify_email_with_model(email_data)
+            result = dict(result, deadline=analysis["deadline"], action=analysis["action"])
+        return result
+
+    def classify_email_with_model(self, email_data: Dict) -> Dict:
+        """使用模型对邮件进行分类，同一次调用中提取任务的截止时间和待办事项"""
+        prompt = build_analysis_prompt(
+            email_data['title'], email_data['content'], email_data['sender'], email_data.get('time', '')
+        )
         
         try:
-            classification = self.model_service.generate_response(prompt)
-            
-            # 解析分类结果
-            if "任务类" in classification:
-                category = EmailCategory.TASK
-            elif "资讯类" in classification:
-                category = EmailCategory.NEWS
-            else:
-                category = EmailCategory.UNCLASSIFIED
+            # 通过微批调度器提交，并发的请求会合并为一次批量推理；输出按Schema约束为JSON
+            output = self.model_service.submit(
+                prompt, self.model_service.analysis_max_new_tokens, ANALYSIS_SCHEMA
+            )
+            analysis = parse_analysis(output)
                 
             return {
-                "category": category.value,
-                "classification_detail": classification
+                "category": analysis["category"].value,
+                "classification_detail": output,
+                "deadline": analysis["deadline"],
+                "action": analysis["action"]
             }
         except Exception as e:
-            print(f"邮件分类失败: {e}")
+            logger.warning("邮件分类失败: %s", e, exc_info=True, extra={"email_id": email_data.get("email_id")})
             return {
                 "category": EmailCategory.UNCLASSIFIED.value,
-                "classification_detail": "分类失败"
+                "classification_detail": "分类失败",
+                "deadline": None,
+                "action": None
             }
     
-    def process_new_emails(self) -> List[Dict]:
+    @property
+    def sync_state_key(self) -> str:
+        """增量同步状态在user_config表中的键"""
+        return f"imap_sync:{self.email_addr}:{self.mailbox}"
+
+    def get_mailbox_status(self) -> Dict[str, int]:
+        """获取邮箱的UIDVALIDITY和UIDNEXT"""
+        status, data = self.mail.status(self.mailbox, '(UIDVALIDITY UIDNEXT)')
+        if status != 'OK':
+            raise imaplib.IMAP4.error(f"获取邮箱状态失败: {data}")
+        return {key.decode(): int(value) for key, value in _STATUS_ITEM_RE.findall(data[0])}
+
+    def load_sync_state(self) -> Dict:
+        """读取上次同步的UIDVALIDITY和最大UID"""
+        value = self.db_utils.get_config(self.sync_state_key)
+        if not value:
+            return {}
+        try:
+            return json.loads(value)
+        except ValueError:
+            return {}
+
+    def save_sync_state(self, uidvalidity: int, last_uid: int):
+        """保存同步高水位"""
+        self.db_utils.set_config(
+            self.sync_state_key,
+            json.dumps({"uidvalidity": uidvalidity, "last_uid": last_uid})
+        )
+
+    def fetch_email_batches(self, uids: List[int]) -> Iterator[List[Dict]]:
+        """按批次获取邮件头部和正文部分
+
+        先获取头部和BODYSTRUCTURE，再只下载每封邮件中用于提取正文的
+        text/plain（没有时为text/html）部分的前max_body_bytes字节，
+        附件和内嵌邮件不会被下载。
+        """
+        for start in range(0, len(uids), self.batch_size):
+            message_set = _compress_message_set(uids[start:start + self.batch_size])
+            with IMAP_FETCH_SECONDS.time(stage="header"):
+                status, msg_data = self.mail.uid('FETCH', message_set, '(UID BODYSTRUCTURE BODY.PEEK[HEADER])')
+            if status != 'OK':
+                logger.warning("批量获取邮件失败: %s", message_set, extra={"response": msg_data})
+                continue
+
+            batch = [fetched for fetched in parse_fetch_response(msg_data) if fetched["uid"]]
+            self.fetch_text_parts(batch)
+            yield batch
+
+            # 使用PEEK获取不会改变已读状态，整批处理完成后再统一标记
+            self.mail.uid('STORE', message_set, '+FLAGS', '\\Seen')
+
+    def fetch_text_parts(self, batch: List[Dict]):
+        """为一批邮件下载正文部分，结果放在各邮件的text_part和text中"""
+        # 同一部分编号的邮件合并为一次FETCH，通常只有 1 和 1.1 等少数几组
+        sections: Dict[str, List[Dict]] = {}
+        for fetched in batch:
+            part = select_text_part(fetched["items"].get("BODYSTRUCTURE"))
+            fetched["text_part"] = part
+            fetched["text"] = b""
+            if part:
+                sections.setdefault(part["section"], []).append(fetched)
+
+        for section, group in sections.items():
+            by_uid = {fetched["uid"]: fetched for fetched in group}
+            message_set = _compress_message_set([int(uid) for uid in by_uid])
+            with IMAP_FETCH_SECONDS.time(stage="body"):
+                status, msg_data = self.mail.uid(
+                    'FETCH', message_set, f'(UID BODY.PEEK[{section}]<0.{self.max_body_bytes}>)'
+                )
+            if status != 'OK':
+                logger.warning("获取邮件正文失败: %s", message_set, extra={"response": msg_data})
+                continue
+            for response in parse_fetch_response(msg_data):
+                fetched = by_uid.get(response["uid"])
+                if fetched is not None:
+                    fetched["text"] = response["items"].get(f"BODY[{section}]") or b""
+
+    def plan_sync(self, incremental: bool = True, limit: Optional[int] = None) -> Dict:
+        """确定本次需要获取的邮件UID
+
+        增量模式下只获取UID大于上次同步高水位的邮件；首次同步或
+        UIDVALIDITY变化时退回到获取未读邮件。指定limit时只取UID最小的
+        limit封，其余留到下次同步。
+        """
+        mailbox_status = self.get_mailbox_status()
+        uidvalidity = mailbox_status["UIDVALIDITY"]
+
+        last_uid = None
+        if incremental:
+            state = self.load_sync_state()
+            if state.get("uidvalidity") == uidvalidity:
+                last_uid = state.get("last_uid")
+
+        if last_uid is None:
+            status, messages = self.mail.uid('SEARCH', None, 'UNSEEN')
+        else:
+            status, messages = self.mail.uid('SEARCH', None, f'UID {last_uid + 1}:*')
+        # "n:*" 在没有新邮件时仍会返回当前最大UID，需要过滤
+        uids = sorted(int(uid) for uid in messages[0].split() if int(uid) > (last_uid or 0))
+        remaining = 0
+        if limit is not None and len(uids) > limit:
+            remaining = len(uids) - limit
+            uids = uids[:limit]
+
+        return {
+            "incremental": incremental,
+            "uidvalidity": uidvalidity,
+            "uidnext": mailbox_status["UIDNEXT"],
+            "last_uid": last_uid,
+            "uids": uids,
+            "remaining": remaining
+        }
+
+    def finish_sync(self, plan: Dict, last_uid: Optional[int] = None):
+        """同步结束后推进高水位"""
+        if not plan["incremental"]:
+            return
+        if last_uid is None and plan["last_uid"] is None and plan["uids"]:
+            # 首次同步按UNSEEN获取，没有一封连续处理成功时高水位定在第一封之前，
+            # 否则保存0会使下次从UID 1开始重新获取整个邮箱，包括已读邮件
+            last_uid = min(plan["uids"]) - 1
+        last_uid = max(last_uid or 0, plan["last_uid"] or 0)
+        if not plan.get("remaining") and last_uid >= max(plan["uids"], default=0):
+            # 所有邮件都已处理，高水位推进到当前邮箱的最大UID
+            last_uid = max(last_uid, plan["uidnext"] - 1)
+        self.save_sync_state(plan["uidvalidity"], last_uid)
+
+    def parse_fetched_email(self, fetched: Dict, uidvalidity: int) -> Dict:
+        """把FETCH得到的原始数据解析为邮件内容"""
+        with EMAIL_PARSE_SECONDS.time():
+            return self._parse_fetched_email(fetched, uidvalidity)
+
+    def _parse_fetched_email(self, fetched: Dict, uidvalidity: int) -> Dict:
+        msg = email.message_from_bytes(fetched["items"].get("BODY[HEADER]") or b"")
+        part = fetched.get("text_part")
+        content = ""
+        if part:
+            content = decode_part(
+                fetched.get("text", b""), part["encoding"], part["charset"],
+                part["subtype"], self.max_content_chars
+            )
+
+        email_content = {
+            "title": self.decode_mime_words(msg.get('Subject', '')),
+            "sender": self.decode_mime_words(msg.get('From', '')),
+            "time": msg.get('Date', ''),
+            "content": content,
+            "headers": self.extract_classifier_headers(msg),
+            "email_id": f"{uidvalidity}:{fetched['uid']}",
+            "uid": int(fetched["uid"])
+        }
+        return email_content
+
+    def iter_new_emails(self, incremental: bool = True) -> Iterator[Dict]:
+        """逐封产出解析后的新邮件"""
+        plan = self.plan_sync(incremental)
+        last_uid = None
+
+        for batch in self.fetch_email_batches(plan["uids"]):
+            for fetched in batch:
+                yield self.parse_fetched_email(fetched, plan["uidvalidity"])
+
+            # 整批处理完成后推进高水位，中途失败时下次从该批次重新开始
+            batch_uids = [int(fetched["uid"]) for fetched in batch if fetched["uid"]]
+            if incremental and batch_uids:
+                last_uid = max(batch_uids + [last_uid or 0])
+                self.save_sync_state(plan["uidvalidity"], last_uid)
+
+        self.finish_sync(plan, last_uid)
+
+    def build_result(self, email_content: Dict, classification: Dict) -> Dict:
+        """组装处理结果"""
+        return {
+            "email_id": email_content["email_id"],
+            "title": email_content["title"],
+            "sender": email_content["sender"],
+            "time": email_content["time"],
+            "content": email_content["content"],
+            "category": classification["category"],
+            "deadline": classification.get("deadline"),
+            "action": classification.get("action")
+        }
+
+    def process_new_emails(self, incremental: bool = True) -> List[Dict]:
         """处理新邮件"""
-        if not hasattr(self, 'mail'):
-            if not self.connect():
-                return []
-        
+        processed_emails = []
         try:
-            # 搜索未读邮件
-            status, messages = self.mail.search(None, 'UNSEEN')
-            email_ids = messages[0].split()
-            
-            processed_emails = []
-            
-            for email_id in email_ids[-10:]:  # 只处理最新的10封邮件
-                status, msg_data = self.mail.fetch(email_id, '(RFC822)')
+            # 连接管理器保证同一时间只有一个处理流程使用该连接
+            with self.connection_manager.connection() as mail:
+                self.mail = mail
+                for email_content in self.iter_new_emails(incremental):
+                    # 分类邮件
+                    classification = self.classify_email(email_content)
                 
-                for response_part in msg_data:
-                    if isinstance(response_part, tuple):
-                        msg = email.message_from_bytes(response_part[1])
-                        
-                        # 提取邮件内容
-                        email_content = self.extract_email_content(msg)
-                        
-                        # 分类邮件
-                        classification = self.classify_email(email_content)
-                        
-                        # 构建结果
-                        result = {
-                            "email_id": email_id.decode(),
-                            "title": email_content["title"],
-                            "sender": email_content["sender"],
-                            "time": email_content["time"],
-                            "content": email_content["content"],
-                            "category": classification["category"]
-                        }
-                        
-                        processed_emails.append(result)
-                        
-                        # 保存到数据库
-                        self.save_email_to_db(result)
-            
-            return processed_emails
+                    # 构建结果
+                    result = self.build_result(email_content, classification)
+                
+                    processed_emails.append(result)
+                
+                    # 保存到数据库
+                    self.save_email_to_db(result)
             
         except Exception as e:
-            print(f"处理邮件失败: {e}")
-            return []
+            logger.exception("处理邮件失败: %s", e)
+        return processed_emails
     
     def save_email_to_db(self, email_data: Dict):
-        """保存邮件到数据库"""
-        db = next(get_db())
+        """保存单封邮件到数据库"""
         try:
-            # 检查邮件是否已存在
-            existing_email = db.query(Email).filter(Email.email_id == email_data["email_id"]).first()
-            if existing_email:
-                return
-            
-            # 创建新邮件记录
-            email_record = Email(
-                email_id=email_data["email_id"],
-                title=email_data["title"],
-                sender=email_data["sender"],
-                content=email_data["content"],
-                category=EmailCategory(email_data["category"])
-            )
-            
-            db.add(email_record)
-            db.commit()
-            
+            self.save_emails_to_db([email_data])
         except Exception as e:
-            print(f"保存邮件失败: {e}")
+            logger.exception("保存邮件失败: %s", e, extra={"email_id": email_data.get("email_id")})
+
+    def save_emails_to_db(self, emails: List[Dict]) -> int:
+        """在一个事务中批量保存邮件，任务类邮件同时生成任务记录
+
+        已存在的邮件（email_id重复）会被跳过，返回新写入的邮件数。
+        """
+        if not emails:
+            return 0
+        db = self.session_factory()
+        try:
+            email_ids = [email_data["email_id"] for email_data in emails]
+            existing = {
+                row[0] for row in
+                db.execute(select(Email.email_id).where(Email.email_id.in_(email_ids)))
+            }
+
+            email_rows = []
+            task_rows = []
+            seen = set(existing)
+            for email_data in emails:
+                if email_data["email_id"] in seen:
+                    continue
+                seen.add(email_data["email_id"])
+                category = EmailCategory(email_data["category"])
+                row = {
+                    "email_id": email_data["email_id"],
+                    "title": email_data["title"],
+                    "sender": email_data["sender"],
+                    "received_time": parse_received_time(email_data.get("time")),
+                    "content": email_data["content"],
+                }
+                email_rows.append(dict(row, category=category))
+                if category == EmailCategory.TASK:
+                    task_rows.append(dict(
+                        row,
+                        status=TaskStatus.NOT_STARTED,
+                        feedback_time=email_data.get("deadline"),
+                        feedback_content=email_data.get("action")
+                    ))
+
+            inserted = set()
+            if email_rows:
+                # 上面的查询与写入之间其他写入者可能已插入同一封邮件，冲突的行被跳过，
+                # 只为本事务实际插入的邮件生成任务，避免任务重复
+                inserted = set(db.scalars(
+                    sqlite_insert(Email).on_conflict_do_nothing(index_elements=["email_id"])
+                    .returning(Email.email_id),
+                    email_rows
+                ))
+            task_rows = [row for row in task_rows if row["email_id"] in inserted]
+            if task_rows:
+                db.execute(insert(Task), task_rows)
+            db.commit()
+            return len(inserted)
+        except Exception:
             db.rollback()
+            raise
         finally:
-            db.close()
\ No newline at end of file
+            db.close()
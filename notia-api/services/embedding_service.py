@@ -0,0 +1,167 @@
+import os
+import re
+import threading
+import zlib
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from database.db_utils import DatabaseUtils
+
+# 向量化配置，可通过环境变量覆盖
+EMBEDDING_CONFIG = {
+    "backend": os.environ.get("NOTIA_EMBEDDING_BACKEND", "hashing"),  # hashing 或 openvino
+    "model_path": os.environ.get("NOTIA_EMBEDDING_MODEL_PATH", ""),
+    "device": os.environ.get("NOTIA_EMBEDDING_DEVICE", "CPU"),
+    "dim": 512,  # hashing后端的向量维度
+}
+
+_LATIN_WORD_RE = re.compile(r'[a-z0-9]+')
+_CJK_RE = re.compile(r'[一-鿿]+')
+
+
+class HashingEmbedder:
+    """基于特征哈希的轻量向量化
+
+    中文按单字和相邻二字切分，英文按单词切分，哈希到固定维度并
+    做L2归一化。不依赖模型，适合作为默认实现。
+    """
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    def _features(self, text: str) -> List[str]:
+        text = text.lower()
+        features = _LATIN_WORD_RE.findall(text)
+        for run in _CJK_RE.findall(text):
+            features.extend(run)
+            features.extend(run[i:i + 2] for i in range(len(run) - 1))
+        return features
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                h = zlib.crc32(feature.encode('utf-8'))
+                # 用哈希的最高位决定符号，减少冲突带来的偏差
+                vectors[row, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+
+class OpenVINOEmbedder:
+    """基于openvino_genai.TextEmbeddingPipeline的向量化"""
+
+    def __init__(self, model_path: str, device: str = "CPU"):
+        import openvino_genai as ov_genai
+
+        self.pipe = ov_genai.TextEmbeddingPipeline(model_path, device)
+        self._lock = threading.Lock()
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        with self._lock:
+            vectors = np.asarray(self.pipe.embed_documents(texts), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+
+def create_embedder():
+    """按配置创建向量化实现"""
+    if EMBEDDING_CONFIG["backend"] == "openvino":
+        return OpenVINOEmbedder(EMBEDDING_CONFIG["model_path"], EMBEDDING_CONFIG["device"])
+    return HashingEmbedder(EMBEDDING_CONFIG["dim"])
+
+
+def pack_embedding(vector: np.ndarray) -> bytes:
+    """把向量打包为float32字节串，存入BLOB列"""
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+
+def unpack_embedding(blob: bytes) -> np.ndarray:
+    return np.frombuffer(blob, dtype=np.float32)
+
+
+class VectorIndex:
+    """knowledge_base的内存向量索引
+
+    所有向量放在一个连续的float32矩阵中，查询时一次矩阵乘法得到
+    全部余弦相似度。新增条目时增量追加，不重建整个矩阵。
+    """
+
+    def __init__(self, embedder=None, db_utils: Optional[DatabaseUtils] = None):
+        self.embedder = embedder or create_embedder()
+        self.db_utils = db_utils or DatabaseUtils()
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._matrix: Optional[np.ndarray] = None
+        self._size = 0
+        self._max_id = 0
+        self._dim: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def embed(self, text: str) -> np.ndarray:
+        return self.embedder.embed([text])[0]
+
+    @property
+    def dim(self) -> int:
+        if self._dim is None:
+            self._dim = len(self.embed(""))
+        return self._dim
+
+    def _append(self, ids: List[int], vectors: np.ndarray):
+        """追加向量，容量不足时按倍数扩容"""
+        needed = self._size + len(ids)
+        if self._matrix is None or needed > len(self._matrix):
+            capacity = max(needed, 2 * (len(self._matrix) if self._matrix is not None else 0), 64)
+            matrix = np.zeros((capacity, vectors.shape[1]), dtype=np.float32)
+            ids_buffer = np.zeros(capacity, dtype=np.int64)
+            if self._matrix is not None and self._size:
+                matrix[:self._size] = self._matrix[:self._size]
+                ids_buffer[:self._size] = self._ids[:self._size]
+            self._matrix, self._ids = matrix, ids_buffer
+
+        self._matrix[self._size:needed] = vectors
+        self._ids[self._size:needed] = ids
+        self._size = needed
+        self._max_id = max([self._max_id] + list(ids))
+
+    def refresh(self):
+        """加载上次之后新增的条目，缺少向量的条目会在此时补算"""
+        with self._lock:
+            rows = self.db_utils.execute_query(
+                "SELECT id, title, content, embedding FROM knowledge_base WHERE id > ? ORDER BY id",
+                (self._max_id,)
+            )
+            if not rows:
+                return
+
+            # 没有向量或维度与当前向量化实现不一致的条目需要重新计算
+            expected_bytes = self.dim * 4
+            missing = [row for row in rows if not row['embedding'] or len(row['embedding']) != expected_bytes]
+            if missing:
+                vectors = self.embedder.embed([f"{row['title']}\n{row['content']}" for row in missing])
+                for row, vector in zip(missing, vectors):
+                    row['embedding'] = pack_embedding(vector)
+                    self.db_utils.execute_update(
+                        "UPDATE knowledge_base SET embedding = ? WHERE id = ?",
+                        (row['embedding'], row['id'])
+                    )
+
+            vectors = np.stack([unpack_embedding(row['embedding']) for row in rows])
+            self._append([row['id'] for row in rows], vectors)
+
+    def search(self, query: str, top_k: int = 5) -> List[Tuple[int, float]]:
+        """返回与查询最相似的top_k个条目ID及相似度"""
+        self.refresh()
+        with self._lock:
+            if not self._size:
+                return []
+            matrix = self._matrix[:self._size]
+            ids = self._ids[:self._size]
+
+        scores = matrix @ self.embed(query)
+        k = min(top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(ids[i]), float(scores[i])) for i in top]
@@ -0,0 +1,63 @@
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+from .metrics import EXECUTOR_WAIT_SECONDS, QUEUE_DEPTH
+from .tracing import span
+
+# 各类阻塞操作使用独立的线程池，互不抢占
+EXECUTOR_CONFIG = {
+    "db": 8,      # SQLAlchemy / sqlite3 查询
+    "imap": 2,    # IMAP收取和邮件处理任务
+    "model": 2,   # 模型推理，后端本身串行执行，线程数不宜过多
+}
+
+_executors: Dict[str, ThreadPoolExecutor] = {}
+_lock = threading.Lock()
+
+
+def get_executor(name: str) -> ThreadPoolExecutor:
+    """获取指定名称的线程池，首次使用时创建"""
+    executor = _executors.get(name)
+    if executor is None:
+        with _lock:
+            executor = _executors.get(name)
+            if executor is None:
+                executor = ThreadPoolExecutor(
+                    max_workers=EXECUTOR_CONFIG[name], thread_name_prefix=f"notia-{name}"
+                )
+                _executors[name] = executor
+                # ThreadPoolExecutor没有公开排队数量，读取其内部队列
+                QUEUE_DEPTH.set_function(executor._work_queue.qsize, queue=f"executor_{name}")
+    return executor
+
+
+async def run_in_executor(name: str, func: Callable, *args, **kwargs) -> Any:
+    """在指定线程池中执行阻塞函数，不阻塞事件循环
+
+    函数在调用方上下文的副本中执行，记在当前请求的Trace下，
+    span同时记录在线程池队列中等待的时间。
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    submitted = time.perf_counter()
+
+    def run():
+        wait = time.perf_counter() - submitted
+        EXECUTOR_WAIT_SECONDS.observe(wait, pool=name)
+        with span(f"{name}.{getattr(func, '__name__', 'call')}", wait_ms=round(wait * 1000, 2)):
+            return func(*args, **kwargs)
+
+    return await loop.run_in_executor(get_executor(name), context.run, run)
+
+
+def shutdown_executors(wait: bool = True):
+    """关闭所有线程池"""
+    with _lock:
+        executors = list(_executors.values())
+        _executors.clear()
+    for executor in executors:
+        executor.shutdown(wait=wait)
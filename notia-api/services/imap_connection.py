@@ -0,0 +1,213 @@
+import imaplib
+import logging
+import select
+import ssl
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class IMAPConnectionManager:
+    """应用级的IMAP长连接管理器
+
+    同一账户复用一条已登录并选中邮箱的连接，使用前做健康检查，
+    连接断开时自动重连。
+    """
+
+    def __init__(self, imap_server: str, email_addr: str, password: str,
+                 mailbox: str = 'INBOX', port: int = imaplib.IMAP4_SSL_PORT,
+                 use_ssl: bool = True, timeout: float = 30,
+                 health_check_interval: float = 60):
+        self.imap_server = imap_server
+        self.email_addr = email_addr
+        self.password = password
+        self.mailbox = mailbox
+        self.port = port
+        self.use_ssl = use_ssl
+        self.timeout = timeout
+        # 距离上次使用超过该秒数时，复用前先发送NOOP检查连接
+        self.health_check_interval = health_check_interval
+
+        self._conn: Optional[imaplib.IMAP4] = None
+        self._last_used = 0.0
+        self._lock = threading.RLock()
+
+    def open_connection(self) -> imaplib.IMAP4:
+        """新建一条已登录并选中邮箱的连接"""
+        if self.use_ssl:
+            conn = imaplib.IMAP4_SSL(self.imap_server, self.port, timeout=self.timeout)
+        else:
+            conn = imaplib.IMAP4(self.imap_server, self.port, timeout=self.timeout)
+        try:
+            conn.login(self.email_addr, self.password)
+            conn.select(self.mailbox)
+        except Exception:
+            self._safe_logout(conn)
+            raise
+        return conn
+
+    def _is_healthy(self, conn: imaplib.IMAP4) -> bool:
+        """检查连接是否仍然可用"""
+        if time.monotonic() - self._last_used < self.health_check_interval:
+            return True
+        try:
+            status, _ = conn.noop()
+            return status == 'OK'
+        except (imaplib.IMAP4.error, OSError):
+            return False
+
+    @staticmethod
+    def _safe_logout(conn: imaplib.IMAP4):
+        try:
+            conn.logout()
+        except Exception:
+            pass
+
+    @contextmanager
+    def connection(self):
+        """独占使用连接，必要时自动重连"""
+        with self._lock:
+            if self._conn is not None and not self._is_healthy(self._conn):
+                logger.info("IMAP连接已失效，正在重连", extra={"server": self.imap_server})
+                self._safe_logout(self._conn)
+                self._conn = None
+            if self._conn is None:
+                self._conn = self.open_connection()
+
+            try:
+                yield self._conn
+            except (imaplib.IMAP4.abort, OSError):
+                # 连接级错误，丢弃连接，下次使用时重连
+                self._safe_logout(self._conn)
+                self._conn = None
+                raise
+            finally:
+                self._last_used = time.monotonic()
+
+    def close(self):
+        """关闭连接"""
+        with self._lock:
+            if self._conn is not None:
+                self._safe_logout(self._conn)
+                self._conn = None
+
+
+class IMAPIdleWatcher:
+    """使用IMAP IDLE监听新邮件的后台线程
+
+    IDLE占用一条独立连接，收到新邮件通知后调用回调函数；服务器
+    不支持IDLE时退化为定时轮询。
+    """
+
+    def __init__(self, connection_manager: IMAPConnectionManager,
+                 on_new_mail: Callable[[], None],
+                 idle_timeout: float = 29 * 60, poll_interval: float = 300,
+                 retry_interval: float = 30):
+        self.connection_manager = connection_manager
+        self.on_new_mail = on_new_mail
+        # RFC 2177 建议每29分钟内重新发起一次IDLE
+        self.idle_timeout = idle_timeout
+        self.poll_interval = poll_interval
+        self.retry_interval = retry_interval
+
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """启动后台监听"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="imap-idle", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5):
+        """停止后台监听"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self):
+        # 启动时先处理一次积压邮件
+        self._notify()
+        while not self._stop_event.is_set():
+            conn = None
+            try:
+                conn = self.connection_manager.open_connection()
+                if 'IDLE' not in conn.capabilities:
+                    logger.info("IMAP服务器不支持IDLE，改为定时轮询")
+                    IMAPConnectionManager._safe_logout(conn)
+                    conn = None
+                    while not self._stop_event.wait(self.poll_interval):
+                        self._notify()
+                    return
+
+                while not self._stop_event.is_set():
+                    if self._idle_once(conn):
+                        self._notify()
+            except Exception as e:
+                logger.warning("IMAP IDLE监听失败: %s", e)
+                self._stop_event.wait(self.retry_interval)
+            finally:
+                if conn is not None:
+                    IMAPConnectionManager._safe_logout(conn)
+
+    def _notify(self):
+        try:
+            self.on_new_mail()
+        except Exception as e:
+            logger.exception("处理新邮件通知失败: %s", e)
+
+    @staticmethod
+    def _has_buffered_data(conn: imaplib.IMAP4) -> bool:
+        """不阻塞地检查是否已有可读数据
+
+        imaplib经缓冲文件读取，服务器把EXISTS与上一行放在同一个数据包中发送时，
+        这部分数据已在读缓冲（或SSL层的解密缓冲）中，select不会再报告可读。
+        """
+        timeout = conn.sock.gettimeout()
+        conn.sock.setblocking(False)
+        try:
+            return bool(conn.file.peek(1))
+        except (BlockingIOError, ssl.SSLWantReadError):
+            return False
+        finally:
+            conn.sock.settimeout(timeout)
+
+    def _idle_once(self, conn: imaplib.IMAP4) -> bool:
+        """执行一轮IDLE，返回期间是否有新邮件到达"""
+        tag = conn._new_tag()
+        conn.send(tag + b' IDLE\r\n')
+        line = conn.readline()
+        if not line.startswith(b'+'):
+            raise imaplib.IMAP4.error(f"IDLE命令被拒绝: {line!r}")
+
+        new_mail = False
+        deadline = time.monotonic() + self.idle_timeout
+        try:
+            while not new_mail and not self._stop_event.is_set() and time.monotonic() < deadline:
+                # 以短超时等待可读，便于及时响应停止信号；已读入缓冲的数据
+                # 不会再使套接字可读，需要先检查
+                if not self._has_buffered_data(conn):
+                    readable, _, _ = select.select([conn.sock], [], [], 1.0)
+                    if not readable:
+                        continue
+                line = conn.readline()
+                if not line:
+                    raise imaplib.IMAP4.abort("IDLE期间连接被关闭")
+                if line.rstrip().endswith(b'EXISTS'):
+                    new_mail = True
+        finally:
+            conn.send(b'DONE\r\n')
+            while True:
+                line = conn.readline()
+                if not line:
+                    raise imaplib.IMAP4.abort("结束IDLE时连接被关闭")
+                if line.rstrip().endswith(b'EXISTS'):
+                    new_mail = True
+                if line.startswith(tag):
+                    break
+        return new_mail
@@ -0,0 +1,188 @@
+"""IMAP FETCH响应和BODYSTRUCTURE解析"""
+from typing import Dict, List, Optional, Tuple, Union
+
+# 解析结果：原子和字符串为bytes，NIL为None，括号列表为list
+Token = Union[bytes, None, list]
+
+_DIGITS = b"0123456789"
+
+
+def _join_fetch_data(msg_data: list) -> bytes:
+    """把imaplib拆开的响应重新拼为原始字节流，字面量按 {n}\\r\\n 原样还原"""
+    chunks = []
+    for part in msg_data:
+        if isinstance(part, tuple):
+            chunks.append(part[0])
+            chunks.append(b"\r\n")
+            chunks.append(part[1])
+        elif isinstance(part, bytes):
+            chunks.append(part)
+    return b"".join(chunks)
+
+
+def _parse_token(data: bytes, pos: int) -> Tuple[Token, int]:
+    """从pos开始解析一个值，返回(值, 结束位置)"""
+    while pos < len(data) and data[pos] in b" \r\n":
+        pos += 1
+    char = data[pos:pos + 1]
+
+    if char == b"(":
+        items = []
+        pos += 1
+        while True:
+            while pos < len(data) and data[pos] in b" \r\n":
+                pos += 1
+            if pos >= len(data):
+                raise ValueError("括号未闭合")
+            if data[pos:pos + 1] == b")":
+                return items, pos + 1
+            item, pos = _parse_token(data, pos)
+            items.append(item)
+
+    if char == b'"':
+        out = bytearray()
+        pos += 1
+        while pos < len(data):
+            c = data[pos]
+            if c == 0x5C:  # 反斜杠转义
+                out.append(data[pos + 1])
+                pos += 2
+                continue
+            if c == 0x22:
+                return bytes(out), pos + 1
+            out.append(c)
+            pos += 1
+        raise ValueError("字符串未闭合")
+
+    if char == b"{":
+        end = data.index(b"}", pos)
+        size = int(data[pos + 1:end])
+        start = end + 1
+        if data[start:start + 2] == b"\r\n":
+            start += 2
+        return data[start:start + size], start + size
+
+    # 原子，BODY[...]中的方括号内可以有空格和括号，<n>为部分获取的起始偏移
+    start = pos
+    depth = 0
+    while pos < len(data):
+        c = data[pos:pos + 1]
+        if c == b"[":
+            depth += 1
+        elif c == b"]":
+            depth -= 1
+        elif depth == 0 and c in (b" ", b"(", b")", b"\r", b"\n"):
+            break
+        pos += 1
+    atom = data[start:pos]
+    if atom.upper() == b"NIL":
+        return None, pos
+    return atom, pos
+
+
+def parse_fetch_response(msg_data: list) -> List[Dict]:
+    """把UID FETCH的响应解析为每封邮件一项
+
+    返回 [{"seq": "12", "uid": "345", "items": {"BODY[HEADER]": b"...",
+    "BODYSTRUCTURE": [...]}}]，部分获取的 <n> 后缀会被去掉。
+    """
+    data = _join_fetch_data(msg_data)
+    messages = []
+    pos = 0
+    while pos < len(data):
+        while pos < len(data) and data[pos] in b" \r\n":
+            pos += 1
+        start = pos
+        while pos < len(data) and data[pos] in _DIGITS:
+            pos += 1
+        if start == pos:
+            # 不是FETCH数据（如服务器附带的其他未标记响应），跳到下一行
+            newline = data.find(b"\n", pos)
+            if newline < 0:
+                break
+            pos = newline + 1
+            continue
+
+        seq = data[start:pos].decode()
+        values, pos = _parse_token(data, pos)
+        if not isinstance(values, list):
+            continue
+        items = {}
+        for index in range(0, len(values) - 1, 2):
+            key = values[index]
+            if not isinstance(key, bytes):
+                continue
+            name = key.decode("ascii", "replace").upper()
+            if "<" in name:
+                name = name[:name.index("<")]
+            items[name] = values[index + 1]
+        uid = items.pop("UID", None)
+        messages.append({
+            "seq": seq,
+            "uid": uid.decode() if isinstance(uid, bytes) else None,
+            "items": items
+        })
+    return messages
+
+
+def _text(value: Token) -> str:
+    return value.decode("ascii", "replace").lower() if isinstance(value, bytes) else ""
+
+
+def _params(value: Token) -> Dict[str, str]:
+    """BODYSTRUCTURE中的 ("charset" "utf-8" "name" "a.txt") 参数列表"""
+    if not isinstance(value, list):
+        return {}
+    return {_text(value[i]): (value[i + 1] or b"").decode("utf-8", "replace")
+            for i in range(0, len(value) - 1, 2)}
+
+
+def _disposition(part: list, is_text: bool) -> str:
+    # 扩展字段位置：基本字段7个，text类型多一个行数，随后是MD5和Content-Disposition
+    index = 9 if is_text else 8
+    if len(part) > index and isinstance(part[index], list) and part[index]:
+        return _text(part[index][0])
+    return ""
+
+
+def list_text_parts(structure: Token, section: str = "") -> List[Dict]:
+    """列出BODYSTRUCTURE中所有非附件的text/plain和text/html部分"""
+    if not isinstance(structure, list) or not structure:
+        return []
+
+    if isinstance(structure[0], list):
+        # multipart：先是各子部分，然后是子类型
+        parts = []
+        number = 0
+        for child in structure:
+            if not isinstance(child, list):
+                break
+            number += 1
+            parts.extend(list_text_parts(child, f"{section}.{number}" if section else str(number)))
+        return parts
+
+    main_type, sub_type = _text(structure[0]), _text(structure[1])
+    if main_type != "text" or sub_type not in ("plain", "html"):
+        # 附件、图片和内嵌的message/rfc822都不下载
+        return []
+    if _disposition(structure, True) == "attachment":
+        return []
+    params = _params(structure[2])
+    size = structure[6] if len(structure) > 6 else None
+    return [{
+        "section": section or "1",
+        "subtype": sub_type,
+        "charset": params.get("charset", ""),
+        "encoding": _text(structure[5]) or "7bit",
+        "size": int(size) if isinstance(size, bytes) and size.isdigit() else 0
+    }]
+
+
+def select_text_part(structure: Token) -> Optional[Dict]:
+    """选出用于提取正文的部分，优先text/plain，没有时使用text/html"""
+    parts = list_text_parts(structure)
+    for subtype in ("plain", "html"):
+        for part in parts:
+            if part["subtype"] == subtype:
+                return part
+    return None
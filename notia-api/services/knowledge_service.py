@@ -1,37 +1,61 @@
+import logging
 from database.db_utils import DatabaseUtils
+from .embedding_service import VectorIndex, pack_embedding
 from typing import List, Dict
 
+logger = logging.getLogger(__name__)
+
 class KnowledgeService:
-    def __init__(self):
+    def __init__(self, min_score: float = 0.1):
         self.db_utils = DatabaseUtils()
-    
-    def search(self, query: str) -> List[Dict]:
-        """搜索知识库"""
+        self.vector_index = VectorIndex(db_utils=self.db_utils)
+        # 相似度低于该值的结果不返回
+        self.min_score = min_score
+        # 知识库内容版本，新增知识时递增，用于使检索缓存失效
+        self.version = 0
+
+    def search(self, query: str, top_k: int = 5) -> List[Dict]:
+        """语义搜索知识库，向量检索失败时退回关键词搜索"""
+        try:
+            matches = [(knowledge_id, score) for knowledge_id, score in self.vector_index.search(query, top_k)
+                       if score >= self.min_score]
+            rows = {row['id']: row for row in self.db_utils.get_knowledge_by_ids([m[0] for m in matches])}
+            results = []
+            for knowledge_id, score in matches:
+                if knowledge_id in rows:
+                    results.append(dict(rows[knowledge_id], score=round(score, 4)))
+            return results
+        except Exception as e:
+            logger.warning("向量搜索失败，改用关键词搜索: %s", e, exc_info=True)
+
         try:
             results = self.db_utils.search_knowledge(query)
             return results
         except Exception as e:
-            print(f"知识库搜索失败: {e}")
+            logger.exception("知识库搜索失败: %s", e)
             return []
-    
+
     def add_knowledge(self, title: str, content: str, source: str = "用户添加") -> bool:
-        """添加知识"""
+        """添加知识，同时写入向量"""
         try:
+            embedding = pack_embedding(self.vector_index.embed(f"{title}\n{content}"))
             query = """
-            INSERT INTO knowledge_base (title, content, source)
-            VALUES (?, ?, ?)
+            INSERT INTO knowledge_base (title, content, source, embedding, created_at)
+            VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
             """
-            self.db_utils.execute_update(query, (title, content, source))
+            self.db_utils.execute_insert(query, (title, content, source, embedding))
+            self.vector_index.refresh()
+            self.version += 1
             return True
         except Exception as e:
-            print(f"添加知识失败: {e}")
+            logger.exception("添加知识失败: %s", e, extra={"title": title})
             return False
-    
+
     def get_all_knowledge(self) -> List[Dict]:
         """获取所有知识"""
         try:
-            query = "SELECT * FROM knowledge_base ORDER BY created_at DESC"
+            query = "SELECT id, title, content, source, created_at FROM knowledge_base ORDER BY created_at DESC"
             return self.db_utils.execute_query(query)
         except Exception as e:
-            print(f"获取知识库失败: {e}")
-            return []
\ No newline at end of file
+            logger.exception("获取知识库失败: %s", e)
+            return []
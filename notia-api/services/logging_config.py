@@ -0,0 +1,83 @@
+"""结构化日志
+
+各模块通过logging.getLogger(__name__)记录日志，由setup_logging统一配置输出：
+默认每条日志输出一行JSON，自动带上当前请求的trace_id，通过extra传入的
+字段原样输出；NOTIA_LOG_FORMAT=text时输出便于阅读的单行文本。
+"""
+import json
+import logging
+import os
+import sys
+from datetime import datetime
+from typing import Optional
+
+from .tracing import current_trace_id
+
+LOG_CONFIG = {
+    "level": os.environ.get("NOTIA_LOG_LEVEL", "INFO"),
+    "format": os.environ.get("NOTIA_LOG_FORMAT", "json"),  # json 或 text
+}
+
+# LogRecord自带的属性，其余属性都是通过extra传入的字段
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "trace_id"}
+
+
+class _TraceIdFilter(logging.Filter):
+    """为日志记录补充当前请求的trace_id"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = current_trace_id()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "trace_id", None):
+            data["trace_id"] = record.trace_id
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                data[key] = value
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """单行文本格式，extra字段以key=value附在消息之后"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s %(message)s")
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        message = super().formatMessage(record)
+        fields = {key: value for key, value in record.__dict__.items()
+                  if key not in _RECORD_ATTRIBUTES and not key.startswith("_")}
+        if getattr(record, "trace_id", None):
+            fields = dict(trace_id=record.trace_id, **fields)
+        if fields:
+            message += " " + " ".join(f"{key}={json.dumps(value, ensure_ascii=False, default=str)}"
+                                      for key, value in fields.items())
+        return message
+
+
+def setup_logging(level: Optional[str] = None, fmt: Optional[str] = None):
+    """配置根日志记录器，重复调用时替换之前添加的处理器"""
+    handler = logging.StreamHandler(sys.stderr)
+    handler.addFilter(_TraceIdFilter())
+    handler.setFormatter(TextFormatter() if (fmt or LOG_CONFIG["format"]) == "text" else JsonFormatter())
+    handler._notia = True
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        if getattr(existing, "_notia", False):
+            root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel((level or LOG_CONFIG["level"]).upper())
@@ -0,0 +1,286 @@
+"""进程内运行指标
+
+不依赖prometheus_client，只实现Prometheus文本格式所需的最小子集：计数器、
+仪表和直方图，支持标签。所有指标登记在REGISTRY中，由/metrics接口输出。
+启动多个uvicorn worker时各worker分别统计，需要逐个采集。
+"""
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+
+from database.config import add_commit_listener
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 默认的耗时分桶（秒）
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# 模型推理的耗时分桶（秒）
+MODEL_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 60)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Sequence[Tuple[str, str]] = ()) -> str:
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """指标基类，labelnames为该指标的标签名"""
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames) or any(name not in labels for name in self.labelnames):
+            raise ValueError(f"指标 {self.name} 的标签应为 {self.labelnames}，实际为 {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        """产出 (名称后缀, 标签, 取值)"""
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        documentation = self.documentation.replace("\\", "\\\\").replace("\n", "\\n")
+        lines = [f"# HELP {self.name} {documentation}", f"# TYPE {self.name} {self.type}"]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    """只增不减的计数器"""
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield "", _format_labels(self.labelnames, key), value
+
+
+class Gauge(Metric):
+    """可增可减的仪表，也可以在采集时调用函数取值"""
+
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._functions: Dict[Tuple[str, ...], Callable[[], float]] = {}
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, func: Callable[[], float], **labels):
+        """采集时调用func取值，同一组标签再次设置时替换原来的函数"""
+        key = self._key(labels)
+        with self._lock:
+            self._functions[key] = func
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+            functions = list(self._functions.items())
+        for key, func in functions:
+            try:
+                values[key] = float(func())
+            except Exception:
+                # 取值失败时本次不输出该样本
+                values.pop(key, None)
+        for key, value in values.items():
+            yield "", _format_labels(self.labelnames, key), value
+
+
+class Histogram(Metric):
+    """分桶直方图，输出累计的 _bucket、_sum 和 _count"""
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        bounds = sorted(float(bound) for bound in buckets)
+        if not bounds or bounds[-1] != math.inf:
+            bounds.append(math.inf)
+        self.buckets = tuple(bounds)
+        # 每组标签对应 [各分桶计数, 总和]，分桶计数不累计，输出时再累加
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """记录with块的执行耗时（秒）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            values = [(key, list(state[0]), state[1]) for key, state in self._values.items()]
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield "_bucket", _format_labels(self.labelnames, key, [("le", _format_value(bound))]), cumulative
+            yield "_sum", _format_labels(self.labelnames, key), total
+            yield "_count", _format_labels(self.labelnames, key), cumulative
+
+
+class MetricsRegistry:
+    """指标注册表，同名指标只登记一次"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"指标 {metric.name} 已以不同的类型或标签登记")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """输出Prometheus文本格式"""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "notia_http_request_duration_seconds", "HTTP请求耗时，流式响应计到响应结束", ("method", "route", "status")
+)
+EXECUTOR_WAIT_SECONDS = REGISTRY.histogram(
+    "notia_executor_wait_seconds", "任务在线程池队列中等待的时间", ("pool",)
+)
+IMAP_FETCH_SECONDS = REGISTRY.histogram(
+    "notia_imap_fetch_duration_seconds", "一次IMAP FETCH命令的耗时，header为头部和结构，body为正文部分", ("stage",)
+)
+EMAIL_PARSE_SECONDS = REGISTRY.histogram(
+    "notia_email_parse_duration_seconds", "单封邮件解析耗时"
+)
+MODEL_GENERATE_SECONDS = REGISTRY.histogram(
+    "notia_model_generate_duration_seconds", "一次批量推理的总耗时", buckets=MODEL_BUCKETS
+)
+MODEL_BATCH_SIZE = REGISTRY.histogram(
+    "notia_model_batch_size", "一次批量推理合并的提示词数量", buckets=(1, 2, 4, 8, 16, 32)
+)
+MODEL_PREFILL_SECONDS = REGISTRY.histogram(
+    "notia_model_prefill_duration_seconds", "首token耗时（prefill），仅openvino后端", buckets=MODEL_BUCKETS
+)
+MODEL_DECODE_SECONDS = REGISTRY.histogram(
+    "notia_model_decode_seconds_per_token", "decode阶段每个输出token的平均耗时，仅openvino后端",
+    buckets=(0.005, 0.01, 0.02, 0.03, 0.05, 0.075, 0.1, 0.2, 0.5, 1)
+)
+MODEL_TOKENS_PER_SECOND = REGISTRY.histogram(
+    "notia_model_tokens_per_second", "每次推理的输出速度（token/秒）",
+    buckets=(1, 2, 5, 10, 20, 30, 50, 75, 100, 200, 500, 1000)
+)
+DB_COMMIT_SECONDS = REGISTRY.histogram(
+    "notia_db_commit_duration_seconds", "SQLite事务提交耗时"
+)
+CACHE_LOOKUPS = REGISTRY.counter(
+    "notia_cache_lookups_total", "缓存查询次数，result为hit或miss", ("cache", "result")
+)
+CACHE_HIT_RATIO = REGISTRY.gauge(
+    "notia_cache_hit_ratio", "进程启动以来的缓存命中率", ("cache",)
+)
+CLASSIFIER_DECISIONS = REGISTRY.counter(
+    "notia_classifier_decisions_total", "分类级联中各层给出的分类次数", ("tier",)
+)
+QUEUE_DEPTH = REGISTRY.gauge(
+    "notia_queue_depth", "队列中等待处理的项目数", ("queue",)
+)
+
+
+def _hit_ratio(cache: str) -> float:
+    hits = CACHE_LOOKUPS.value(cache=cache, result="hit")
+    lookups = hits + CACHE_LOOKUPS.value(cache=cache, result="miss")
+    return hits / lookups if lookups else 0.0
+
+
+for _cache in ("classification", "retrieval"):
+    CACHE_HIT_RATIO.set_function(lambda cache=_cache: _hit_ratio(cache), cache=_cache)
+
+add_commit_listener(DB_COMMIT_SECONDS.observe)
+
+
+def render_metrics() -> str:
+    """输出所有指标"""
+    return REGISTRY.render()
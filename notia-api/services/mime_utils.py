@@ -0,0 +1,111 @@
+"""邮件正文和头部的解码"""
+import base64
+import binascii
+import codecs
+import quopri
+import re
+from email.header import decode_header
+from html import unescape
+from typing import Optional
+
+# 声明的字符集常被用作其超集，按超集解码可减少乱码
+_CHARSET_ALIASES = {
+    "gb2312": "gb18030",
+    "gbk": "gb18030",
+    "x-gbk": "gb18030",
+    "big5": "big5hkscs",
+    "ks_c_5601-1987": "cp949",
+    "iso-8859-1": "cp1252",
+    "us-ascii": "utf-8",
+}
+# 未声明字符集或声明无效时依次尝试
+_FALLBACK_CHARSETS = ("utf-8", "gb18030")
+
+_SCRIPT_STYLE_RE = re.compile(r'<(script|style|head)\b.*?</\1\s*>', re.IGNORECASE | re.DOTALL)
+_COMMENT_RE = re.compile(r'<!--.*?-->', re.DOTALL)
+_BLOCK_TAG_RE = re.compile(r'<\s*(br|/p|/div|/tr|/li|/h[1-6]|/table|p|div|tr|li)\b[^>]*>', re.IGNORECASE)
+_CELL_TAG_RE = re.compile(r'<\s*/?t[dh]\b[^>]*>', re.IGNORECASE)
+_TAG_RE = re.compile(r'<[^>]+>')
+_INLINE_SPACE_RE = re.compile(r'[ \t\r\f\v\u00a0]+')
+_BLANK_LINES_RE = re.compile(r'\n\s*\n+')
+
+
+def _lookup_charset(charset: Optional[str]) -> Optional[str]:
+    if not charset:
+        return None
+    charset = charset.strip().strip('"').lower()
+    charset = _CHARSET_ALIASES.get(charset, charset)
+    try:
+        return codecs.lookup(charset).name
+    except LookupError:
+        return None
+
+
+def decode_bytes(data: bytes, charset: Optional[str] = None) -> str:
+    """按声明的字符集解码，未声明或解码失败时依次尝试utf-8和gb18030"""
+    declared = _lookup_charset(charset)
+    candidates = [declared] if declared else []
+    candidates += [c for c in _FALLBACK_CHARSETS if c != declared]
+    for candidate in candidates:
+        try:
+            return data.decode(candidate)
+        except UnicodeDecodeError:
+            continue
+    return data.decode(declared or "utf-8", errors="replace")
+
+
+def decode_transfer_encoding(data: bytes, encoding: str) -> bytes:
+    """按Content-Transfer-Encoding解码，数据可能只是开头的一部分"""
+    encoding = (encoding or "").lower()
+    if encoding == "base64":
+        compact = b"".join(data.split())
+        # 部分获取时末尾可能不是完整的4字节组
+        compact = compact[:len(compact) - len(compact) % 4]
+        try:
+            return base64.b64decode(compact)
+        except (binascii.Error, ValueError):
+            return b""
+    if encoding == "quoted-printable":
+        # 去掉被截断的转义序列
+        cut = data.rfind(b"=", max(0, len(data) - 2))
+        if cut >= 0:
+            data = data[:cut]
+        return quopri.decodestring(data)
+    return data
+
+
+def html_to_text(html: str) -> str:
+    """把HTML正文转换为纯文本，只保留段落结构"""
+    text = _SCRIPT_STYLE_RE.sub(" ", html)
+    text = _COMMENT_RE.sub(" ", text)
+    text = _BLOCK_TAG_RE.sub("\n", text)
+    text = _CELL_TAG_RE.sub(" ", text)
+    text = _TAG_RE.sub("", text)
+    text = unescape(text)
+    text = _INLINE_SPACE_RE.sub(" ", text)
+    text = _BLANK_LINES_RE.sub("\n\n", text)
+    return "\n".join(line.strip() for line in text.split("\n")).strip()
+
+
+def decode_part(data: bytes, encoding: str, charset: Optional[str], subtype: str = "plain",
+                max_chars: Optional[int] = None) -> str:
+    """把获取到的MIME部分解码为文本"""
+    text = decode_bytes(decode_transfer_encoding(data, encoding), charset)
+    if subtype == "html":
+        text = html_to_text(text)
+    if max_chars is not None:
+        text = text[:max_chars]
+    return text
+
+
+def decode_header_value(value) -> str:
+    """解码邮件头，兼容RFC 2047编码和未编码的8位原始字节"""
+    if value is None:
+        return ""
+    fragments = []
+    for fragment, encoding in decode_header(value):
+        if isinstance(fragment, bytes):
+            # unknown-8bit表示头部直接包含了未声明编码的原始字节
+            fragment = decode_bytes(fragment, None if encoding == "unknown-8bit" else encoding)
+        fragments.append(fragment)
+    return "".join(fragments)
@@ -0,0 +1,292 @@
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Type
+
+from .metrics import MODEL_DECODE_SECONDS, MODEL_PREFILL_SECONDS, MODEL_TOKENS_PER_SECOND
+
+logger = logging.getLogger(__name__)
+
+# Qwen3默认会先输出思考过程，分类等短输出场景需要去掉
+_THINK_RE = re.compile(r'<think>.*?(</think>|$)', re.S)
+_CJK_CHAR_RE = re.compile(r'[一-鿿　-〿＀-￯]')
+# 模拟后端从邮件中提取日期
+_STUB_DATE_RE = re.compile(r'\d{4}-\d{2}-\d{2}')
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算token数：中文按每字一个token，其余按每4个字符一个token"""
+    cjk = len(_CJK_CHAR_RE.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def _observe_perf_metrics(result):
+    """把openvino_genai返回的PerfMetrics记入prefill和decode指标"""
+    metrics = getattr(result, "perf_metrics", None)
+    if metrics is None:
+        return
+    try:
+        ttft_ms = float(metrics.get_ttft().mean)
+        tpot_ms = float(metrics.get_tpot().mean)
+        throughput = float(metrics.get_throughput().mean)
+    except Exception:
+        return
+    MODEL_PREFILL_SECONDS.observe(ttft_ms / 1000)
+    if tpot_ms > 0:
+        MODEL_DECODE_SECONDS.observe(tpot_ms / 1000)
+    if throughput > 0:
+        MODEL_TOKENS_PER_SECOND.observe(throughput)
+
+
+class _ThinkFilter:
+    """在流式输出中过滤掉开头的<think>...</think>思考块"""
+
+    def __init__(self, on_token: Callable[[str], bool]):
+        self.on_token = on_token
+        self.buffer = ""
+        self.thinking: Optional[bool] = None
+        # 思考块之后的空白行也一并去掉
+        self.strip_leading = False
+
+    def __call__(self, subword: str) -> bool:
+        if self.thinking is False:
+            if self.strip_leading:
+                subword = subword.lstrip()
+                self.strip_leading = not subword
+            return self.on_token(subword)
+
+        self.buffer += subword
+        if self.thinking is None:
+            text = self.buffer.lstrip()
+            if not text or "<think>".startswith(text):
+                # 还无法判断是否以思考块开头
+                return self.on_token("")
+            if not text.startswith("<think>"):
+                self.thinking = False
+                return self.on_token(self.buffer)
+            self.thinking = True
+
+        end = self.buffer.find("</think>")
+        if end < 0:
+            return self.on_token("")
+        self.thinking = False
+        rest = self.buffer[end + len("</think>"):].lstrip()
+        self.strip_leading = not rest
+        return self.on_token(rest)
+
+
+class ModelBackend:
+    """模型后端基类"""
+
+    name = "base"
+    # 后端自行记录prefill、decode和输出速度指标时为True，否则由ModelService按总耗时估算输出速度
+    reports_perf_metrics = False
+
+    def __init__(self, model_path: str, device: str = "CPU", **options):
+        self.model_path = model_path
+        self.device = device
+        # 后端不支持的选项会被忽略
+        self.options = options
+
+    def load(self):
+        """加载模型"""
+
+    def generate_batch(self, prompts: List[str], max_new_tokens: int,
+                       json_schema: Optional[Dict] = None) -> List[str]:
+        """对一组提示词执行一次批量推理，json_schema不为空时约束输出为JSON"""
+        raise NotImplementedError
+
+    def stream(self, prompt: str, max_new_tokens: int, on_token: Callable[[str], bool]) -> str:
+        """流式生成，每得到一段文本调用一次on_token，其返回True时停止生成"""
+        text = self.generate_batch([prompt], max_new_tokens)[0]
+        on_token(text)
+        return text
+
+    def count_tokens(self, text: str) -> int:
+        """计算文本的token数"""
+        return estimate_tokens(text)
+
+    def generate_with_metrics(self, prompt: str, max_new_tokens: int,
+                              json_schema: Optional[Dict] = None) -> Dict:
+        """生成单个响应并返回耗时，无法区分prefill和decode时ttft_ms为None"""
+        start = time.perf_counter()
+        text = self.generate_batch([prompt], max_new_tokens, json_schema)[0]
+        return {
+            "text": text,
+            "input_tokens": self.count_tokens(prompt),
+            "output_tokens": self.count_tokens(text),
+            "ttft_ms": None,
+            "tpot_ms": None,
+            "total_ms": (time.perf_counter() - start) * 1000
+        }
+
+    def warm_up(self):
+        """预热：执行一次极短的推理，完成编译和内存分配"""
+        self.generate_batch(["你好"], max_new_tokens=1)
+
+
+class OpenVINOBackend(ModelBackend):
+    """基于openvino_genai.LLMPipeline的推理后端"""
+
+    name = "openvino"
+    reports_perf_metrics = True
+
+    def __init__(self, model_path: str, device: str = "CPU", disable_thinking: bool = True,
+                 prefix_caching: bool = True, cache_size: int = 1, cache_dir: Optional[str] = None,
+                 **options):
+        super().__init__(model_path, device, **options)
+        # 在提示词末尾追加 /no_think，关闭Qwen3的思考模式
+        self.disable_thinking = disable_thinking
+        # 复用相同提示词前缀的KV缓存，分类提示词的说明部分只需prefill一次
+        self.prefix_caching = prefix_caching
+        # KV缓存大小（GB），仅在开启前缀缓存时使用
+        self.cache_size = cache_size
+        # 编译后模型的缓存目录，再次加载时跳过编译
+        self.cache_dir = cache_dir
+        self.pipe = None
+        # LLMPipeline不支持并发调用
+        self._lock = threading.Lock()
+
+    def load(self):
+        import openvino_genai as ov_genai
+
+        self._ov_genai = ov_genai
+        properties = {}
+        if self.prefix_caching:
+            if hasattr(ov_genai, "SchedulerConfig"):
+                # 传入scheduler_config时LLMPipeline使用连续批处理实现，支持前缀缓存
+                scheduler_config = ov_genai.SchedulerConfig()
+                scheduler_config.enable_prefix_caching = True
+                scheduler_config.cache_size = self.cache_size
+                properties["scheduler_config"] = scheduler_config
+            else:
+                logger.warning("当前openvino_genai版本不支持前缀缓存，已忽略")
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            properties["CACHE_DIR"] = str(self.cache_dir)
+        self.pipe = ov_genai.LLMPipeline(str(self.model_path), self.device, **properties)
+
+    def count_tokens(self, text: str) -> int:
+        return int(self.pipe.get_tokenizer().encode(text).input_ids.get_shape()[-1])
+
+    def _prepare(self, prompt: str) -> str:
+        if self.disable_thinking:
+            return f"{prompt}\n/no_think"
+        return prompt
+
+    def _generation_config(self, max_new_tokens: int, json_schema: Optional[Dict] = None):
+        config = self._ov_genai.GenerationConfig()
+        config.max_new_tokens = max_new_tokens
+        if json_schema is not None:
+            if hasattr(self._ov_genai, "StructuredOutputConfig"):
+                # 按JSON Schema做约束解码，输出一定是可解析的JSON
+                config.structured_output_config = self._ov_genai.StructuredOutputConfig(
+                    json_schema=json.dumps(json_schema, ensure_ascii=False)
+                )
+            elif not getattr(self, "_structured_output_warned", False):
+                logger.warning("当前openvino_genai版本不支持约束解码，将只依赖提示词输出JSON")
+                self._structured_output_warned = True
+        return config
+
+    def generate_batch(self, prompts: List[str], max_new_tokens: int,
+                       json_schema: Optional[Dict] = None) -> List[str]:
+        config = self._generation_config(max_new_tokens, json_schema)
+        inputs = [self._prepare(prompt) for prompt in prompts]
+
+        with self._lock:
+            if len(inputs) == 1:
+                result = self.pipe.generate(inputs[0], config)
+                texts = [str(result)]
+            else:
+                result = self.pipe.generate(inputs, config)
+                texts = list(result.texts)
+        _observe_perf_metrics(result)
+        return [_THINK_RE.sub('', text).strip() for text in texts]
+
+    def generate_with_metrics(self, prompt: str, max_new_tokens: int,
+                              json_schema: Optional[Dict] = None) -> Dict:
+        config = self._generation_config(max_new_tokens, json_schema)
+
+        with self._lock:
+            start = time.perf_counter()
+            result = self.pipe.generate([self._prepare(prompt)], config)
+            total_ms = (time.perf_counter() - start) * 1000
+        _observe_perf_metrics(result)
+        metrics = result.perf_metrics
+        return {
+            "text": _THINK_RE.sub('', result.texts[0]).strip(),
+            "input_tokens": int(metrics.get_num_input_tokens()),
+            "output_tokens": int(metrics.get_num_generated_tokens()),
+            # 首token时间即prefill耗时，其后每个token的平均耗时为decode速度
+            "ttft_ms": float(metrics.get_ttft().mean),
+            "tpot_ms": float(metrics.get_tpot().mean),
+            "total_ms": total_ms
+        }
+
+    def stream(self, prompt: str, max_new_tokens: int, on_token: Callable[[str], bool]) -> str:
+        config = self._generation_config(max_new_tokens)
+
+        with self._lock:
+            # streamer返回True时LLMPipeline会停止后续解码
+            result = self.pipe.generate(self._prepare(prompt), config, _ThinkFilter(on_token))
+        _observe_perf_metrics(result)
+        return _THINK_RE.sub('', str(result)).strip()
+
+
+class StubBackend(ModelBackend):
+    """确定性的模拟后端，用于测试和无模型环境"""
+
+    name = "stub"
+
+    def generate_batch(self, prompts: List[str], max_new_tokens: int,
+                       json_schema: Optional[Dict] = None) -> List[str]:
+        responses = []
+        for prompt in prompts:
+            if "请分析以下邮件" in prompt:
+                # 只看邮件本身，分类说明中的示例词不参与判断
+                email_text = prompt.split("标题：", 1)[-1]
+                if "项目" in email_text or "汇报" in email_text or "确认" in email_text or "会议" in email_text:
+                    category = "任务类"
+                else:
+                    category = "资讯类"
+                # 邮件中出现的第一个日期作为截止时间，标题作为待办事项
+                deadline = _STUB_DATE_RE.search(email_text) if category == "任务类" else None
+                title = email_text.split("\n", 1)[0].strip()
+                responses.append(json.dumps({
+                    "category": category,
+                    "deadline": f"{deadline.group(0)} 18:00" if deadline else None,
+                    "action": f"处理：{title}" if category == "任务类" else None
+                }, ensure_ascii=False))
+            else:
+                responses.append(f"这是对您问题的回复：{prompt[:50]}...")
+        return responses
+
+    def stream(self, prompt: str, max_new_tokens: int, on_token: Callable[[str], bool]) -> str:
+        text = self.generate_batch([prompt], max_new_tokens)[0]
+        for index, char in enumerate(text):
+            if on_token(char):
+                return text[:index + 1]
+        return text
+
+
+BACKENDS: Dict[str, Type[ModelBackend]] = {
+    OpenVINOBackend.name: OpenVINOBackend,
+    StubBackend.name: StubBackend,
+}
+
+
+def register_backend(backend_cls: Type[ModelBackend]):
+    """注册自定义模型后端"""
+    BACKENDS[backend_cls.name] = backend_cls
+    return backend_cls
+
+
+def create_backend(name: str, model_path: str, device: str = "CPU", **options) -> ModelBackend:
+    """按名称创建模型后端，options为后端特有的选项"""
+    if name not in BACKENDS:
+        raise ValueError(f"未知的模型后端: {name}")
+    return BACKENDS[name](model_path, device, **options)
@@ -1,48 +1,330 @@
+import asyncio
+import json
+import logging
 import os
-from typing import Optional
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import AsyncIterator, Dict, List, Optional
+from .executors import run_in_executor
+from .metrics import MODEL_BATCH_SIZE, MODEL_GENERATE_SECONDS, MODEL_TOKENS_PER_SECOND, QUEUE_DEPTH
+from .model_backends import ModelBackend, create_backend, estimate_tokens
+from .tracing import span
+
+logger = logging.getLogger(__name__)
+
+# 模型配置，可通过环境变量覆盖
+MODEL_CONFIG = {
+    "backend": os.environ.get("NOTIA_MODEL_BACKEND", "openvino"),  # openvino 或 stub
+    "model_path": os.environ.get("NOTIA_MODEL_PATH", r'C:\Users\zangq\Repo\model\OpenVINO\Qwen3-1.7B-int4-ov'),
+    "device": os.environ.get("NOTIA_MODEL_DEVICE", "CPU"),
+    "max_new_tokens": 512,          # 对话生成长度上限
+    "analysis_max_new_tokens": 96,  # 分类并提取任务信息的JSON输出
+    # 复用分类提示词公共前缀的KV缓存
+    "prefix_caching": os.environ.get("NOTIA_MODEL_PREFIX_CACHING", "1") != "0",
+    "kv_cache_size": int(os.environ.get("NOTIA_MODEL_KV_CACHE_GB", "1")),  # KV缓存大小（GB）
+    # 编译后模型的缓存目录，为空时不缓存；多个worker共用同一目录时，
+    # 后启动的worker直接导入缓存而不必重新编译，权重通过mmap在进程间共享页缓存
+    "cache_dir": os.environ.get("NOTIA_MODEL_CACHE_DIR", ""),
+}
 
 class ModelService:
-    def __init__(self, model_path: Optional[str] = None):
-        """初始化模型服务"""
-        self.model_path = model_path or r'C:\Users\zangq\Repo\model\OpenVINO\Qwen3-1.7B-int4-ov'
+    def __init__(self, model_path: Optional[str] = None, max_batch_size: int = 8,
+                 backend: Optional[ModelBackend] = None):
+        """初始化模型服务，模型在首次使用或调用start_loading时才加载"""
+        self.model_path = model_path or MODEL_CONFIG["model_path"]
+        self.backend = backend
         self.model = None
-        self._load_model()
-    
+        self.max_new_tokens = MODEL_CONFIG["max_new_tokens"]
+        self.analysis_max_new_tokens = MODEL_CONFIG["analysis_max_new_tokens"]
+        # 单次前向推理最多合并的提示词数量
+        self.max_batch_size = max_batch_size
+        self.batcher = MicroBatcher(self, max_batch_size=max_batch_size)
+        self._load_lock = threading.Lock()
+        self._load_attempted = False
+        # 加载状态：not_loaded、loading、ready、failed
+        self.status = "not_loaded"
+        self.load_error: Optional[str] = None
+
+    @property
+    def is_ready(self) -> bool:
+        return self.status == "ready"
+
     def _load_model(self):
         """加载模型"""
+        self.status = "loading"
+        start = time.perf_counter()
         try:
-            # 这里需要根据您的具体模型类型来实现
-            # 如果是OpenVINO模型，需要使用openvino库
-            # 如果是其他类型，需要相应的库
-            print(f"正在加载模型: {self.model_path}")
-            # TODO: 实际的模型加载逻辑
-            self.model = "模型已加载"  # 占位符
+            logger.info("正在加载模型: %s", self.model_path, extra={"backend": MODEL_CONFIG["backend"]})
+            if self.backend is None:
+                self.backend = create_backend(
+                    MODEL_CONFIG["backend"], self.model_path, MODEL_CONFIG["device"],
+                    prefix_caching=MODEL_CONFIG["prefix_caching"],
+                    cache_size=MODEL_CONFIG["kv_cache_size"],
+                    cache_dir=MODEL_CONFIG["cache_dir"] or None
+                )
+            self.backend.load()
+            self.model = self.backend
+            self.status = "ready"
+            logger.info("模型加载完成", extra={"load_seconds": round(time.perf_counter() - start, 2)})
         except Exception as e:
-            print(f"模型加载失败: {e}")
+            logger.exception("模型加载失败: %s", e)
             self.model = None
-    
-    def generate_response(self, prompt: str) -> str:
-        """生成响应"""
-        if not self.model:
-            return "模型未加载，无法生成响应"
-        
+            self.load_error = str(e)
+            self.status = "failed"
+
+    def ensure_loaded(self) -> bool:
+        """按需加载模型，多线程下只加载一次"""
+        if not self._load_attempted:
+            with self._load_lock:
+                if not self._load_attempted:
+                    self._load_model()
+                    self._load_attempted = True
+        return self.model is not None
+
+    def warm_up(self):
+        """加载模型并执行一次预热推理"""
+        if not self.ensure_loaded():
+            return
         try:
-            # TODO: 实际的模型推理逻辑
-            # 这里需要根据您的模型类型实现具体的推理代码
-            
-            # 临时返回模拟响应
-            if "分类" in prompt:
-                if "项目" in prompt or "汇报" in prompt or "确认" in prompt or "会议" in prompt:
-                    return "任务类"
-                else:
-                    return "资讯类"
-            else:
-                return f"这是对您问题的回复：{prompt[:50]}..."
-                
+            self.backend.warm_up()
         except Exception as e:
-            return f"生成响应时出错: {e}"
-    
-    def classify_email(self, title: str, content: str) -> str:
-        """邮件分类"""
-        prompt = f"请对以下邮件进行分类，分类结果只能是：资讯类、任务类、无法分类\n标题：{title}\n内容：{content[:200]}"
-        return self.generate_response(prompt)
\ No newline at end of file
+            logger.exception("模型预热失败: %s", e)
+
+    def start_loading(self) -> threading.Thread:
+        """在后台线程中加载并预热模型，立即返回"""
+        if self.status == "not_loaded":
+            self.status = "loading"
+        thread = threading.Thread(target=self.warm_up, name="model-loader", daemon=True)
+        thread.start()
+        return thread
+
+    def _generate_group(self, prompts: List[str], max_new_tokens: int,
+                        json_schema: Optional[Dict] = None) -> List[str]:
+        """对一组长度相近的提示词执行一次批量推理"""
+        with span("model.generate", batch_size=len(prompts)):
+            start = time.perf_counter()
+            outputs = self.backend.generate_batch(prompts, max_new_tokens, json_schema)
+            elapsed = time.perf_counter() - start
+        MODEL_GENERATE_SECONDS.observe(elapsed)
+        MODEL_BATCH_SIZE.observe(len(prompts))
+        if not self.backend.reports_perf_metrics and elapsed > 0:
+            MODEL_TOKENS_PER_SECOND.observe(sum(estimate_tokens(output) for output in outputs) / elapsed)
+        return outputs
+
+    def _group_by_length(self, prompts: List[str]) -> List[List[int]]:
+        """按长度对提示词分组，减少同一批次内的填充开销
+
+        组内最长的提示词不超过最短的两倍，且每组不超过max_batch_size。
+        """
+        order = sorted(range(len(prompts)), key=lambda i: len(prompts[i]))
+        groups = []
+        current = []
+        for index in order:
+            if current and (
+                len(current) >= self.max_batch_size
+                or len(prompts[index]) > 2 * max(len(prompts[current[0]]), 1)
+            ):
+                groups.append(current)
+                current = []
+            current.append(index)
+        if current:
+            groups.append(current)
+        return groups
+
+    def generate_batch(self, prompts: List[str], max_new_tokens: Optional[int] = None,
+                       json_schema: Optional[Dict] = None) -> List[str]:
+        """批量生成响应，结果顺序与输入一致，指定json_schema时约束输出为符合该Schema的JSON"""
+        max_new_tokens = max_new_tokens or self.max_new_tokens
+        if not self.ensure_loaded():
+            return ["模型未加载，无法生成响应"] * len(prompts)
+
+        results: List[str] = [""] * len(prompts)
+        for group in self._group_by_length(prompts):
+            try:
+                outputs = self._generate_group([prompts[i] for i in group], max_new_tokens, json_schema)
+            except Exception as e:
+                outputs = [f"生成响应时出错: {e}"] * len(group)
+            for index, output in zip(group, outputs):
+                results[index] = output
+        return results
+
+    def generate_response(self, prompt: str, max_new_tokens: Optional[int] = None) -> str:
+        """生成响应"""
+        return self.generate_batch([prompt], max_new_tokens)[0]
+
+    async def stream_response(self, prompt: str, max_new_tokens: Optional[int] = None,
+                              stop_event: Optional[threading.Event] = None,
+                              idle_timeout: Optional[float] = None) -> AsyncIterator[Optional[str]]:
+        """流式生成响应，逐段产出文本
+
+        推理在model线程池中进行，文本经事件循环的队列交给调用方，等待时
+        不占用线程。指定idle_timeout时，超过该秒数没有新文本就产出一次None，
+        便于调用方检查客户端是否已断开。stop_event被设置或生成器被关闭时，
+        在下一个解码步停止生成。
+        """
+        max_new_tokens = max_new_tokens or self.max_new_tokens
+        stop_event = stop_event or threading.Event()
+        loop = asyncio.get_running_loop()
+        tokens: "asyncio.Queue" = asyncio.Queue()
+        finished = object()
+
+        def put(item):
+            try:
+                loop.call_soon_threadsafe(tokens.put_nowait, item)
+            except RuntimeError:
+                # 事件循环已关闭，调用方不再读取
+                stop_event.set()
+
+        def on_token(token: str) -> bool:
+            if token:
+                put(token)
+            return stop_event.is_set()
+
+        def run():
+            try:
+                if not self.ensure_loaded():
+                    put("模型未加载，无法生成响应")
+                    return
+                self.backend.stream(prompt, max_new_tokens, on_token)
+            except Exception as e:
+                put(f"生成响应时出错: {e}")
+            finally:
+                put(finished)
+
+        generation = asyncio.ensure_future(run_in_executor("model", run))
+        try:
+            while True:
+                try:
+                    token = await asyncio.wait_for(tokens.get(), idle_timeout)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                if token is finished:
+                    break
+                yield token
+        finally:
+            # 生成任务会在下一个解码步结束，不等待它
+            stop_event.set()
+
+    def count_tokens(self, text: str) -> int:
+        """计算文本的token数，模型未加载时使用估算值"""
+        if self.model is not None:
+            try:
+                return self.backend.count_tokens(text)
+            except Exception:
+                pass
+        return estimate_tokens(text)
+
+    def submit(self, prompt: str, max_new_tokens: Optional[int] = None,
+               json_schema: Optional[Dict] = None) -> str:
+        """生成响应，与其他线程的并发请求合并为一个批次执行"""
+        return self.batcher.submit(prompt, max_new_tokens, json_schema)
+
+
+class MicroBatcher:
+    """微批调度器
+
+    收集若干毫秒内来自不同线程的请求，合并后交给generate_batch
+    一次执行，调用方阻塞直到拿到自己的结果。上一批以来始终只有一个
+    调用方时（例如逐封同步处理邮件），等待窗口不会凑到其他请求，
+    直接执行。
+    """
+
+    def __init__(self, model_service: ModelService, max_batch_size: int = 8,
+                 max_wait_ms: float = 10):
+        self.model_service = model_service
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        # 已调用submit但还没拿到结果的调用方数量，及上次收集批次以来的最大值
+        self._submitters = 0
+        self._peak_submitters = 0
+        self._submitters_lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="model-batcher", daemon=True)
+                self._thread.start()
+
+    def submit(self, prompt: str, max_new_tokens: Optional[int] = None,
+               json_schema: Optional[Dict] = None) -> str:
+        """提交一个请求并等待结果"""
+        self._ensure_started()
+        future: Future = Future()
+        with self._submitters_lock:
+            self._submitters += 1
+            self._peak_submitters = max(self._peak_submitters, self._submitters)
+        try:
+            self._queue.put((prompt, max_new_tokens, json_schema, future))
+            return future.result()
+        finally:
+            with self._submitters_lock:
+                self._submitters -= 1
+
+    def pending(self) -> int:
+        """排队等待推理的请求数"""
+        return self._queue.qsize()
+
+    def _collect(self) -> List:
+        """阻塞等待第一个请求，然后在等待窗口内尽量凑满一批
+
+        上次收集以来没有出现过并发的调用方时不等待，立即执行。
+        """
+        batch = [self._queue.get()]
+        with self._submitters_lock:
+            concurrent = self._peak_submitters
+            self._peak_submitters = self._submitters
+        if concurrent <= 1:
+            return batch
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+
+            # 生成长度上限或输出约束不同的请求分开执行
+            groups: Dict[tuple, List] = {}
+            for request in batch:
+                schema_key = json.dumps(request[2], sort_keys=True) if request[2] is not None else None
+                groups.setdefault((request[1], schema_key), []).append(request)
+
+            for requests in groups.values():
+                max_new_tokens, json_schema = requests[0][1], requests[0][2]
+                try:
+                    outputs = self.model_service.generate_batch(
+                        [request[0] for request in requests], max_new_tokens, json_schema
+                    )
+                except Exception as e:
+                    for request in requests:
+                        request[3].set_exception(e)
+                    continue
+                for request, output in zip(requests, outputs):
+                    request[3].set_result(output)
+
+
+_shared_model_service: Optional[ModelService] = None
+_shared_lock = threading.Lock()
+
+def get_model_service() -> ModelService:
+    """获取进程内共享的模型服务，避免重复加载模型"""
+    global _shared_model_service
+    if _shared_model_service is None:
+        with _shared_lock:
+            if _shared_model_service is None:
+                _shared_model_service = ModelService()
+                QUEUE_DEPTH.set_function(_shared_model_service.batcher.pending, queue="model_batcher")
+    return _shared_model_service
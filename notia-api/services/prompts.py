@@ -0,0 +1,117 @@
+"""模型提示词模板
+
+邮件分类与任务信息提取共用一个提示词。说明部分对所有邮件完全相同并
+放在最前面，邮件内容放在最后。推理后端开启前缀缓存时，说明部分的KV
+缓存只需计算一次，之后每封邮件只需对邮件本身做prefill。修改说明部分
+会让已有的缓存失效，但不影响正确性。
+"""
+import json
+import re
+from datetime import datetime
+from typing import Dict, Optional
+
+from database.models import EmailCategory
+
+# 邮件正文最多放入提示词的字符数
+ANALYSIS_CONTENT_CHARS = 500
+# 保存的待办事项最大字符数
+ACTION_MAX_CHARS = 200
+
+# 所有分析请求共享的前缀，不要在其中插入任何随邮件变化的内容
+ANALYSIS_PREFIX = """请分析以下邮件：判断分类，分类结果只能是：资讯类、任务类、无法分类；如果是任务类，再提取截止时间和需要做的事情。
+
+分类标准：
+- 任务类：需要收件人采取行动的邮件，例如提交材料、回复确认、参加会议、处理审批、在截止时间前完成某项工作。
+- 资讯类：只用于告知信息、不需要收件人处理的邮件，例如新闻、订阅推送、营销广告、系统通知、周报摘要。
+- 无法分类：内容为空、无法理解或无法判断是否需要处理的邮件。
+
+只输出一个JSON对象，不要输出其他内容，格式如下：
+{"category": "任务类", "deadline": "2025-01-31 18:00", "action": "提交第四季度工作总结"}
+
+- deadline：截止时间，格式为 YYYY-MM-DD HH:MM，"本周五"等相对时间按邮件时间推算；没有明确截止时间时为null。
+- action：收件人需要做的事情，一句话，不超过50字。
+- 资讯类和无法分类的邮件，deadline和action都为null。
+
+"""
+
+# 前缀中含有JSON示例的花括号，只对邮件部分做format
+ANALYSIS_EMAIL_TEMPLATE = """邮件时间：{time}
+邮件标题：{title}
+发件人：{sender}
+邮件内容：{content}
+
+JSON："""
+
+# 约束解码使用的JSON Schema
+ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "category": {"type": "string", "enum": [category.value for category in EmailCategory]},
+        "deadline": {"type": ["string", "null"]},
+        "action": {"type": ["string", "null"]},
+    },
+    "required": ["category", "deadline", "action"],
+    "additionalProperties": False,
+}
+
+_JSON_OBJECT_RE = re.compile(r'\{.*\}', re.S)
+_DEADLINE_FORMATS = ("%Y-%m-%d %H:%M", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M", "%Y-%m-%dT%H:%M:%S",
+                     "%Y/%m/%d %H:%M", "%Y-%m-%d", "%Y/%m/%d")
+
+
+def parse_classification(output: Optional[str]) -> EmailCategory:
+    """从模型输出中解析分类结果"""
+    output = output or ""
+    if EmailCategory.TASK.value in output:
+        return EmailCategory.TASK
+    if EmailCategory.NEWS.value in output:
+        return EmailCategory.NEWS
+    return EmailCategory.UNCLASSIFIED
+
+
+def build_analysis_prompt(title: str, content: str, sender: str = "", time: str = "",
+                          max_content_chars: int = ANALYSIS_CONTENT_CHARS) -> str:
+    """生成分类并提取任务信息的提示词"""
+    return ANALYSIS_PREFIX + ANALYSIS_EMAIL_TEMPLATE.format(
+        time=time or "未知",
+        title=title or "",
+        sender=sender or "",
+        content=(content or "")[:max_content_chars]
+    )
+
+
+def parse_deadline(value) -> Optional[datetime]:
+    """解析模型输出的截止时间，只有日期时取当天结束"""
+    if not isinstance(value, str) or not value.strip():
+        return None
+    value = value.strip()
+    for fmt in _DEADLINE_FORMATS:
+        try:
+            deadline = datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+        if "%H" not in fmt:
+            deadline = deadline.replace(hour=23, minute=59, second=59)
+        return deadline
+    return None
+
+
+def parse_analysis(output: Optional[str]) -> Dict:
+    """解析分类和任务信息，输出不是合法JSON时退回到按文本匹配分类"""
+    output = output or ""
+    data = None
+    match = _JSON_OBJECT_RE.search(output)
+    if match:
+        try:
+            data = json.loads(match.group(0))
+        except ValueError:
+            data = None
+    if not isinstance(data, dict):
+        return {"category": parse_classification(output), "deadline": None, "action": None}
+
+    category = parse_classification(str(data.get("category") or ""))
+    action = data.get("action")
+    action = action.strip()[:ACTION_MAX_CHARS] if isinstance(action, str) and action.strip() else None
+    if category != EmailCategory.TASK:
+        return {"category": category, "deadline": None, "action": None}
+    return {"category": category, "deadline": parse_deadline(data.get("deadline")), "action": action}
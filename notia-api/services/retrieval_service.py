@@ -0,0 +1,107 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from .knowledge_service import KnowledgeService
+from .metrics import CACHE_LOOKUPS
+from .model_service import ModelService
+
+CHAT_PROMPT_TEMPLATE = """你是Notia智能邮件助手。请参考下面的知识库内容回答用户问题；知识库中没有相关信息时，按常识回答。
+
+知识库内容：
+{context}
+
+用户问题：{question}"""
+
+
+class RetrievalService:
+    """检索增强：从知识库取回相关条目，在token预算内拼入提示词
+
+    提示词长度决定预填充耗时，因此上下文严格限制在预算之内。同一
+    问题的检索结果会缓存，知识库新增条目后缓存自动失效。
+    """
+
+    def __init__(self, knowledge_service: KnowledgeService, model_service: ModelService,
+                 top_k: int = 3, context_token_budget: int = 768, min_entry_tokens: int = 32,
+                 cache_size: int = 256, cache_ttl: float = 300):
+        self.knowledge_service = knowledge_service
+        self.model_service = model_service
+        self.top_k = top_k
+        # 拼入提示词的知识内容最多占用的token数
+        self.context_token_budget = context_token_budget
+        # 剩余预算不足该值时不再截断拼入下一条
+        self.min_entry_tokens = min_entry_tokens
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _cache_key(query: str) -> str:
+        return " ".join(query.lower().split())
+
+    def _truncate(self, text: str, max_tokens: int) -> str:
+        """把文本截断到不超过max_tokens"""
+        if self.model_service.count_tokens(text) <= max_tokens:
+            return text
+        low, high = 0, len(text)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.model_service.count_tokens(text[:middle]) <= max_tokens:
+                low = middle
+            else:
+                high = middle - 1
+        return text[:low]
+
+    def _pack(self, results: List[Dict]) -> Dict:
+        """按相关度顺序拼接知识条目，直到用完token预算"""
+        remaining = self.context_token_budget
+        blocks = []
+        sources = []
+        for index, entry in enumerate(results, 1):
+            block = f"[{index}] {entry['title']}\n{entry['content']}"
+            tokens = self.model_service.count_tokens(block)
+            if tokens > remaining:
+                if remaining < self.min_entry_tokens:
+                    break
+                block = self._truncate(block, remaining)
+                tokens = self.model_service.count_tokens(block)
+            blocks.append(block)
+            sources.append({"id": entry["id"], "title": entry["title"], "score": entry.get("score")})
+            remaining -= tokens
+            if remaining <= 0:
+                break
+
+        return {
+            "context": "\n\n".join(blocks),
+            "sources": sources,
+            "context_tokens": self.context_token_budget - remaining
+        }
+
+    def retrieve(self, query: str) -> Dict:
+        """检索与问题相关的知识并打包为上下文"""
+        key = self._cache_key(query)
+        version = self.knowledge_service.version
+        now = time.time()
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached and cached[0] == version and cached[1] > now:
+                self._cache.move_to_end(key)
+                CACHE_LOOKUPS.inc(cache="retrieval", result="hit")
+                return dict(cached[2], cached=True)
+
+        CACHE_LOOKUPS.inc(cache="retrieval", result="miss")
+        packed = self._pack(self.knowledge_service.search(query, self.top_k))
+        with self._lock:
+            self._cache[key] = (version, now + self.cache_ttl, packed)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return dict(packed, cached=False)
+
+    def build_prompt(self, query: str, retrieval: Optional[Dict]) -> str:
+        """组装最终提示词，没有相关知识时直接使用用户问题"""
+        if not retrieval or not retrieval["context"]:
+            return query
+        return CHAT_PROMPT_TEMPLATE.format(context=retrieval["context"], question=query)
@@ -0,0 +1,157 @@
+"""请求级追踪
+
+每个HTTP请求对应一个Trace，保存在contextvars中，span()记录请求内各步骤
+的耗时。run_in_executor会把上下文带进线程池，线程池中执行的步骤也记在
+发起请求的Trace下。没有活动的Trace时span()不做任何记录。
+
+请求结束后耗时写入HTTP指标，并通过X-Trace-Id和Server-Timing响应头返回；
+超过slow_request_ms的请求连同各步骤耗时记一条警告日志。
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional
+
+from .metrics import HTTP_REQUEST_SECONDS
+
+TRACE_CONFIG = {
+    "slow_request_ms": float(os.environ.get("NOTIA_SLOW_REQUEST_MS", "1000")),
+    "max_spans": 200,  # 单个Trace最多记录的步骤数，流式请求中避免无限增长
+}
+
+logger = logging.getLogger(__name__)
+
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar("notia_trace", default=None)
+_current_span: ContextVar[Optional[str]] = ContextVar("notia_span", default=None)
+
+
+class Trace:
+    """一次请求中记录的各步骤耗时"""
+
+    def __init__(self, name: str = "", trace_id: Optional[str] = None):
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.name = name
+        self.start = time.perf_counter()
+        self.spans: List[Dict] = []
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def add_span(self, span: Dict):
+        with self._lock:
+            if len(self.spans) < TRACE_CONFIG["max_spans"]:
+                self.spans.append(span)
+            else:
+                self.dropped += 1
+
+    def duration_ms(self) -> float:
+        return round((time.perf_counter() - self.start) * 1000, 2)
+
+    def server_timing(self) -> str:
+        """按步骤名汇总耗时，生成Server-Timing响应头"""
+        totals: Dict[str, float] = {}
+        with self._lock:
+            for span in self.spans:
+                totals[span["name"]] = totals.get(span["name"], 0) + span["duration_ms"]
+        return ", ".join(f"{name};dur={duration:.2f}" for name, duration in totals.items())
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            spans = list(self.spans)
+        return {"trace_id": self.trace_id, "name": self.name, "duration_ms": self.duration_ms(),
+                "spans": spans, "dropped_spans": self.dropped}
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def current_trace_id() -> Optional[str]:
+    trace = _current_trace.get()
+    return trace.trace_id if trace is not None else None
+
+
+@contextmanager
+def start_trace(name: str = "", trace_id: Optional[str] = None) -> Iterator[Trace]:
+    """在当前上下文中开始一个Trace"""
+    trace = Trace(name, trace_id)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Dict]:
+    """记录一个步骤的耗时，with块内可向返回的字典中补充属性"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield attributes
+        return
+
+    parent = _current_span.get()
+    parent_token = _current_span.set(name)
+    start = time.perf_counter()
+    error = None
+    try:
+        yield attributes
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        _current_span.reset(parent_token)
+        record = {
+            "name": name,
+            "parent": parent,
+            "start_ms": round((start - trace.start) * 1000, 2),
+            "duration_ms": round((time.perf_counter() - start) * 1000, 2),
+        }
+        if error:
+            record["error"] = error
+        record.update(attributes)
+        trace.add_span(record)
+
+
+class TraceMiddleware:
+    """为每个HTTP请求创建Trace并记录请求耗时的ASGI中间件
+
+    请求头带X-Request-ID时沿用为trace_id，便于与上游日志对应。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = dict(scope.get("headers") or []).get(b"x-request-id", b"").decode("latin-1").strip()
+        status = [500]
+        with start_trace(f"{scope['method']} {scope['path']}", request_id[:64] or None) as trace:
+            async def send_with_trace(message):
+                if message["type"] == "http.response.start":
+                    status[0] = message["status"]
+                    headers = list(message.get("headers") or [])
+                    headers.append((b"x-trace-id", trace.trace_id.encode("latin-1")))
+                    timing = trace.server_timing()
+                    if timing:
+                        headers.append((b"server-timing", timing.encode("latin-1", "replace")))
+                    message = dict(message, headers=headers)
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_trace)
+            finally:
+                # 使用路由模板而不是实际路径作为标签，避免路径参数导致标签过多
+                route = getattr(scope.get("route"), "path", None) or "unmatched"
+                duration = time.perf_counter() - trace.start
+                HTTP_REQUEST_SECONDS.observe(duration, method=scope["method"], route=route, status=str(status[0]))
+                if duration * 1000 >= TRACE_CONFIG["slow_request_ms"]:
+                    logger.warning("慢请求", extra={"route": route, "status": status[0], "trace": trace.to_dict()})
+                elif logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("请求完成", extra={"route": route, "status": status[0], "trace": trace.to_dict()})
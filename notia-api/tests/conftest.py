@@ -0,0 +1,15 @@
+import os
+import sys
+import tempfile
+
+from cryptography.fernet import Fernet
+
+# database.config 在导入时按 NOTIA_DB_PATH 创建引擎，需在导入应用模块之前指向临时目录，
+# 避免测试在当前目录下生成 notia.db 和租户库
+_workdir = tempfile.mkdtemp(prefix="notia-tests-")
+os.environ.setdefault("NOTIA_DB_PATH", os.path.join(_workdir, "notia.db"))
+os.environ.setdefault("NOTIA_TENANT_DIR", os.path.join(_workdir, "tenants"))
+os.environ.setdefault("NOTIA_MODEL_BACKEND", "stub")
+os.environ.setdefault("NOTIA_SECRET_KEY", Fernet.generate_key().decode())
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
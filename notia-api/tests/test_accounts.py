@@ -0,0 +1,61 @@
+"""邮箱账户密码加密保存与接口脱敏的回归测试"""
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from services.account_service import ACCOUNT_KEY_PREFIX, AccountStore
+
+PASSWORD = "imap-secret-密码"
+
+
+@pytest.fixture
+def client():
+    with TestClient(main.app) as client:
+        yield client
+        main.account_store.delete("alice")
+
+
+def _put(client, **overrides):
+    data = {"imap_server": "imap.example.com", "email_addr": "alice@example.com",
+            "password": PASSWORD, "enabled": False}
+    data.update(overrides)
+    return client.put("/api/accounts/alice", json=data)
+
+
+def test_password_encrypted_at_rest(client):
+    assert _put(client).status_code == 200
+    stored = main.account_store.db_utils.get_config(ACCOUNT_KEY_PREFIX + "alice")
+    assert PASSWORD not in stored
+    assert "password" not in json.loads(stored)
+    assert main.account_store.get("alice").password == PASSWORD
+
+
+def test_account_routes_redact_password(client):
+    saved = _put(client)
+    listed = client.get("/api/accounts")
+    for body in (saved.text, listed.text):
+        assert PASSWORD not in body
+    assert "password" not in saved.json()
+    assert saved.json()["password_set"] is True
+    assert all("password" not in account for account in listed.json())
+
+
+def test_blank_password_keeps_existing(client):
+    _put(client)
+    assert _put(client, password="", mailbox="Archive").status_code == 200
+    account = main.account_store.get("alice")
+    assert (account.password, account.mailbox) == (PASSWORD, "Archive")
+
+
+def test_plaintext_password_migrated_on_read(client):
+    store = AccountStore()
+    store.db_utils.set_config(ACCOUNT_KEY_PREFIX + "alice", json.dumps({
+        "imap_server": "imap.example.com", "email_addr": "alice@example.com", "password": PASSWORD,
+    }))
+    try:
+        assert store.get("alice").password == PASSWORD
+        assert PASSWORD not in store.db_utils.get_config(ACCOUNT_KEY_PREFIX + "alice")
+    finally:
+        store.delete("alice")
@@ -0,0 +1,50 @@
+"""全文搜索的回归测试"""
+import os
+
+import pytest
+
+from database.config import get_engine
+from database.db_utils import DatabaseUtils
+from database.fts import build_bigram_query, build_match_query, cjk_bigrams
+from database.models import create_tables
+
+INSERT_EMAIL = "INSERT INTO emails (email_id, title, sender, content, category) VALUES (?, ?, ?, ?, '任务类')"
+
+
+@pytest.fixture
+def db_utils(tmp_path):
+    db_path = os.path.join(tmp_path, "notia.db")
+    engine = get_engine(db_path)
+    create_tables(engine)
+    yield DatabaseUtils(db_path)
+    engine.dispose()
+
+
+def test_cjk_bigrams():
+    assert cjk_bigrams("项目会议") == " 项目 目会 会议 "
+    assert cjk_bigrams("Q3 项目") == "Q3  项目 "
+    assert cjk_bigrams("会") == " 会 "
+
+
+def test_short_terms_use_bigram_index():
+    assert build_match_query("会议") is None
+    assert build_bigram_query("会议") == '"会议"'
+    assert build_bigram_query("项目 周报总结") == '"项目" "周报 报总 总结"'
+    # 单字和短的非中文词仍用LIKE
+    assert build_bigram_query("会") is None
+    assert build_bigram_query("AI") is None
+
+
+def test_two_character_search(db_utils):
+    db_utils.execute_insert(INSERT_EMAIL, ("e1", "项目会议", "a@example.com", "请准时参加"))
+    db_utils.execute_insert(INSERT_EMAIL, ("e2", "周报", "b@example.com", "明天的会议改到三楼"))
+    db_utils.execute_insert(INSERT_EMAIL, ("e3", "产品更新", "c@example.com", "本期内容"))
+
+    assert sorted(row["email_id"] for row in db_utils.search_emails("会议")) == ["e1", "e2"]
+    assert [row["email_id"] for row in db_utils.search_emails("会议 三楼")] == ["e2"]
+
+    # 修改和删除后二元组索引与原表保持一致
+    db_utils.execute_update("UPDATE emails SET title = '项目评审' WHERE email_id = 'e1'")
+    db_utils.execute_update("DELETE FROM emails WHERE email_id = 'e2'")
+    assert db_utils.search_emails("会议") == []
+    assert [row["email_id"] for row in db_utils.search_emails("评审")] == ["e1"]
@@ -0,0 +1,43 @@
+"""键集分页的回归测试"""
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from database.config import get_engine
+from database.models import Task, create_tables
+from database.pagination import decode_cursor, encode_cursor, keyset_page
+
+
+@pytest.fixture
+def session(tmp_path):
+    engine = get_engine(os.path.join(tmp_path, "notia.db"))
+    create_tables(engine)
+    db = sessionmaker(bind=engine)()
+    base = datetime(2025, 1, 1)
+    # 部分任务没有received_time
+    db.add_all(Task(email_id=f"e{i}", title=f"任务 {i}",
+                    received_time=None if i % 3 == 0 else base + timedelta(hours=i))
+               for i in range(1, 11))
+    db.commit()
+    yield db
+    db.close()
+    engine.dispose()
+
+
+def test_cursor_round_trip_without_received_time():
+    assert decode_cursor(encode_cursor(None, 7)) == (None, 7)
+
+
+def test_pages_include_rows_without_received_time(session):
+    seen, cursor = [], None
+    while True:
+        items, cursor = keyset_page(session.query(Task.id, Task.received_time), Task, 3, cursor)
+        seen.extend(item["id"] for item in items)
+        if cursor is None:
+            break
+
+    expected = [row.id for row in session.query(Task.id).order_by(Task.received_time.desc(), Task.id.desc())]
+    assert seen == expected
+    assert len(seen) == 10
@@ -0,0 +1,20 @@
+"""热点查询执行计划的回归测试，检查逻辑见 database/check_query_plans.py"""
+import os
+
+import pytest
+
+from database.check_query_plans import check, missing_queries
+
+
+@pytest.fixture(scope="module")
+def results(tmp_path_factory):
+    return check(os.path.join(tmp_path_factory.mktemp("plans"), "notia.db"))
+
+
+def test_hot_queries_executed(results):
+    assert missing_queries(results) == []
+
+
+def test_query_plans(results):
+    problems = [f"{name}: {problem} ({' / '.join(plan)})" for name, _, plan, problem in results if problem]
+    assert problems == []